@@ -1,16 +1,14 @@
 import streamlit as st
 import time
-import re 
 import uuid  
-from openai import OpenAI
 import config
-from src import data_loader, embedding, rag_engine
-import datetime
+from src import data_loader, rag_engine
+from src import knowledge_base
+from src.knowledge_base import KnowledgeBase
 from langsmith.wrappers import wrap_openai
-from langsmith import traceable
 from apscheduler.schedulers.background import BackgroundScheduler
 import requests
-from src import db_actions 
+from src import db_actions, snapshot, llm_router, pipeline, coalesce, answer_cache, warmup, version_watcher, profiling, memory_report
 
 
 # SETUP PAGE & SESSION 
@@ -113,35 +111,49 @@ st.markdown("""
 
 
 
-def get_db_metadata_time():
-    try:
-        db_time = data_loader.get_sync_metadata() 
-        return db_time
-    except Exception as e:
-        print(f"Metadata Fetch Error: {e}")
-        return datetime.datetime.now().strftime("%Y-%m-%d")
+# _force_refresh ขึ้นต้นด้วย _ -> ไม่อยู่ใน Cache Key (Sync โหลดใหม่แล้ว Rerun ใช้ผลเดียวกันได้ทันที)
+@st.cache_resource(show_spinner=False, max_entries=2) 
+def setup_system(day_key, _force_refresh=False): 
+    # Router ระหว่าง UNI/CLOUD (หรือ Client เดียวตาม ACTIVE_MODE ถ้าตั้งค่าไว้แค่ตัวเดียว)
+    client = llm_router.build_client(wrap_openai)
+    # ใช้ Snapshot ถ้า Version ตรง ไม่เช่นนั้นโหลดจาก DB + Embed
+    all_data, all_vecs = snapshot.load_or_build(day_key, force_refresh=_force_refresh)
+    if not all_data:
+        # ไม่ Cache ผลว่าง (เช่น DB ล่มระหว่าง Sync) -> Rerun ยังใช้ Knowledge Base เดิม
+        raise RuntimeError(f"Knowledge base {day_key} is empty")
+    kb = KnowledgeBase(all_data, all_vecs, version=day_key)
+    return client, kb
+
 
-@st.cache_resource(show_spinner=False) 
-def setup_system(day_key, force_refresh=False): 
-    client = wrap_openai(OpenAI(api_key=config.CURRENT_KEY, base_url=config.CURRENT_URL))
-    all_data = data_loader.load_knowledge(day_key) 
-    all_vecs = embedding.build_vector_store(all_data, config.CACHE_JSON, force_refresh=force_refresh)
-    return client, all_data, all_vecs
+# คำถามแนะนำ (ใช้ทั้งปุ่มบนหน้าแชท และ Warm-up หลัง Sync)
+suggestions = [
+    {"label": "ขอคู่มือการขอเบิกเงิน", "query": "ขอคู่มือการขอเบิกเงินทดรองจ่าย"},
+    {"label": "ขอคู่มือการอัปโหลดใบเสร็จ", "query": "คู่มือการอัปโหลดใบเสร็จในระบบ RPA ตั้งแต่ขั้นตอนแรกจนถึงขั้นตอนสุดท้าย"},
+    {"label": "เข้าสู่ระบบไม่ได้", "query": "เข้าสู่ระบบไม่ได้"},
+    {"label": "รหัสใบเสร็จRPA คืออะไร", "query": "รหัสใบเสร็จRPA คืออะไร"}
+]
 
 
 def daily_sync_job():
     print("--- [APScheduler] Starting Daily Sync ---")
     try:
         success = db_actions.confirm_sync_metadata()
-        if success:
-            # เคลียร์ cache เฉพาะระบบ RAG 
-            setup_system.clear() 
-            print("[INFO] setup_system Cache cleared.")
-            
-            # โหลด Data ใหม่
-            new_ver = str(get_db_metadata_time())
-            print(f"Metadata updated. Background Loading: {new_ver}")
-            _ = setup_system(new_ver, force_refresh=True) 
+        # เช็ค Version ล่าสุดทุกรอบ (Replica อื่นอาจเป็นคน Confirm ไปแล้ว) DB ไม่ตอบ -> ใช้ของเดิมต่อ
+        new_ver = version_watcher.WATCHER.poll()
+        if new_ver and new_ver != version_watcher.WATCHER.current():
+            # โหลด Data ใหม่ก่อน แล้วค่อยสลับ Version ให้ Rerun ใช้ (ระหว่างโหลดผู้ใช้ยังใช้ของเดิมได้)
+            print(f"Metadata updated (confirmed={success}). Background Loading: {new_ver}")
+            old_kb = next((k for k in knowledge_base.LIVE if k.version == version_watcher.WATCHER.current()), None)
+            if old_kb is not None:
+                memory_report.check_ceiling(old_kb)
+            with profiling.profile("sync", str(new_ver).replace(" ", "_").replace(":", "")):
+                new_client, new_kb = setup_system(new_ver, _force_refresh=True) 
+                version_watcher.WATCHER.set(new_ver)
+                memory_report.log_report(new_kb)
+
+                # เตรียมคำตอบของคำถามยอดนิยมไว้ล่วงหน้า (Rewrite / Embedding / คำตอบ)
+                if config.WARMUP_ENABLED:
+                    warmup.run_warmup(new_kb, new_client, warmup.collect_questions([s["query"] for s in suggestions]))
             
             # ยิงเข้าเว็บตัวเองภายใน Docker เพื่อปลุก UI
             # target_url = "http://localhost:8501/"
@@ -242,82 +254,28 @@ if "accepted_terms" not in st.session_state:
 # เช็คว่ามี session_id  ถ้ายังไม่มีค่อยสร้าง
 if "session_id" not in st.session_state:
     st.session_state.session_id = uuid.uuid4().hex[:4]
-
-RETRIEVE_TOPK = 20
-RERANK_TOPK = 8
-TYPE_THRESH = {
-    "fact": 0.38,           # ความจริง/ตัวเลข 
-    "definition": 0.36,     # นิยามศัพท์
-    "troubleshoot": 0.34,   # การแก้ปัญหา 
-    "info": 0.35,           # ข้อมูลทั่วไป
-    "guide": 0.35,          # ขั้นตอน/คู่มือ 
-    "warning": 0.36,        # คำเตือน
-    "contact": 0.37         # ข้อมูลติดต่อ
-}
-
-def get_threshold(item_type: str) -> float:
-    return TYPE_THRESH.get((item_type or "info").strip().lower(), 0.35)
+# Debug Flag: เปิด ?profile=1 ใน URL เพื่อ Profile ทุก Turn ของ Session นี้
+if st.query_params.get("profile") in ("1", "true"):
+    st.session_state.profile = True
 
 def set_ask(txt):
     st.session_state.prompt_trigger = txt.replace("\n", " ")
 
 
 try:
-    current_db_ver = str(get_db_metadata_time()) 
-    client, all_data, all_vecs = setup_system(current_db_ver, force_refresh=False)
+    # Version จาก Memory (Sync Job เป็นคนอัปเดต) Rerun จึงไม่ต้องถาม DB
+    current_db_ver = version_watcher.WATCHER.current()
+    client, kb = setup_system(current_db_ver)
+    all_data, all_vecs, fund_index = kb.data, kb.vectors, kb.fund_index
 except Exception as e:
     st.error(f"System Load Error: {e}")
     st.stop()
 
+# Debug: ?debug=memory แสดงรายงานการใช้ RAM ของ Knowledge Base
+if st.query_params.get("debug") == "memory":
+    with st.expander("Memory report", expanded=True):
+        st.json(memory_report.kb_report(kb))
 
-@traceable(run_type="chain", name="Decision Logic")
-def decide_log_sources(collected_data):
-    final_sources = []
-    
-    debug_info = {
-        "s1": 0, "s2": 0, "s3": 0,
-        "gap_12": 0, "gap_23": 0,
-        "decision": "No Data"
-    }
-
-    if collected_data:
-        if len(collected_data) == 1:
-            final_sources.append(collected_data[0][0])
-            debug_info["s1"] = collected_data[0][1]
-            debug_info["decision"] = "Single Item Found"
-            
-        else:
-            s1 = collected_data[0][1] 
-            s2 = collected_data[1][1] 
-            gap_12 = s1 - s2
-            debug_info["s1"] = s1
-            debug_info["s2"] = s2
-            debug_info["gap_12"] = gap_12
-
-            if s1 >= 87.0 or gap_12 >= 8.0:
-                final_sources.append(collected_data[0][0]) 
-                debug_info["decision"] = "Dominant Win (Keep 1)"
-            else:
-    
-                if len(collected_data) >= 3:
-                    s3 = collected_data[2][1]
-                    gap_23 = s2 - s3
-                    
-                    debug_info["s3"] = s3
-                    debug_info["gap_23"] = gap_23
-                    if gap_23 >= 5.0: 
-                        final_sources = [d[0] for d in collected_data[:2]]
-                        debug_info["decision"] = "Top 2 Separate (Keep 2)"
-                    else:
-                        final_sources = [d[0] for d in collected_data[:3]]
-                        debug_info["decision"] = "Ambiguous (Keep 3)"
-                
-                else:
-                    final_sources = [d[0] for d in collected_data[:2]]
-                    debug_info["decision"] = "Only 2 Items (Keep 2)"
-    
-    log_string = ", ".join(final_sources) if final_sources else None
-    return log_string, debug_info
 
 # HEADER & RESET BUTTON
 
@@ -450,7 +408,15 @@ st.markdown("""
 if "messages" not in st.session_state: st.session_state.messages = []
 if "prompt_trigger" not in st.session_state: st.session_state.prompt_trigger = None
 
-for msg in st.session_state.messages:
+messages = st.session_state.messages
+# แสดงเฉพาะข้อความล่าสุด ข้อความเก่าซ่อนไว้ (เวลาต่อ Rerun คงที่ไม่ว่าคุยยาวแค่ไหน)
+hidden = max(0, len(messages) - config.HISTORY_RENDER_WINDOW)
+if hidden and st.toggle(f"แสดงข้อความก่อนหน้า ({hidden} ข้อความ)", key="show_older"):
+    for msg in messages[:hidden]:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+for msg in messages[hidden:]:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
         
@@ -461,23 +427,16 @@ for msg in st.session_state.messages:
                 feedback_key = f"fb_{log_id}"
                 # แสดงปุ่ม (thumbs)
                 score = st.feedback("thumbs", key=feedback_key)
-                if score is not None:
-                    # บันทึกลง Database
+                # บันทึกลง Database เฉพาะตอนคะแนนเปลี่ยน (Rerun อื่นไม่ยิง DB ซ้ำ)
+                if score is not None and score != msg.get("feedback"):
                     data_loader.update_feedback(log_id, score)
-                    feed_text = "Good" if score == 1 else "Bad"
+                    msg["feedback"] = score
 
 
 
 # SUGGESTIONS & MENU
 
 
-suggestions = [
-    {"label": "ขอคู่มือการขอเบิกเงิน", "query": "ขอคู่มือการขอเบิกเงินทดรองจ่าย"},
-    {"label": "ขอคู่มือการอัปโหลดใบเสร็จ", "query": "คู่มือการอัปโหลดใบเสร็จในระบบ RPA ตั้งแต่ขั้นตอนแรกจนถึงขั้นตอนสุดท้าย"},
-    {"label": "เข้าสู่ระบบไม่ได้", "query": "เข้าสู่ระบบไม่ได้"},
-    {"label": "รหัสใบเสร็จRPA คืออะไร", "query": "รหัสใบเสร็จRPA คืออะไร"}
-]
-
 if len(st.session_state.messages) == 0:
     st.markdown("<br><br>", unsafe_allow_html=True)
     st.markdown("<h4 style='text-align: center; color: #334155;'>คำถามแนะนำ</h4>", unsafe_allow_html=True)
@@ -509,103 +468,115 @@ else:
     user_input = chat_val
 
 if user_input:
-    time.sleep(0.1)
+    request_id = f"{st.session_state.session_id}-{uuid.uuid4().hex[:6]}"
+    # Profile ทั้ง Turn (ปิดและเขียนไฟล์เสมอ แม้ Turn จะ Error หรือถูก Streamlit หยุดกลางทาง)
+    with profiling.profile("turn", request_id, st.session_state.get("profile", False)):
+        time.sleep(0.1)
     
-    with st.chat_message("user"):
-        st.markdown(user_input)
-    st.session_state.messages.append({"role": "user", "content": user_input})
-
-    rag_history = list(st.session_state.messages)[-3:]
-
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        full_response = ""
-        log_source = None
+        with st.chat_message("user"):
+            st.markdown(user_input)
+        st.session_state.messages.append({"role": "user", "content": user_input})
+
+        rag_history = st.session_state.messages[-3:]
+
+        with st.chat_message("assistant"):
+            message_placeholder = st.empty()
+            full_response = ""
+            log_source = None
+
+            intent = rag_engine.analyze_intent(user_input, fund_index, kb.domain_centroids, kb.glossary)
+            fund_answer = fund_index.answer(user_input) if intent == "FUND" else None
+            define_answer = kb.glossary.answer(user_input) if intent == "DEFINE" else None
+            # คำถามเดียวกันที่กำลังประมวลผลอยู่ (Version + บริบทเดียวกัน) จะรอรับ Token จาก Pipeline เดียวกัน
+            flight_key = coalesce.make_key(user_input, kb.version, rag_engine.history_context(user_input, rag_history))
+            cached = answer_cache.CACHE.get(flight_key) if intent != "BLOCK" and not (fund_answer or define_answer) else None
+
+            if intent == "BLOCK":
+                full_response = "ขออภัยค่ะ น้องทุนตอบเฉพาะเรื่องงานวิจัยและระบบเบิกจ่ายค่ะ"
+                message_placeholder.markdown(full_response)
 
-        intent = rag_engine.analyze_intent(user_input)
-        
-        if intent == "BLOCK":
-            full_response = "ขออภัยค่ะ น้องทุนตอบเฉพาะเรื่องงานวิจัยและระบบเบิกจ่ายค่ะ"
-            message_placeholder.markdown(full_response)
-        
-        else:
-            with st.status("น้องทุนกำลังคิด...", expanded=True) as status:
-                st.write("เรียบเรียงคำถาม...")
-                query = rag_engine.rewrite_query(user_input, rag_history, client, config.CURRENT_MODEL)
-                st.write("ค้นหาข้อมูล...")
-                cands = rag_engine.retrieval_stage(query, all_data, all_vecs, top_k=RETRIEVE_TOPK)
-                st.write("คัดกรองเนื้อหา...")
-                results = rag_engine.reranking_stage(query, cands, top_k=RERANK_TOPK, intent=intent)
-
-                context_lines = []
-                pass_count = 0                
-                collected_data = [] # เก็บเป็น tuple
-                
-                for item, score in results:
-                    itype = (item.get("type") or "info").lower()
-                    th = get_threshold(itype)
-                    
-                    if (score / 100.0) >= th:
-                        pass_count += 1
-                        context_lines.append(f"<{itype}>{item.get('content','')}</{itype}>")
-                        
-                        # ดึงชื่อ Source
-                        src_name = item.get("metadata", {}).get("source")
-                        if src_name:
-                            # เช็คถ้าไม่ซ้ำค่อยเพิ่ม
-                            is_dup = any(d[0] == src_name for d in collected_data)
-                            if not is_dup:
-                                collected_data.append((src_name, score))
-                
+            elif fund_answer:
+                full_response = fund_answer
+                log_source = ", ".join(sorted({r["name"] for r in fund_index.find_in_query(user_input)})) or None
+                message_placeholder.markdown(full_response)
 
-                log_source, debug_info = decide_log_sources(collected_data)
-                
-                context_str = "\n".join(context_lines).strip()
-                has_context = (pass_count >= 1) and (len(context_str) > 0)
-                status.update(label="ประมวลผลเสร็จสิ้น", state="complete", expanded=False)
+            elif define_answer:
+                full_response = define_answer
+                log_source = kb.glossary.sources(user_input)
+                message_placeholder.markdown(full_response)
 
-            if not has_context:
-                full_response = "ไม่พบข้อมูลในระบบที่เกี่ยวข้องค่ะ รบกวนระบุรายละเอียดเพิ่ม เช่น ชื่อเมนู หรือขั้นตอนที่ทำค้างอยู่ค่ะ"
+            elif cached:
+                # คำตอบที่ Warm-up เตรียมไว้หลัง Sync
+                full_response = cached["response"]
+                log_source = cached["log_source"]
                 message_placeholder.markdown(full_response)
+
             else:
-                msgs = [
-                    {
-                        "role": "system",
-                        "content": f"{config.STATIC_SYS_PROMPT}\n\nContext from Database:\n{context_str}"
-                    }
-                ] + [{"role": "user", "content": query}]
-
-                try:
-                    stream = client.chat.completions.create(
-                        model=config.CURRENT_MODEL,
-                        messages=msgs, stream=True, temperature=0.3, max_tokens=4096,
-                        extra_body={"repetition_penalty": 1.12, "top_p": 0.9}
-                    )
-                    for chunk in stream:
-                        c = chunk.choices[0].delta.content
-                        if c: 
-                            if re.search(r'[\u4e00-\u9fff]', c):
-                                continue 
-                            full_response += c
+                sid = st.session_state.session_id
+                events = coalesce.FLIGHTS.subscribe(
+                    flight_key,
+                    lambda emit: pipeline.run_turn(user_input, rag_history, kb, client, sid, emit, intent=intent)
+                )
+                stage_labels = {"rewrite": "เรียบเรียงคำถาม...", "retrieve": "ค้นหาข้อมูล...", "rerank": "คัดกรองเนื้อหา..."}
+                final = None
+
+                with st.status("น้องทุนกำลังคิด...", expanded=True) as status:
+                    queue_note = st.empty()
+                    for kind, payload in events:
+                        if kind == "stage" and payload in stage_labels:
+                            queue_note.empty()
+                            st.write(stage_labels[payload])
+                        elif kind == "queue":
+                            queue_note.write(f"มีผู้ใช้งานจำนวนมาก กำลังรอคิวลำดับที่ {payload['pos']}...")
+                        elif kind == "context":
+                            log_source = payload["log_source"]
+                            break
+                        elif kind in ("final", "error"):
+                            final = payload if kind == "final" else {"response": pipeline.GEN_ERROR_MSG, "log_source": None, "error": str(payload)}
+                            break
+                    queue_note.empty()
+                    status.update(label="ประมวลผลเสร็จสิ้น", state="complete", expanded=False)
+
+                # Stream คำตอบ (Generator เดิม อ่านต่อจาก Event "context")
+                if final is None:
+                    for kind, payload in events:
+                        if kind == "token":
+                            full_response += payload
                             message_placeholder.markdown(full_response + "▌")
-                    message_placeholder.markdown(full_response)
-                except Exception as e:
-                    st.error(f"Gen Error: {e}")
-                    full_response = "เกิดข้อผิดพลาดในการสร้างคำตอบค่ะ"
-
-    # บันทึก Log โดยใช้ session_id เดิมที่คงที่
-    saved_log_id = data_loader.save_chat_log(
-        session_id=st.session_state.session_id,  
-        user_input=user_input,
-        ai_response=full_response,
-        source=log_source
-    )
-
-    # เก็บ log_id ลง session
-    st.session_state.messages.append({
-        "role": "assistant", 
-        "content": full_response,
-        "log_id": saved_log_id  
-    })
+                        elif kind == "queue":
+                            message_placeholder.markdown(f"_กำลังรอคิวสร้างคำตอบ ลำดับที่ {payload['pos']}..._")
+                        elif kind == "final":
+                            final = payload
+                        elif kind == "error":
+                            final = {"response": pipeline.GEN_ERROR_MSG, "log_source": log_source, "error": str(payload)}
+
+                if final is None:
+                    final = {"response": pipeline.GEN_ERROR_MSG, "log_source": log_source, "error": "pipeline ended without answer"}
+                if final.get("error"):
+                    st.error(f"Gen Error: {final['error']}")
+                full_response = final["response"]
+                log_source = final["log_source"]
+                message_placeholder.markdown(full_response)
+
+        # บันทึก Log โดยใช้ session_id เดิมที่คงที่
+        saved_log_id = data_loader.save_chat_log(
+            session_id=st.session_state.session_id,  
+            user_input=user_input,
+            ai_response=full_response,
+            source=log_source
+        )
+
+        # เก็บ log_id ลง session
+        st.session_state.messages.append({
+            "role": "assistant", 
+            "content": full_response,
+            "log_id": saved_log_id  
+        })
+        # จำกัดจำนวนข้อความใน Session State (ข้อความที่เก่ากว่านี้ถูกตัดทิ้ง Log ยังอยู่ใน DB)
+        del st.session_state.messages[:-config.SESSION_MAX_MESSAGES]
+        # ข้อความที่พ้นหน้าต่างแสดงผลไม่มีปุ่ม Feedback แล้ว: เก็บแค่ role + content
+        for msg in st.session_state.messages[:-config.HISTORY_RENDER_WINDOW]:
+            msg.pop("log_id", None)
+            msg.pop("feedback", None)
     
     st.rerun()
\ No newline at end of file
@@ -35,6 +35,41 @@ else:
     CURRENT_MODEL = CLOUD_MODEL
     print(f"Using Mode: CLOUD ({CLOUD_MODEL})")
 
+#  LLM Router (ใช้ทั้ง UNI และ CLOUD เมื่อมีการตั้งค่าครบทั้งสอง)
+LLM_ROUTER = os.getenv("LLM_ROUTER", "true").lower() in ("1", "true", "yes")
+UNI_MAX_CONCURRENCY = int(os.getenv("UNI_MAX_CONCURRENCY", "4"))      # GPU มหาวิทยาลัยรับได้จำกัด
+CLOUD_MAX_CONCURRENCY = int(os.getenv("CLOUD_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "45"))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "4.0"))   # วินาทีที่รอ Token แรกก่อนยิง Backend สำรอง
+LLM_ERROR_STREAK = 3       # Error ติดกันกี่ครั้งถึงพัก Backend
+LLM_COOLDOWN_SEC = 30
+
+#  Admission Control (จำกัดจำนวน Chat Turn ที่ทำงานพร้อมกันต่อ Stage)
+ADMIT_REWRITE = int(os.getenv("ADMIT_REWRITE", "6"))
+ADMIT_RETRIEVE = int(os.getenv("ADMIT_RETRIEVE", "8"))
+ADMIT_GENERATE = int(os.getenv("ADMIT_GENERATE", "6"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "40"))
+ADMISSION_WAIT_TIMEOUT = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "90"))
+ADMISSION_LOCK_DIR = os.getenv("ADMISSION_LOCK_DIR")   # ตั้งค่าเพื่อจำกัดข้าม Process (เช่น /tmp/rpa_admission)
+
+#  Request Coalescing (คำถามเดียวกันที่กำลังประมวลผลอยู่ ใช้ Pipeline เดียวกัน)
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+#  Chat UI (จำกัดงานต่อ Rerun ของ Streamlit)
+HISTORY_RENDER_WINDOW = int(os.getenv("HISTORY_RENDER_WINDOW", "10"))   # จำนวนข้อความล่าสุดที่แสดงพร้อมปุ่ม Feedback
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "60"))     # จำนวนข้อความสูงสุดที่เก็บใน Session
+
+#  Memory
+# เพดาน RAM ของ Container (MB) เตือนเมื่อ Rebuild ตอน Sync อาจเกิน (0 = ไม่ตรวจ)
+MEMORY_CEILING_MB = float(os.getenv("MEMORY_CEILING_MB", "0"))
+
+#  Profiling (เขียน Folded Stack สำหรับ Flamegraph ดู src/profiling.py)
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))     # สัดส่วน Turn ที่สุ่ม Profile (0-1)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
 #  Supabase 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -42,20 +77,124 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 #  Cache 
 CACHE_JSON = "vector_cache_psu.npy" 
 CACHE_MD = "vector_cache_md_psu.npy"
+# Snapshot รวม Chunk + Vector (สร้างด้วย python -m src.snapshot build)
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "knowledge_snapshot.npz")
 
 UNI_EMBED_URL = os.getenv("UNI_EMBED_URL")
-UNI_EMBED_MODEL = os.getenv("UNI_EMBED_MODEL","bge-m3") 
+UNI_EMBED_MODEL = os.getenv("UNI_EMBED_MODEL","bge-m3")
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))   # จำนวน Query Embedding ที่เก็บใน Memory
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "1024"))   # จำนวนผล Rewrite ที่เก็บใน Memory
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))      # คำตอบที่ Warm-up เตรียมไว้ (ต่อ Version)
+
+#  Warm-up หลัง Sync (เตรียมคำตอบของคำถามยอดนิยมไว้ล่วงหน้า)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_MAX_QUESTIONS = int(os.getenv("WARMUP_MAX_QUESTIONS", "30"))   # จำนวนคำถามที่ Rewrite + Retrieve ล่วงหน้า
+WARMUP_MAX_ANSWERS = int(os.getenv("WARMUP_MAX_ANSWERS", "12"))       # จำนวนคำตอบที่ให้ LLM สร้างล่วงหน้า
+WARMUP_TIME_BUDGET = float(os.getenv("WARMUP_TIME_BUDGET", "300"))    # วินาทีสูงสุดของ Warm-up ต่อรอบ
+WARMUP_MIN_RATING = float(os.getenv("WARMUP_MIN_RATING", "0.5"))      # คะแนน Feedback เฉลี่ยขั้นต่ำ (0-1)
+
+#  Outbound Rate Control (Embedding Server / Chat Endpoint)
+RATE_INITIAL_CONCURRENCY = float(os.getenv("RATE_INITIAL_CONCURRENCY", "4"))
+RATE_MIN_CONCURRENCY = 1
+RATE_MAX_CONCURRENCY = float(os.getenv("RATE_MAX_CONCURRENCY", "32"))
+RATE_BULK_SHARE = 0.5            # สัดส่วนของ Limit ที่งาน bulk (Rebuild) ใช้ได้
+RATE_DECREASE_INTERVAL = 1.0     # วินาที ระหว่างการลด Concurrency แต่ละครั้ง
+RATE_MAX_RETRY_AFTER = 30.0
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_SEC = float(os.getenv("CIRCUIT_RESET_SEC", "15"))
+
+#  Intent Gate
+# ตรวจว่าคำถามอยู่ในขอบเขตของฐานความรู้ (เทียบกับ Domain Centroid) ก่อนเรียก LLM
+DOMAIN_CHECK = os.getenv("DOMAIN_CHECK", "true").lower() in ("1", "true", "yes")
+# ค่าเริ่มต้นคร่าวๆ: ตั้งจาก python -m src.domain_gate calibrate (คะแนนของคำถามจริงใน chat_logs)
+DOMAIN_MIN_SIM = float(os.getenv("DOMAIN_MIN_SIM", "0.30"))
+DOMAIN_CENTROIDS = int(os.getenv("DOMAIN_CENTROIDS", "24"))
+
+#  Context
+# งบ Token สูงสุดของ Context ที่แนบไปกับ Prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1800"))
+
+#  Generation Budget (max_tokens ต่อขั้นตอน)
+REWRITE_MAX_TOKENS = int(os.getenv("REWRITE_MAX_TOKENS", "96"))     # ต่อ 1 Sub-query (1 บรรทัด)
+GEN_MIN_TOKENS = int(os.getenv("GEN_MIN_TOKENS", "384"))
+GEN_MAX_TOKENS = int(os.getenv("GEN_MAX_TOKENS", "2048"))           # คำถามขอทั้งกระบวนการ
+GEN_CONTEXT_RATIO = float(os.getenv("GEN_CONTEXT_RATIO", "0.6"))    # งบเพิ่มต่อ Token ของ Context
+# หยุด Stream ก่อนกำหนด
+GEN_REPEAT_WINDOW = 40      # ตัวอักษรท้ายคำตอบที่ใช้ตรวจการวนซ้ำ
+GEN_REPEAT_COUNT = 3        # ปรากฏซ้ำครบจำนวนนี้ถือว่าวนซ้ำ
+GEN_CJK_STOP_CHUNKS = 8     # Chunk ภาษาจีนติดกันเกินนี้ หยุดสร้าง
+
+#  Retrieval (ใช้ร่วมกันทั้ง app.py และ main.py)
+RETRIEVE_TOPK = int(os.getenv("RETRIEVE_TOPK", "20"))
+RERANK_TOPK = int(os.getenv("RERANK_TOPK", "8"))
+# คะแนนเพิ่มของ Chunk ที่ตรง Metadata Filter ที่แค่เดาจากคำถาม (Filter ที่ชัดเจนค้นเฉพาะแถวที่ตรงแทน)
+FILTER_BOOST = float(os.getenv("FILTER_BOOST", "0.05"))
+
+# Adaptive Pool: ถ้าคะแนนอันดับต้นๆ ชนะขาด จะดึง Candidate น้อยลง
+RETRIEVE_ADAPTIVE = os.getenv("RETRIEVE_ADAPTIVE", "true").lower() in ("1", "true", "yes")
+ADAPTIVE_MIN_POOL = 16      # Pool ขั้นต่ำเมื่อคำถามชัดเจน
+ADAPTIVE_MAX_POOL = 70      # Pool สูงสุดเมื่อคำถามกำกวม
+ADAPTIVE_GAP = 0.06         # ระยะห่าง s1-s2 ที่ถือว่าอันดับ 1 ชนะขาด
+ADAPTIVE_BAND = 0.08        # ช่วงคะแนนจาก s1 ที่ยังนับว่าเป็นคู่แข่ง
+
+# Multi-query: คำถามกว้าง (ขอคู่มือ/ทุกขั้นตอน) แตกเป็นหลาย Sub-query แล้วรวมผลด้วย RRF
+MULTI_QUERY = os.getenv("MULTI_QUERY", "true").lower() in ("1", "true", "yes")
+MULTI_QUERY_MAX = int(os.getenv("MULTI_QUERY_MAX", "3"))
+PROCEDURE_MAX_STEPS = int(os.getenv("PROCEDURE_MAX_STEPS", "40"))   # ดึงทุกขั้นตอนของคู่มือเมื่อไม่เกินจำนวนนี้
+
+# รวม Chunk ที่ซ้ำ/เกือบซ้ำตอนโหลด (ก่อนสร้าง Snapshot)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_SIM = float(os.getenv("DEDUP_SIM", "0.97"))     # Cosine ขั้นต่ำที่ถือว่าเกือบซ้ำ
+
+# ลดมิติ Vector (none | pca | prefix): สแกนใน Vector ที่ลดมิติแล้ว Re-score Shortlist ด้วย Vector เต็ม
+# วัด Recall ก่อนเปิดใช้: python -m src.reduction recall
+REDUCE_METHOD = os.getenv("REDUCE_METHOD", "none").lower()
+REDUCE_DIM = int(os.getenv("REDUCE_DIM", "256"))
+REDUCE_SHORTLIST = int(os.getenv("REDUCE_SHORTLIST", "200"))   # ต้องไม่น้อยกว่า ADAPTIVE_MAX_POOL
+REDUCE_PATH = os.getenv("REDUCE_PATH", "vector_projection.npz")   # Projection (PCA) ที่ Fit จาก Corpus
+
+# Micro-batch การคำนวณ Similarity ข้าม Session (0 = คำนวณทันทีทีละคำขอ)
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "3"))
+RETRIEVAL_MAX_BATCH = int(os.getenv("RETRIEVAL_MAX_BATCH", "32"))
+BLAS_THREADS = int(os.getenv("BLAS_THREADS", "2"))     # 0 = ไม่ปรับ (ใช้ค่า Default ของ BLAS)
+
+TYPE_THRESH = {
+    "fact": 0.38,           # ความจริง/ตัวเลข 
+    "definition": 0.36,     # นิยามศัพท์
+    "troubleshoot": 0.34,   # การแก้ปัญหา 
+    "info": 0.35,           # ข้อมูลทั่วไป
+    "guide": 0.35,          # ขั้นตอน/คู่มือ 
+    "warning": 0.36,        # คำเตือน
+    "contact": 0.37         # ข้อมูลติดต่อ
+}
+
+def get_threshold(item_type: str) -> float:
+    return TYPE_THRESH.get((item_type or "info").strip().lower(), 0.35)
 
 import datetime
+import functools
 
-now = datetime.datetime.now()
 thai_months = [
     "มกราคม", "กุมภาพันธ์", "มีนาคม", "เมษายน", "พฤษภาคม", "มิถุนายน",
     "กรกฎาคม", "สิงหาคม", "กันยายน", "ตุลาคม", "พฤศจิกายน", "ธันวาคม"
 ]
-current_date_str = f"{now.day} {thai_months[now.month-1]} {now.year + 543}"
 
-STATIC_SYS_PROMPT = f"""
+@functools.lru_cache(maxsize=4)
+def format_thai_date(day: datetime.date) -> str:
+    return f"{day.day} {thai_months[day.month-1]} {day.year + 543}"
+
+def build_temporal_block() -> str:
+    today = datetime.date.today()
+    return (
+        "<temporal_context>\n"
+        f"CURRENT DATE: {format_thai_date(today)} (Buddhist Era) / {today.year} (AD)\n"
+        "</temporal_context>"
+    )
+
+# System Prompt ต้องเป็นข้อความคงที่ (byte-identical ทุก Request)
+# เพื่อให้ Backend (vLLM/Ollama) ใช้ KV-cache ของ Prefix ซ้ำได้
+# วันที่และ Context ให้ส่งใน Message ถัดไปผ่าน src/prompt_builder.py
+STATIC_SYS_PROMPT = """
 <system_instruction>
 
 <role>
@@ -63,7 +202,7 @@ You are "Nong Thun", an expert AI assistant for the Research Fund RPA System of
 </role>
 
 <temporal_awareness>
-**CURRENT DATE:** {current_date_str} (Buddhist Era) / {now.year} (AD)
+**CURRENT DATE:** Given in the <temporal_context> block of the user message.
 - Use this date to evaluate time-sensitive questions (e.g., "Is the fund still open?", "Deadline").
 - If a fund's end_date is BEFORE today, it is considered **CLOSED/EXPIRED**.
 </temporal_awareness>
@@ -1,46 +1,27 @@
 import re
 import httpx
-from openai import OpenAI
 from langsmith.wrappers import wrap_openai
 from langsmith import traceable
 from collections import deque
 import config
-from src import data_loader, embedding, rag_engine
+from src import rag_engine, pipeline, snapshot, llm_router, version_watcher
+from src.knowledge_base import KnowledgeBase
 
-client = OpenAI(
-    api_key=config.CURRENT_KEY,
-    base_url=config.CURRENT_URL
-)
-raw_client = OpenAI(
-    api_key=config.CURRENT_KEY,
-    base_url=config.CURRENT_URL
-)
-
-client = wrap_openai(raw_client)
+# Router ระหว่าง UNI/CLOUD (หรือ Client เดียวตาม ACTIVE_MODE ถ้าตั้งค่าไว้แค่ตัวเดียว)
+client = llm_router.build_client(wrap_openai)
 print(f"Bot started! Model: {config.CURRENT_MODEL}")
 
 print(f"[INFO] Bot started with LangSmith Tracing! Model: {config.CURRENT_MODEL}")
 
 # Load Knowledge
 print("\n--- Loading Knowledge Base (All-in-One DB) ---")
-all_data = data_loader.load_supabase_knowledge()
-# ปกติ
-all_vecs = embedding.build_vector_store(all_data, config.CACHE_JSON)
-# all_vecs = embedding.build_vector_store(all_data, config.CACHE_JSON, force_refresh=True)
-
-# ค่า Config การค้นหา
-RETRIEVE_TOPK = 12
-RERANK_TOPK = 8     
-
-TYPE_THRESH = {
-    "fact": 0.38,
-    "definition": 0.36,
-    "troubleshoot": 0.34,
-    "info": 0.35,
-}
-
-def get_threshold(item_type: str) -> float:
-    return TYPE_THRESH.get((item_type or "info").strip().lower(), 0.35)
+# ใช้ Snapshot ถ้า Version ตรงกับ DB ไม่เช่นนั้นโหลดจาก DB + Embed
+# DB ไม่ตอบ -> ใช้ Version ของ Snapshot ที่มีอยู่
+kb_version = version_watcher.WATCHER.current()
+all_data, all_vecs = snapshot.load_or_build(kb_version)
+# all_data, all_vecs = snapshot.load_or_build(kb_version, force_refresh=True)
+kb = KnowledgeBase(all_data, all_vecs, version=kb_version)
+fund_index = kb.fund_index
 
 # Chat Loop 
 @traceable(run_type="chain", name="RPA Bot Pipeline")
@@ -57,70 +38,50 @@ def run_chat():
             print("Thinking...", end="\r")
 
             # Intent Analysis
-            intent = rag_engine.analyze_intent(u_in)
+            intent = rag_engine.analyze_intent(u_in, fund_index, kb.domain_centroids, kb.glossary)
             if intent == "BLOCK":
                 msg = "ขออภัยค่ะ น้องทุนตอบเฉพาะเรื่องงานวิจัยและระบบเบิกจ่ายค่ะ"
                 print(f"\nBot: {msg}")
                 continue
 
-            # Rewrite Query
-            query = rag_engine.rewrite_query(u_in, history, client, config.CURRENT_MODEL)
-
-            # Retrieval & Rerank
-            cands = rag_engine.retrieval_stage(query, all_data, all_vecs, top_k=RETRIEVE_TOPK)
-            
-            results = rag_engine.reranking_stage(query, cands, top_k=RERANK_TOPK, intent=intent)
-
-            # Context Construction
-            context_lines = []
-            pass_count = 0
-
-            for item, score in results:
-                itype = (item.get("type") or "info").lower()
-                th = get_threshold(itype)
-                score01 = score / 100.0
-
-                if score01 >= th:
-                    pass_count += 1
-                    context_lines.append(f"<{itype}>{item.get('content','')}</{itype}>")
-
-            context_str = "\n".join(context_lines).strip()
-            has_context = (pass_count >= 1) and (len(context_str) > 0)
-
-            if not has_context:
-                msg = "ไม่พบข้อมูลในระบบที่เกี่ยวข้องค่ะ รบกวนระบุรายละเอียดเพิ่ม เช่น ชื่อเมนู หรือขั้นตอนที่ทำค้างอยู่ค่ะ"
-                print(f"\nBot: {msg}")
-                # history.append({"role":"user","content": u_in})
+            # Fund Fast Path
+            if intent == "FUND":
+                fund_answer = fund_index.answer(u_in)
+                if fund_answer:
+                    print(f"\nBot: {fund_answer}")
+                    history.append({"role": "user", "content": u_in})
+                    history.append({"role": "assistant", "content": fund_answer})
+                    continue
+
+            # Glossary Fast Path
+            if intent == "DEFINE":
+                define_answer = kb.glossary.answer(u_in)
+                print(f"\nBot: {define_answer}")
+                history.append({"role": "user", "content": u_in})
+                history.append({"role": "assistant", "content": define_answer})
                 continue
 
-            # Generation Payload
-            msgs = [
-                {
-                    "role": "system",
-                    "content": f"{config.STATIC_SYS_PROMPT}\n\nContext from Database:\n{context_str}"
-                }
-            # ] + list(history) + [{"role": "user", "content": query}]
-            ] + [{"role": "user", "content": query}]
-
-            print("Bot: ", end="", flush=True)
-            stream = client.chat.completions.create(
-                model=config.CURRENT_MODEL,
-                messages=msgs,
-                stream=True,
-                temperature=0.3,
-                max_tokens=4096,
-                extra_body={
-                    "repetition_penalty": 1.12, 
-                    "top_p": 0.9,
-                }
-            )
-
-            full_res = ""
-            for chunk in stream:
-                c = chunk.choices[0].delta.content
-                if c:
-                    print(c, end="", flush=True)
-                    full_res += c
+            # Rewrite -> Retrieval -> Rerank -> Context -> Generation (Pipeline เดียวกับ app.py)
+            result = {}
+
+            def emit(kind, payload=None):
+                if kind == "token":
+                    print(payload, end="", flush=True)
+                elif kind == "context":
+                    result["has_context"] = payload["has_context"]
+                    if payload["has_context"]:
+                        print("Bot: ", end="", flush=True)
+                elif kind == "final":
+                    result.update(payload)
+
+            pipeline.run_turn(u_in, history, kb, client, "cli", emit, intent=intent)
+            full_res = result.get("response", "")
+            if not result.get("has_context"):
+                print(f"\nBot: {full_res}")
+                continue
+            if result.get("error"):
+                print(f"\nError: {result['error']}")
+                continue
             print()
 
             history.append({"role": "user", "content": u_in})
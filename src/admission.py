@@ -0,0 +1,182 @@
+"""
+Admission Control: จำกัดจำนวนคำขอพร้อมกันต่อ Stage (rewrite / retrieve / generate)
+- เกิน Limit -> เข้าคิว (จำกัดขนาด) แบบ Round-Robin ต่อ Session ไม่ให้ Session เดียวกินคิว
+- คิวเต็ม / รอนานเกิน -> AdmissionRejected ให้ UI แจ้งผู้ใช้แทนการยิงไปจน Server ล่ม
+- ตั้งค่า ADMISSION_LOCK_DIR เพื่อจำกัดข้าม Process (หลาย Worker ในเครื่องเดียวกัน) ด้วย File Lock
+"""
+import os
+import time
+import threading
+import itertools
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Callable
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class _FileSlots:
+    """Semaphore ข้าม Process: slot แต่ละช่องคือไฟล์หนึ่งไฟล์ที่ถือ flock ไว้"""
+
+    def __init__(self, lock_dir: str, stage: str, limit: int):
+        os.makedirs(lock_dir, exist_ok=True)
+        self.paths = [os.path.join(lock_dir, f"{stage}.{i}.lock") for i in range(limit)]
+
+    def acquire(self, deadline: float):
+        while True:
+            for path in self.paths:
+                fd = os.open(path, os.O_CREAT | os.O_RDWR)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except OSError:
+                    os.close(fd)
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    @staticmethod
+    def release(fd) -> None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class _Stage:
+    def __init__(self, name: str, limit: int, max_queue: int, lock_dir: Optional[str]):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.cond = threading.Condition()
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()   # session -> tickets (ลำดับ = Round-Robin)
+        self.waiting = 0
+        self.file_slots = _FileSlots(lock_dir, name, limit) if (lock_dir and fcntl) else None
+
+    def _head(self) -> Optional[int]:
+        for q in self.queues.values():
+            if q:
+                return q[0]
+        return None
+
+    def position(self, session: str, ticket: int) -> int:
+        """ลำดับคิวโดยประมาณ (1 = ได้คิวถัดไป) ตามการวน Round-Robin"""
+        sessions = list(self.queues.keys())
+        q = self.queues.get(session)
+        if not q or ticket not in q:
+            return 0
+        rank = q.index(ticket)
+        ahead = 0
+        for i, s in enumerate(sessions):
+            other = len(self.queues[s])
+            if s == session:
+                ahead += rank
+            else:
+                # Session ที่อยู่ก่อนในรอบได้ (rank+1) คิว ที่อยู่หลังได้ rank คิว
+                ahead += min(other, rank + 1 if i < sessions.index(session) else rank)
+        return ahead + 1
+
+    def _pop(self, session: str) -> None:
+        q = self.queues[session]
+        q.popleft()
+        # ย้าย Session ไปท้ายรอบ (Round-Robin)
+        del self.queues[session]
+        if q:
+            self.queues[session] = q
+
+
+class AdmissionController:
+    def __init__(self, limits: Dict[str, int], max_queue: int, wait_timeout: float, lock_dir: Optional[str] = None):
+        self.stages = {name: _Stage(name, lim, max_queue, lock_dir) for name, lim in limits.items()}
+        self.wait_timeout = wait_timeout
+        self._tickets = itertools.count(1)
+
+    @classmethod
+    def from_config(cls) -> "AdmissionController":
+        return cls(
+            {
+                "rewrite": config.ADMIT_REWRITE,
+                "retrieve": config.ADMIT_RETRIEVE,
+                "generate": config.ADMIT_GENERATE,
+            },
+            max_queue=config.ADMISSION_MAX_QUEUE,
+            wait_timeout=config.ADMISSION_WAIT_TIMEOUT,
+            lock_dir=config.ADMISSION_LOCK_DIR,
+        )
+
+    @contextmanager
+    def slot(self, stage: str, session_id: str = "", on_wait: Optional[Callable[[int], None]] = None):
+        st = self.stages.get(stage)
+        if st is None:
+            yield
+            return
+
+        ticket = next(self._tickets)
+        deadline = time.time() + self.wait_timeout
+        session_id = session_id or f"anon:{ticket}"
+
+        with st.cond:
+            if st.active < st.limit and st._head() is None:
+                st.active += 1
+            else:
+                if st.waiting >= st.max_queue:
+                    raise AdmissionRejected(f"{stage} queue full ({st.waiting})")
+                st.queues.setdefault(session_id, deque()).append(ticket)
+                st.waiting += 1
+                last_pos = None
+                try:
+                    while not (st.active < st.limit and st._head() == ticket):
+                        pos = st.position(session_id, ticket)
+                        if on_wait and pos != last_pos:
+                            last_pos = pos
+                            # Callback ของ UI เรียกนอก Lock (ไม่ให้ Block การคืน Slot/รับคิวของ Session อื่น)
+                            st.cond.release()
+                            try:
+                                on_wait(pos)
+                            finally:
+                                st.cond.acquire()
+                            continue  # สถานะอาจเปลี่ยนระหว่างปล่อย Lock: ตรวจใหม่ก่อนรอ
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise AdmissionRejected(f"{stage} wait timeout")
+                        st.cond.wait(timeout=min(remaining, 1.0))
+                    st.active += 1
+                finally:
+                    # ถอนตั๋วออกจากคิว (ทั้งกรณีได้คิวและ Timeout)
+                    q = st.queues.get(session_id)
+                    if q and ticket in q:
+                        if q[0] == ticket:
+                            st._pop(session_id)
+                        else:
+                            q.remove(ticket)
+                        if session_id in st.queues and not st.queues[session_id]:
+                            del st.queues[session_id]
+                    st.waiting -= 1
+                    st.cond.notify_all()
+
+        fd = None
+        try:
+            if st.file_slots:
+                fd = st.file_slots.acquire(deadline)
+                if fd is None:
+                    raise AdmissionRejected(f"{stage} cross-process wait timeout")
+            yield
+        finally:
+            if fd is not None:
+                _FileSlots.release(fd)
+            with st.cond:
+                st.active -= 1
+                st.cond.notify_all()
+
+
+# ใช้ร่วมกันทั้ง Process (ทุก Streamlit Session)
+CONTROLLER = AdmissionController.from_config()
@@ -0,0 +1,53 @@
+"""
+Cache คำตอบที่เตรียมไว้ล่วงหน้า (Warm-up หลัง Sync) ใช้ Key เดียวกับ Single-Flight
+Key มี Version ของ Knowledge Base อยู่แล้ว เมื่อ Sync รอบใหม่ คำตอบของ Version เก่าจะไม่ถูกใช้และถูกล้างออก
+คำตอบใช้ได้ภายในวันที่สร้างเท่านั้น (สถานะเปิด/ปิดของทุนขึ้นกับวันที่ แม้ข้อมูลจะไม่เปลี่ยน)
+"""
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import config
+
+
+class AnswerCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, Tuple[datetime.date, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            day, entry = item
+            if day != datetime.date.today():
+                # ข้ามวันแล้ว: คำตอบอาจอ้างสถานะทุนของเมื่อวาน
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (datetime.date.today(), entry)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def retain_version(self, version: Any) -> None:
+        # ทิ้งคำตอบของ Version อื่น (Key ขึ้นต้นด้วย "<version>|")
+        prefix = f"{version}|"
+        with self._lock:
+            for key in [k for k in self._items if not k.startswith(prefix)]:
+                del self._items[key]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# ใช้ร่วมกันทั้ง Process (ทุก Streamlit Session)
+CACHE = AnswerCache(config.ANSWER_CACHE_SIZE)
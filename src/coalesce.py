@@ -0,0 +1,103 @@
+"""
+Single-Flight: คำถามเดียวกัน (หลัง Normalize) บน Knowledge Base Version เดียวกันที่เข้ามาพร้อมกัน
+จะใช้ Pipeline เดียว (rewrite -> retrieve -> generate) แล้วกระจาย Event/Token ให้ทุกผู้รอ
+
+- ผู้มาก่อน (Leader) สร้าง Flight และรัน Pipeline ใน Thread แยก (ผู้ใช้ปิดหน้าไป คนอื่นก็ยังได้คำตอบ)
+- ผู้มาทีหลังได้ Event ที่เกิดไปแล้วทั้งหมดก่อน แล้วตาม Event ใหม่แบบ Real-time
+- Flight ถูกถอดออกทันทีที่จบ คำขอถัดไปจะเริ่ม Pipeline ใหม่
+"""
+import re
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+import config
+
+Event = Tuple[str, Any]
+
+
+def normalize_query(text: str) -> str:
+    # ตัดช่องว่างซ้ำ/เครื่องหมายท้ายประโยค และไม่สนตัวพิมพ์เล็กใหญ่
+    t = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return t.rstrip(" ?？!.ๆ")
+
+
+def make_key(user_input: str, version: Any, last_context: str = "") -> str:
+    """Key ของ Flight: คำถาม + Version ของ Knowledge Base + บริบทที่ Rewriter ใช้ (ถ้ามี)"""
+    ctx = hashlib.sha1(last_context.encode("utf-8")).hexdigest()[:12] if last_context else "-"
+    return f"{version}|{ctx}|{normalize_query(user_input)}"
+
+
+class _Flight:
+    def __init__(self):
+        self.events: List[Event] = []
+        self.done = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+    def emit(self, kind: str, payload: Any = None) -> None:
+        with self.cond:
+            self.events.append((kind, payload))
+            self.cond.notify_all()
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def subscribe(self, key: str, producer: Callable[[Callable[[str, Any], None]], None]) -> Iterator[Event]:
+        """
+        producer(emit) ทำงานครั้งเดียวต่อ Key ที่กำลังรันอยู่ แล้วคืน Iterator ของ (kind, payload)
+        Exception ใน producer จะกลายเป็น Event ("error", exc)
+        """
+        with self._lock:
+            if not self.enabled:
+                self._seq += 1
+                key = f"{key}#{self._seq}"
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            flight.subscribers += 1
+
+        if leader:
+            threading.Thread(target=self._run, args=(key, flight, producer), daemon=True).start()
+        else:
+            print(f"[INFO] Coalesced request onto in-flight pipeline ({flight.subscribers} subscribers)")
+        return self._follow(flight)
+
+    def _run(self, key: str, flight: _Flight, producer) -> None:
+        try:
+            producer(flight.emit)
+        except Exception as e:
+            print(f"[ERROR] Coalesced pipeline failed: {e}")
+            flight.emit("error", e)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    @staticmethod
+    def _follow(flight: _Flight) -> Iterator[Event]:
+        i = 0
+        while True:
+            with flight.cond:
+                while i >= len(flight.events) and not flight.done:
+                    flight.cond.wait(timeout=1.0)
+                batch = flight.events[i:]
+                i += len(batch)
+                finished = flight.done and i >= len(flight.events)
+            for ev in batch:
+                yield ev
+            if finished:
+                return
+
+
+# ใช้ร่วมกันทั้ง Process (ทุก Streamlit Session)
+FLIGHTS = SingleFlight(enabled=config.COALESCE_REQUESTS)
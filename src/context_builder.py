@@ -0,0 +1,167 @@
+import re
+from typing import List, Dict, Tuple, Any, Callable, Optional
+
+# ตัวประมาณจำนวน Token (ไม่ต้องโหลด Tokenizer จริง)
+# ภาษาไทยใน Tokenizer ของ Typhoon ประมาณ 3 ตัวอักษรต่อ 1 token, ภาษาอื่นประมาณ 4
+THAI_CHARS_PER_TOKEN = 3.0
+OTHER_CHARS_PER_TOKEN = 4.0
+
+_THAI_RE = re.compile(r"[฀-๿]")
+_HEADER_KEYS = ("เอกสาร", "หมวดหมู่", "หัวข้อ")
+_BODY_MARK = "เนื้อหา:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    thai = len(_THAI_RE.findall(text))
+    other = len(text) - thai
+    return int(thai / THAI_CHARS_PER_TOKEN + other / OTHER_CHARS_PER_TOKEN) + 1
+
+
+def _split_manual(content: str) -> Tuple[Optional[Dict[str, str]], str]:
+    """แยก Header (เอกสาร/หมวดหมู่/หัวข้อ) ออกจากเนื้อหาของ Chunk คู่มือ"""
+    if _BODY_MARK not in content:
+        return None, content
+    head, body = content.split(_BODY_MARK, 1)
+    header = {}
+    for line in head.strip().split("\n"):
+        key, sep, val = line.partition(":")
+        if sep and key.strip() in _HEADER_KEYS:
+            header[key.strip()] = val.strip()
+    if not header:
+        return None, content
+    return header, body.strip()
+
+
+def _step_no(item: Dict[str, Any]) -> int:
+    try:
+        return int((item.get("metadata") or {}).get("step_number") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _build_units(passed: List[Tuple[Dict[str, Any], float]]) -> List[Dict[str, Any]]:
+    """รวม Chunk ของเอกสาร/หัวข้อเดียวกันให้เป็นก้อนเดียว (เรียงตามขั้นตอน)"""
+    units = []
+    by_key = {}
+    seen_content = set()
+
+    for item, score in passed:
+        content = str(item.get("content", "") or "").strip()
+        if not content or content in seen_content:
+            continue
+        seen_content.add(content)
+
+        itype = (item.get("type") or "info").lower()
+        header, body = _split_manual(content)
+
+        if header is None:
+            units.append({"type": itype, "header": None, "parts": [(0, body)],
+                          "items": [(item, score)], "score": score})
+            continue
+
+        key = (header.get("เอกสาร", ""), header.get("หมวดหมู่", ""), header.get("หัวข้อ", ""))
+        unit = by_key.get(key)
+        if unit is None:
+            unit = {"type": itype, "header": header, "parts": [],
+                    "items": [], "score": score}
+            by_key[key] = unit
+            units.append(unit)
+        unit["parts"].append((_step_no(item), body))
+        unit["items"].append((item, score))
+
+    for unit in units:
+        unit["parts"].sort(key=lambda p: p[0])
+    return units
+
+
+def _render_unit(unit: Dict[str, Any], doc_seen: set) -> str:
+    itype = unit["type"]
+    body = "\n".join(p[1] for p in unit["parts"])
+    header = unit["header"]
+    if header is None:
+        return f"<{itype}>{body}</{itype}>"
+
+    lines = []
+    doc = header.get("เอกสาร", "")
+    # Header เอกสาร/หมวดหมู่ ที่ซ้ำกันแสดงครั้งเดียว
+    if doc not in doc_seen:
+        doc_seen.add(doc)
+        lines.append(f"เอกสาร: {doc}")
+        if header.get("หมวดหมู่"):
+            lines.append(f"หมวดหมู่: {header['หมวดหมู่']}")
+    if header.get("หัวข้อ"):
+        lines.append(f"หัวข้อ: {header['หัวข้อ']}")
+    lines.append(f"{_BODY_MARK}{body}")
+    return f"<{itype}>" + "\n".join(lines) + f"</{itype}>"
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def build_context(
+    results: List[Tuple[Dict[str, Any], float]],
+    threshold_fn: Callable[[str], float],
+    token_budget: int = 1800,
+) -> Tuple[str, List[Tuple[Dict[str, Any], float]]]:
+    """
+    คัด Chunk ที่ผ่าน Threshold แล้วบรรจุลง Context ภายใน token_budget
+    คืนค่า (context_str, รายการ (item, score) ที่ถูกใส่จริง)
+    """
+    passed = []
+    for item, score in results:
+        itype = (item.get("type") or "info").lower()
+        if (score / 100.0) >= threshold_fn(itype):
+            passed.append((item, score))
+    if not passed:
+        return "", []
+
+    units = _build_units(passed)
+    units.sort(key=lambda u: u["score"], reverse=True)
+
+    # เลือกก้อนตามคะแนน (คิดต้นทุนแบบมี Header เต็ม เพื่อไม่ให้เกินงบ)
+    chosen = []
+    spent = 0
+    for unit in units:
+        cost = estimate_tokens(_render_unit(unit, set()))
+        if spent + cost <= token_budget:
+            chosen.append(unit)
+            spent += cost
+        elif not chosen:
+            # ก้อนแรกใหญ่เกินงบ ตัดให้พอดีแทนการทิ้งทั้งหมด
+            unit["truncate"] = True
+            chosen.append(unit)
+            spent = token_budget
+
+    # เรนเดอร์โดยจัดก้อนของเอกสารเดียวกันให้อยู่ติดกัน Header จะได้ไม่ซ้ำ
+    doc_rank = {}
+    for i, unit in enumerate(chosen):
+        doc = (unit["header"] or {}).get("เอกสาร") or f"#{i}"
+        doc_rank.setdefault(doc, i)
+        unit["doc_rank"] = doc_rank[doc]
+
+    blocks = []
+    used = []
+    doc_seen = set()
+    for unit in sorted(chosen, key=lambda u: u["doc_rank"]):
+        block = _render_unit(unit, doc_seen)
+        if unit.get("truncate"):
+            close_tag = f"</{unit['type']}>"
+            block = _truncate_to_tokens(block, token_budget - estimate_tokens(close_tag)) + close_tag
+        blocks.append(block)
+        used.extend(unit["items"])
+
+    context_str = "\n".join(blocks).strip()
+    print(f"   [Context] {len(used)}/{len(passed)} chunks packed (~{estimate_tokens(context_str)}/{token_budget} tokens)")
+    return context_str, used
@@ -150,7 +150,12 @@ def fetch_funds():
                         "source": fund_name, 
                         "fund_abbr": fund_abbr,
                         "fiscal_year": fiscal_year,
-                        "status": std_status  
+                        "status": std_status,
+                        # ค่าดิบสำหรับ Fund Index (ไม่ต้องแกะจากข้อความ)
+                        "fund_name": fund_name,
+                        "source_agency": row.get("source_agency") or "",
+                        "start_period": _iso_date(row.get("start_period")),
+                        "end_period": _iso_date(row.get("end_period"))
                     }
                 })
         return chunks
@@ -232,6 +237,14 @@ def fetch_troubleshooting_chunked():
     finally:
         conn.close()
         
+def _iso_date(val) -> str:
+    # date/datetime -> 'YYYY-MM-DD', ค่าอื่นเก็บเป็น string ตามเดิม
+    if val is None:
+        return ""
+    if hasattr(val, "isoformat"):
+        return val.isoformat()[:10]
+    return str(val).strip()
+
 def _safe_id(s: str) -> str:
     s = (s or "").strip()
     s = re.sub(r"\s+", "_", s)
@@ -272,4 +285,51 @@ def update_feedback(log_id: int, score: int):
         print(f"[ERROR] Update Feedback Failed: {e}")
         conn.rollback()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# คำถามที่ถูกถามบ่อยและได้ Feedback ดี (ใช้ Warm-up หลัง Sync)
+def fetch_top_questions(limit: int = 30, min_rating: float = 0.5):
+    conn = get_db_connection()
+    if not conn: return []
+    try:
+        with conn.cursor() as cur:
+            sql = f"""
+                SELECT MIN(TRIM(user_input)) AS question, COUNT(*) AS asked, AVG(feedback_score) AS rating
+                FROM {config.DB_SCHEMA}.chat_logs
+                WHERE user_input IS NOT NULL AND LENGTH(TRIM(user_input)) BETWEEN 2 AND 200
+                GROUP BY LOWER(TRIM(user_input))
+                HAVING COALESCE(AVG(feedback_score), 1) >= %s
+                ORDER BY COUNT(*) DESC, COALESCE(AVG(feedback_score), 0) DESC
+                LIMIT %s
+            """
+            cur.execute(sql, (min_rating, limit))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"[ERROR] Fetch Top Questions Failed: {e}")
+        return []
+    finally:
+        conn.close()
+
+# คำถามที่ระบบตอบจากฐานความรู้ได้ (มี relevant_source) ใช้ปรับ DOMAIN_MIN_SIM
+def fetch_answered_questions(limit: int = 2000):
+    conn = get_db_connection()
+    if not conn: return []
+    try:
+        with conn.cursor() as cur:
+            sql = f"""
+                SELECT MIN(TRIM(user_input)) AS question
+                FROM {config.DB_SCHEMA}.chat_logs
+                WHERE relevant_source IS NOT NULL AND relevant_source <> ''
+                  AND user_input IS NOT NULL AND LENGTH(TRIM(user_input)) BETWEEN 2 AND 200
+                  AND COALESCE(feedback_score, 1) > 0
+                GROUP BY LOWER(TRIM(user_input))
+                ORDER BY MAX(id) DESC
+                LIMIT %s
+            """
+            cur.execute(sql, (limit,))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"[ERROR] Fetch Answered Questions Failed: {e}")
+        return []
+    finally:
+        conn.close()
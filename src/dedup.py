@@ -0,0 +1,141 @@
+"""
+รวม Chunk ที่ซ้ำ/เกือบซ้ำตอนโหลด Knowledge Base (ก่อนสร้าง Snapshot)
+
+1. exact_dedup (ก่อน Embed): เนื้อหาเหมือนกันทุกตัวอักษร (ไม่นับช่องว่าง) -> เหลือชิ้นเดียว ไม่ต้อง Embed ซ้ำ
+2. near_dedup (หลัง Embed): Cosine >= DEDUP_SIM -> รวมเป็นชิ้นตัวแทน (เช่น ทุนที่ยุติแล้วหลายปีงบประมาณ)
+
+เปรียบเทียบเฉพาะ Chunk กลุ่มเดียวกัน (แหล่งข้อมูล + type) และขั้นตอนของคู่มือรวมได้เฉพาะขั้นตอนเดียวกัน
+คำศัพท์ (glossary:) ไม่รวมแบบ near_dedup: Glossary ใช้ 1 Chunk = 1 คำ + ความหมายของคำนั้น
+ชิ้นตัวแทนไม่ทำข้อมูลหาย:
+- บรรทัดที่ไม่ได้มีเหมือนกันทุกชิ้น (เช่น ชื่อทุน + ปีงบประมาณ) ของแต่ละชิ้นถูกต่อท้ายเนื้อหา (1 บรรทัดต่อชิ้น)
+- metadata["merged_ids"] = id ของชิ้นที่ถูกรวม, metadata["variants"] = metadata ของแต่ละชิ้น (มี id)
+  (FundIndex / MetadataIndex อ่าน variants ด้วย)
+"""
+import re
+import hashlib
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import config
+
+_SPACE_RE = re.compile(r"\s+")
+_BLOCK = 512   # จำนวนแถวต่อการคูณ Matrix หนึ่งครั้ง
+_NEAR_SKIP = {"glossary"}   # Prefix ของ id ที่ไม่รวมแบบ near_dedup
+
+
+def settings() -> Dict[str, Any]:
+    """ค่าที่มีผลต่อผลลัพธ์ของ Dedup (เก็บใน Manifest ของ Snapshot)"""
+    return {"enabled": bool(config.DEDUP_ENABLED), "sim": float(config.DEDUP_SIM), "near_skip": sorted(_NEAR_SKIP)}
+
+
+def _group_key(item: Mapping) -> Tuple:
+    meta = item.get("metadata") or {}
+    prefix = str(item.get("id", "")).split(":", 1)[0]
+    step = meta.get("step_number")
+    # ขั้นตอนของคู่มือมีตำแหน่ง -> รวมได้เฉพาะขั้นตอนเดียวกันของหัวข้อเดียวกัน
+    step_key = (meta.get("source"), meta.get("topic"), str(step)) if step not in (None, "") else None
+    return prefix, item.get("type"), step_key
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha1(_SPACE_RE.sub(" ", str(text or "")).strip().encode("utf-8")).hexdigest()
+
+
+def _merge(rep: Mapping, members: List[Mapping]) -> Dict[str, Any]:
+    meta = dict(rep.get("metadata") or {})
+    rep_content = str(rep.get("content") or "").rstrip()
+    # บรรทัดที่ทุกชิ้นมีเหมือนกัน (หัวข้อ/สถานะ) ไม่ต้องซ้ำ ส่วนที่เหลือของแต่ละชิ้นเก็บไว้ด้วยกันในบรรทัดเดียว
+    common = {line.strip() for line in rep_content.splitlines()}
+    for m in members:
+        common &= {line.strip() for line in str(m.get("content") or "").splitlines()}
+    extra: List[str] = []
+    variants = list(meta.get("variants") or [])
+    merged_ids = list(meta.get("merged_ids") or [])
+
+    for m in members:
+        diff = [line.strip() for line in str(m.get("content") or "").splitlines()
+                if line.strip() and line.strip() not in common]
+        line = " | ".join(diff)
+        if line and line not in extra:
+            extra.append(line)
+        m_meta = m.get("metadata") or {}
+        variants.append({"id": m.get("id"), **{k: v for k, v in m_meta.items() if k not in ("variants", "merged_ids")}})
+        variants.extend(m_meta.get("variants") or [])
+        merged_ids.append(m.get("id"))
+        merged_ids.extend(m_meta.get("merged_ids") or [])
+
+    meta["merged_ids"] = merged_ids
+    meta["variants"] = variants
+    content = rep_content + ("\n" + "\n".join(extra) if extra else "")
+    return {"id": rep.get("id"), "content": content, "type": rep.get("type"), "metadata": meta}
+
+
+def _collapse(data: List[Mapping], clusters: Dict[int, List[int]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    absorbed = {j for members in clusters.values() for j in members}
+    out, keep = [], []
+    for i, item in enumerate(data):
+        if i in absorbed:
+            continue
+        out.append(_merge(item, [data[j] for j in clusters[i]]) if i in clusters else item)
+        keep.append(i)
+    return out, keep
+
+
+def exact_dedup(data: List[Mapping]) -> List[Mapping]:
+    """รวม Chunk ที่เนื้อหาเหมือนกันทุกตัวอักษร (ทำก่อน Embed)"""
+    if not config.DEDUP_ENABLED or not data:
+        return data
+    first: Dict[Tuple, int] = {}
+    clusters: Dict[int, List[int]] = {}
+    for i, item in enumerate(data):
+        key = (_group_key(item), _content_hash(item.get("content")))
+        if key in first:
+            clusters.setdefault(first[key], []).append(i)
+        else:
+            first[key] = i
+    if not clusters:
+        return data
+    out, _ = _collapse(data, clusters)
+    print(f"[INFO] Exact dedup: {len(data)} -> {len(out)} chunks")
+    return out
+
+
+def near_dedup(data: List[Mapping], vectors: Optional[np.ndarray],
+               threshold: Optional[float] = None) -> Tuple[List[Mapping], Optional[np.ndarray]]:
+    """รวม Chunk ที่ Vector เกือบเหมือนกัน (Greedy: ชิ้นแรกของกลุ่มเป็นตัวแทน ดูดชิ้นหลังที่ Cosine >= threshold)"""
+    threshold = config.DEDUP_SIM if threshold is None else threshold
+    if vectors is not None and len(vectors) != len(data):
+        # Vector ไม่ตรงกับแถว: Knowledge Base ที่สร้างต่อจะคืน Chunk ผิดแถวโดยไม่มี Error
+        raise ValueError(f"near_dedup: {len(vectors)} vectors for {len(data)} items")
+    if not config.DEDUP_ENABLED or vectors is None or len(data) < 2:
+        return data, vectors
+
+    groups: Dict[Tuple, List[int]] = {}
+    for i, item in enumerate(data):
+        groups.setdefault(_group_key(item), []).append(i)
+
+    clusters: Dict[int, List[int]] = {}
+    for key, rows in groups.items():
+        if len(rows) < 2 or key[0] in _NEAR_SKIP:
+            continue
+        rows = np.asarray(rows)
+        mat = vectors[rows]
+        merged = np.zeros(len(rows), dtype=bool)
+        for start in range(0, len(rows), _BLOCK):
+            sims = mat[start:start + _BLOCK] @ mat.T
+            for k in range(sims.shape[0]):
+                a = start + k
+                if merged[a]:
+                    continue
+                hits = np.nonzero(sims[k, a + 1:] >= threshold)[0] + a + 1
+                hits = hits[~merged[hits]]
+                if hits.size:
+                    merged[hits] = True
+                    clusters[int(rows[a])] = [int(r) for r in rows[hits]]
+
+    if not clusters:
+        return data, vectors
+    out, keep = _collapse(data, clusters)
+    print(f"[INFO] Near-duplicate dedup (sim >= {threshold}): {len(data)} -> {len(out)} chunks "
+          f"in {len(clusters)} clusters")
+    return out, vectors[np.asarray(keep)]
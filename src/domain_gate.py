@@ -0,0 +1,92 @@
+"""
+Domain Gate: ตรวจว่าคำถามอยู่ในขอบเขตของฐานความรู้ โดยเทียบกับ Centroid ของ Vector ทั้งหมด
+
+ปรับ DOMAIN_MIN_SIM จากคำถามจริงใน chat_logs ที่ระบบตอบจากฐานความรู้ได้:
+    python -m src.domain_gate calibrate [--path knowledge_snapshot.npz] [--percentile 2]
+"""
+import sys
+import argparse
+import numpy as np
+from typing import Optional
+
+
+def build_centroids(vectors: Optional[np.ndarray], k: int = 24, iters: int = 8) -> Optional[np.ndarray]:
+    """
+    สร้าง Domain Centroid จาก Vector ของฐานความรู้ (Spherical K-Means แบบเบาๆ)
+    ใช้ตรวจว่าคำถามอยู่ในขอบเขตของระบบหรือไม่ โดยเทียบกับ k จุดแทนการสแกนทั้งหมด
+    """
+    if vectors is None or len(vectors) == 0:
+        return None
+    valid = vectors[np.linalg.norm(vectors, axis=1) > 0]
+    if len(valid) == 0:
+        return None
+
+    k = max(1, min(k, len(valid)))
+    # เริ่มต้นแบบ Deterministic (เลือกแถวกระจายทั่วทั้งชุด) ทุก Replica ได้ผลเหมือนกัน
+    init_idx = np.linspace(0, len(valid) - 1, k).astype(int)
+    centroids = valid[init_idx].copy()
+
+    for _ in range(iters):
+        assign = np.argmax(valid @ centroids.T, axis=1)
+        for c in range(k):
+            members = valid[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids = centroids / np.maximum(norms, 1e-12)
+
+    print(f"[INFO] Domain centroids built: {k} centroids from {len(valid)} vectors.")
+    return centroids.astype("float32")
+
+
+def domain_score(qvec: np.ndarray, centroids: Optional[np.ndarray]) -> float:
+    """ความคล้ายสูงสุดระหว่างคำถามกับ Centroid ใดๆ (1.0 ถ้าไม่มี Centroid ให้เทียบ)"""
+    if centroids is None or qvec is None or qvec.size == 0 or qvec.shape[0] != centroids.shape[1]:
+        return 1.0
+    return float(np.max(centroids @ qvec))
+
+
+def calibrate(scores: np.ndarray, percentile: float) -> float:
+    """Threshold ที่ปล่อยคำถามในโดเมนผ่าน (100 - percentile)% (ปัดลง 2 ตำแหน่ง)"""
+    return float(np.floor(np.percentile(scores, percentile) * 100) / 100)
+
+
+def main(argv=None) -> int:
+    import config
+    from . import data_loader, embedding, snapshot
+    parser = argparse.ArgumentParser(prog="python -m src.domain_gate", description="Domain gate tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_cal = sub.add_parser("calibrate", help="Suggest DOMAIN_MIN_SIM from answered questions in chat_logs")
+    p_cal.add_argument("--path", default=config.SNAPSHOT_PATH)
+    p_cal.add_argument("--limit", type=int, default=2000)
+    p_cal.add_argument("--percentile", type=float, default=2.0,
+                       help="Share of answered questions allowed below the threshold")
+    args = parser.parse_args(argv)
+
+    loaded = snapshot.load_snapshot(args.path)
+    if not loaded:
+        print(f"[ERROR] No readable snapshot at {args.path}")
+        return 1
+    centroids = build_centroids(loaded[1], k=config.DOMAIN_CENTROIDS)
+    questions = data_loader.fetch_answered_questions(args.limit)
+    if not questions:
+        print("[ERROR] No answered questions in chat_logs")
+        return 1
+    qvecs = [v for i in range(0, len(questions), 64)
+             for v in embedding.get_embeddings_batch(questions[i:i + 64], use_cache=False, priority="bulk")]
+    scores = np.array([domain_score(v, centroids) for v in qvecs if v.size and np.any(v)])
+    if not scores.size:
+        print("[ERROR] Embedding failed for every question")
+        return 1
+
+    print(f"[INFO] Domain scores of {len(scores)} answered questions: "
+          + "  ".join(f"p{p}={np.percentile(scores, p):.3f}" for p in (1, 2, 5, 10, 50)))
+    suggested = calibrate(scores, args.percentile)
+    below = float(np.mean(scores < config.DOMAIN_MIN_SIM)) * 100
+    print(f"[INFO] Current DOMAIN_MIN_SIM={config.DOMAIN_MIN_SIM} rejects {below:.1f}% of them")
+    print(f"[INFO] Suggested DOMAIN_MIN_SIM={suggested} (p{args.percentile:g})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 import numpy as np
 import os
 import time
+import hashlib
+import threading
+from collections import OrderedDict
 import httpx
 import config
+from . import rate_control
 
 # ตั้งค่า Timeout 
 TIMEOUT = httpx.Timeout(45.0, connect=10.0, read=45.0)
@@ -51,61 +55,178 @@ def _to_vec(data) -> np.ndarray:
 
     return np.array([], dtype="float32")
 
-def get_embedding_remote(text: str, retries: int = 3) -> np.ndarray:
-    """ส่ง Text ไปแปลงเป็น Vector (มี Retry Logic)"""
+# LRU Cache ของ Query Embedding (ใช้ซ้ำระหว่าง Intent Gate / Retrieval / Session อื่น)
+_EMBED_CACHE = OrderedDict()
+_EMBED_CACHE_LOCK = threading.Lock()
+
+def _cache_get(key):
+    with _EMBED_CACHE_LOCK:
+        vec = _EMBED_CACHE.get(key)
+        if vec is not None:
+            _EMBED_CACHE.move_to_end(key)
+        return vec
+
+def _cache_put(key, vec: np.ndarray) -> None:
+    if config.EMBED_CACHE_SIZE <= 0:
+        return
+    vec.setflags(write=False)  # แชร์ข้าม Thread ได้ ห้ามแก้ไข
+    with _EMBED_CACHE_LOCK:
+        _EMBED_CACHE[key] = vec
+        _EMBED_CACHE.move_to_end(key)
+        while len(_EMBED_CACHE) > config.EMBED_CACHE_SIZE:
+            _EMBED_CACHE.popitem(last=False)
+
+def get_embedding_remote(text: str, retries: int = 3, use_cache: bool = True, priority: str = "live") -> np.ndarray:
+    """ส่ง Text ไปแปลงเป็น Vector (มี Retry Logic ผ่าน Rate Controller ที่ใช้ร่วมกันทั้ง Process)"""
     # Pre-process text: แปลงเป็น string, ลบ new line, ตัดช่องว่าง
     text = str(text or "").replace("\n", " ").strip()
     
     if not text:
         return np.array([], dtype="float32")
 
+    cache_key = (config.UNI_EMBED_MODEL, text)
+    if use_cache:
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+
     payload = {
         "model": config.UNI_EMBED_MODEL, 
         "input": text
     }
+    data = _post_embed(payload, retries, priority)
+    if data is None:
+        return np.array([], dtype="float32")
+
+    vec = _to_vec(data)
+    if vec.size == 0:
+        return np.array([], dtype="float32")
+
+    vec = _normalize(vec)
+    if use_cache:
+        _cache_put(cache_key, vec)
+    return vec
+
+def _post_embed(payload: dict, retries: int = 3, priority: str = "live"):
+    """ยิงคำขอ Embedding ผ่าน Rate Controller คืน JSON หรือ None ถ้าไม่สำเร็จ"""
+    ctl = rate_control.get_controller("embed")
 
     for attempt in range(retries):
         try:
-            resp = HTTP.post(config.UNI_EMBED_URL, json=payload)
+            resp = None
+            retry_after = None
+            with ctl.call(priority, timeout=TIMEOUT.read) as report:
+                try:
+                    resp = HTTP.post(config.UNI_EMBED_URL, json=payload)
+                    outcome = rate_control.classify_status(resp.status_code)
+                    retry_after = rate_control.parse_retry_after(resp.headers.get("Retry-After"))
+                except (httpx.TimeoutException, httpx.ConnectError, httpx.ReadError):
+                    outcome = rate_control.OVERLOAD
+                report(outcome, retry_after)
 
-            # Retry กรณี Server Busy (429) หรือ Error 5xx
-            if resp.status_code == 429 or (500 <= resp.status_code <= 599):
-                wait_time = 0.5 * (2 ** attempt) # Exponential backoff
-                time.sleep(wait_time)
+            # Retry กรณี Server Busy (429) หรือ Error 5xx / Timeout
+            # Retry-After และการลด Concurrency จัดการโดย Rate Controller (ทุกคำขอรอพร้อมกัน)
+            if outcome == rate_control.OVERLOAD:
+                if not retry_after:
+                    time.sleep(0.25 * (2 ** attempt))
                 continue
 
             if resp.status_code != 200:
                 print(f"[WARN] Embedding Error {resp.status_code}: {resp.text[:100]}")
-                return np.array([], dtype="float32")
-
-            data = resp.json()
-            vec = _to_vec(data)
+                return None
 
-            if vec.size == 0:
-                return np.array([], dtype="float32")
+            return resp.json()
 
-            return _normalize(vec)
-
-        except (httpx.TimeoutException, httpx.ConnectError, httpx.ReadError):
-            time.sleep(0.5 * (2 ** attempt))
+        except rate_control.CircuitOpen:
+            # Server ล่ม -> คืนค่าว่างทันที ไม่ต้องรอ Timeout
+            print("[WARN] Embedding server circuit open. Skipping request.")
+            break
+        except TimeoutError as e:
+            print(f"[WARN] Embedding {e}")
+            break
         except Exception as e:
             print(f"[ERROR] Embedding Exception: {e}")
             break
 
-    return np.array([], dtype="float32")
+    return None
+
+def _to_vecs(data, m: int) -> list:
+    # แยกผล Batch เป็น List ของ Vector ตามลำดับ input (คืน [] ถ้ารูปแบบไม่ตรง)
+    if isinstance(data, dict) and isinstance(data.get("data"), list):
+        rows = sorted(data["data"], key=lambda d: d.get("index", 0))
+        vecs = [np.array(r.get("embedding") or [], dtype="float32") for r in rows]
+    elif isinstance(data, dict) and isinstance(data.get("embeddings"), list) \
+            and data["embeddings"] and isinstance(data["embeddings"][0], list):
+        vecs = [np.array(v, dtype="float32") for v in data["embeddings"]]
+    else:
+        return []
+    return vecs if len(vecs) == m else []
+
+def get_embeddings_batch(texts, retries: int = 3, use_cache: bool = True, priority: str = "live") -> np.ndarray:
+    """
+    Embed หลายข้อความในคำขอเดียว คืน Matrix (m, d) ตามลำดับ texts (แถวที่ไม่สำเร็จเป็น 0)
+    ข้อความที่อยู่ใน Cache แล้วจะไม่ถูกส่งซ้ำ ถ้า Server ไม่รองรับ Batch จะ Embed ทีละข้อความแทน
+    """
+    texts = [str(t or "").replace("\n", " ").strip() for t in texts]
+    vecs = [None] * len(texts)
+    missing = []
+    for i, t in enumerate(texts):
+        cached = _cache_get((config.UNI_EMBED_MODEL, t)) if (use_cache and t) else None
+        if cached is not None:
+            vecs[i] = cached
+        elif t:
+            missing.append(i)
+
+    if len(missing) == 1:
+        vecs[missing[0]] = get_embedding_remote(texts[missing[0]], retries, use_cache, priority)
+    elif missing:
+        payload = {"model": config.UNI_EMBED_MODEL, "input": [texts[i] for i in missing]}
+        data = _post_embed(payload, retries, priority)
+        got = _to_vecs(data, len(missing)) if data is not None else []
+        if not got:
+            print("[WARN] Batch embedding unsupported or failed. Falling back to single requests.")
+            got = [get_embedding_remote(texts[i], retries, use_cache, priority) for i in missing]
+        for i, vec in zip(missing, got):
+            if vec.size:
+                vec = _normalize(vec)
+                if use_cache:
+                    _cache_put((config.UNI_EMBED_MODEL, texts[i]), vec)
+            vecs[i] = vec
+
+    dim = max((v.size for v in vecs if v is not None), default=0)
+    out = np.zeros((len(texts), dim), dtype="float32")
+    for i, v in enumerate(vecs):
+        if v is not None and v.size == dim:
+            out[i] = v
+    return out
+
+def _corpus_key(data_list) -> str:
+    # Fingerprint ของ id + เนื้อหาทุกแถวตามลำดับ (Cache ใช้ได้เฉพาะเมื่อแถวตรงกันทุกแถว)
+    h = hashlib.sha1(config.UNI_EMBED_MODEL.encode("utf-8"))
+    for item in data_list:
+        h.update(f"{item.get('id', '')}\x1f{item.get('content', '')}\x1e".encode("utf-8"))
+    return h.hexdigest()
 
 def build_vector_store(data_list, cache_file=None, force_refresh=False):
     if not data_list:
         return None
 
-    
+    key = _corpus_key(data_list)
+    key_file = f"{cache_file}.key" if cache_file else None
     if not force_refresh and cache_file and os.path.exists(cache_file):
         try:
             vectors = np.load(cache_file)
-            print(f"[INFO] Loaded vectors from cache: {cache_file}")
-            return vectors.astype("float32")
-        except:
-            pass
+            with open(key_file, encoding="ascii") as f:
+                cached_key = f.read().strip()
+            if len(vectors) != len(data_list) or cached_key != key:
+                # Cache ของ Corpus อื่น (เช่น ก่อน Dedup) ใช้ต่อจะได้ Vector ที่เลื่อนแถว
+                print(f"[WARN] Vector cache {cache_file} does not match the data "
+                      f"({len(vectors)} vectors vs {len(data_list)} items). Rebuilding.")
+            else:
+                print(f"[INFO] Loaded vectors from cache: {cache_file}")
+                return vectors.astype("float32")
+        except Exception as e:
+            print(f"[WARN] Vector cache {cache_file} unusable ({e}). Rebuilding.")
 
     print(f"[INFO] Building vectors for {len(data_list)} items...")
     
@@ -114,7 +235,7 @@ def build_vector_store(data_list, cache_file=None, force_refresh=False):
     for i, item in enumerate(data_list):
         content = item.get("content", "").strip()
         if content:
-            first_vec = get_embedding_remote(content)
+            first_vec = get_embedding_remote(content, use_cache=False, priority="bulk")
             if first_vec.size > 0:
                 idx_start = i
                 break
@@ -140,7 +261,7 @@ def build_vector_store(data_list, cache_file=None, force_refresh=False):
         content = data_list[i].get("content", "")
         if not content.strip(): continue 
         
-        vec = get_embedding_remote(content)
+        vec = get_embedding_remote(content, use_cache=False, priority="bulk")
         if vec.size == embed_dim:
             vectors[i] = vec
 
@@ -151,6 +272,8 @@ def build_vector_store(data_list, cache_file=None, force_refresh=False):
         np.save(temp_file, vectors)
         
         os.replace(temp_file, cache_file) 
+        with open(key_file, "w", encoding="ascii") as f:
+            f.write(key)
         
         print(f"\n[INFO] Saved and replaced cache successfully: {cache_file}")
 
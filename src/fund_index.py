@@ -0,0 +1,169 @@
+import re
+import datetime
+from typing import List, Dict, Any, Optional
+import config
+
+# คำที่บ่งบอกว่าถามสถานะ/ช่วงเวลาของทุน (ตอบได้จาก Index โดยตรง)
+STATUS_KEYWORDS = [
+    "เปิด", "ปิด", "หมดเขต", "หมดแล้ว", "สถานะ", "ยังอยู่", "ยังมี", "ช่วงเวลา",
+    "วันไหน", "เมื่อไหร่", "เมื่อไร", "ถึงวันที่", "ถึงเมื่อ", "ปีงบ", "ยุติ",
+    "deadline", "active", "open",
+]
+# คำที่บ่งบอกว่าถามขั้นตอน/คู่มือ ต้องไปทาง RAG ปกติ
+PROCEDURE_KEYWORDS = ["ขั้นตอน", "วิธี", "คู่มือ", "เอกสาร", "เบิก", "อัปโหลด", "แนบ", "กรอก"]
+
+_YEAR_RE = re.compile(r"(25\d{2}|20\d{2})")
+
+
+def _parse_date(val) -> Optional[datetime.date]:
+    s = str(val or "").strip()
+    if not s:
+        return None
+    m = re.match(r"^(\d{4})-(\d{1,2})-(\d{1,2})", s)
+    if m:
+        y, mo, d = int(m.group(1)), int(m.group(2)), int(m.group(3))
+    else:
+        m = re.match(r"^(\d{1,2})/(\d{1,2})/(\d{4})", s)
+        if not m:
+            return None
+        d, mo, y = int(m.group(1)), int(m.group(2)), int(m.group(3))
+    if y > 2400:  # ปี พ.ศ.
+        y -= 543
+    try:
+        return datetime.date(y, mo, d)
+    except ValueError:
+        return None
+
+
+def _to_be_year(year: str) -> str:
+    y = int(year)
+    return str(y + 543) if y < 2400 else str(y)
+
+
+class FundIndex:
+    """Index แบบมีโครงสร้างของทุนวิจัย (สร้างจาก Chunk 'fund:' ที่โหลดแล้ว)"""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self.by_abbr: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_name: Dict[str, List[Dict[str, Any]]] = {}
+
+        for rec in records:
+            if rec["abbr"]:
+                self.by_abbr.setdefault(rec["abbr"].lower(), []).append(rec)
+            if rec["name"]:
+                self.by_name.setdefault(rec["name"].lower(), []).append(rec)
+
+        # Regex เดียวสำหรับทุกตัวย่อ (ตัวยาวก่อน เพื่อไม่ให้ 'FF' ชนะ 'FFX')
+        abbrs = sorted(self.by_abbr.keys(), key=len, reverse=True)
+        self._abbr_re = None
+        if abbrs:
+            alt = "|".join(re.escape(a) for a in abbrs)
+            self._abbr_re = re.compile(rf"(?<![a-z0-9])({alt})(?![a-z0-9])")
+        self._names = sorted(self.by_name.keys(), key=len, reverse=True)
+
+    @classmethod
+    def from_knowledge(cls, all_data: List[Dict[str, Any]]) -> "FundIndex":
+        records = []
+        for item in all_data or []:
+            if not str(item.get("id", "")).startswith("fund:"):
+                continue
+            meta = item.get("metadata", {}) or {}
+            # Chunk ที่รวมจากหลายทุน/หลายปีงบ (dedup) มี metadata ของแต่ละชิ้นใน variants
+            for m in [meta] + list(meta.get("variants") or []):
+                records.append({
+                    "id": m.get("id") or item.get("id"),
+                    "abbr": str(m.get("fund_abbr") or "").strip(),
+                    "name": str(m.get("fund_name") or m.get("source") or "").strip(),
+                    "fiscal_year": str(m.get("fiscal_year") or "").strip(),
+                    "status": str(m.get("status") or "inactive"),
+                    "agency": str(m.get("source_agency") or ""),
+                    "start": _parse_date(m.get("start_period")),
+                    "end": _parse_date(m.get("end_period")),
+                })
+        print(f"[INFO] Fund Index built: {len(records)} records.")
+        return cls(records)
+
+    # Lookup
+
+    def find_in_query(self, query: str) -> List[Dict[str, Any]]:
+        q = (query or "").lower()
+        hits = []
+        if self._abbr_re:
+            for m in self._abbr_re.finditer(q):
+                hits.extend(self.by_abbr[m.group(1)])
+        for name in self._names:
+            if len(name) > 3 and name in q:
+                hits.extend(self.by_name[name])
+        # กัน Record ซ้ำ
+        seen = set()
+        uniq = []
+        for r in hits:
+            if r["id"] not in seen:
+                seen.add(r["id"])
+                uniq.append(r)
+        return uniq
+
+    def status_of(self, rec: Dict[str, Any], today: Optional[datetime.date] = None) -> str:
+        """คืนค่า 'open' / 'not_started' / 'expired' / 'inactive'"""
+        today = today or datetime.date.today()
+        if rec["status"] != "active":
+            return "inactive"
+        if rec["start"] and today < rec["start"]:
+            return "not_started"
+        if rec["end"] and today > rec["end"]:
+            return "expired"
+        return "open"
+
+    # Fast Path
+
+    def is_fund_query(self, query: str) -> bool:
+        q = (query or "").lower()
+        if any(k in q for k in PROCEDURE_KEYWORDS):
+            return False
+        if not any(k in q for k in STATUS_KEYWORDS):
+            return False
+        return bool(self.find_in_query(q))
+
+    def answer(self, query: str, today: Optional[datetime.date] = None) -> Optional[str]:
+        recs = self.find_in_query(query)
+        if not recs:
+            return None
+        today = today or datetime.date.today()
+
+        m = _YEAR_RE.search(query or "")
+        if m:
+            fy = _to_be_year(m.group(1))
+            recs = [r for r in recs if r["fiscal_year"] in (m.group(1), fy)]
+            if not recs:
+                return None
+        else:
+            # ไม่ระบุปี: ใช้ปีงบล่าสุดของแต่ละทุน
+            latest = {}
+            for r in recs:
+                cur = latest.get(r["abbr"] or r["name"])
+                if cur is None or r["fiscal_year"] > cur["fiscal_year"]:
+                    latest[r["abbr"] or r["name"]] = r
+            recs = list(latest.values())
+
+        labels = {
+            "open": "🟢 เปิดรับอยู่",
+            "not_started": "🟡 ยังไม่ถึงช่วงเปิดรับ",
+            "expired": "🔴 หมดเขตแล้ว",
+            "inactive": "🔴 ยุติการทำงาน",
+        }
+        lines = []
+        for r in recs:
+            state = self.status_of(r, today)
+            lines.append(f"ทุนวิจัย: **{r['name']} ({r['abbr']})**")
+            lines.append(f"- ปีงบประมาณ: {r['fiscal_year']}")
+            lines.append(f"- สถานะ: {labels[state]}")
+            if r["start"] or r["end"]:
+                start = config.format_thai_date(r["start"]) if r["start"] else "-"
+                end = config.format_thai_date(r["end"]) if r["end"] else "-"
+                lines.append(f"- ช่วงเวลา: {start} ถึง {end}")
+            if r["agency"]:
+                lines.append(f"- แหล่งทุน: {r['agency']}")
+            lines.append("")
+        lines.append(f"(ข้อมูล ณ วันที่ {config.format_thai_date(today)})")
+        return "\n".join(lines).strip()
@@ -0,0 +1,121 @@
+"""
+งบ Token ของการสร้างคำตอบ + หยุด Stream ก่อนกำหนด
+
+- generation_budget: max_tokens ตาม Intent/ความกว้างของคำถาม และขนาด Context (คำตอบไม่ยาวเกิน Context มากนัก)
+- rewrite_budget: max_tokens ของ Rewriter (1 บรรทัดต่อ Sub-query)
+- StreamMonitor: ตรวจ Token ที่ไหลเข้ามา แล้วสั่งหยุดเมื่อ
+    * คำตอบเป็นข้อความปฏิเสธสำเร็จรูป (ไม่มีอะไรต้องสร้างต่อ)
+    * Model เริ่มวนซ้ำข้อความเดิม
+    * Model หลุดไปเป็นภาษาจีน (ซึ่งถูกกรองทิ้งอยู่แล้ว) ต่อเนื่องกันหลาย Chunk
+  การปิด Stream ทำให้ Server หยุดสร้าง Token ที่จะถูกทิ้งอยู่ดี
+"""
+import re
+import threading
+from typing import Dict, Optional, Tuple
+import config
+
+# ข้อความปฏิเสธสำเร็จรูปจาก STATIC_SYS_PROMPT
+CANNED_REFUSALS = (
+    "ไม่พบข้อมูลในระบบฐานความรู้ค่ะ",
+    "ขออภัยค่ะ น้องทุนไม่สามารถตอบได้ค่ะ",
+)
+CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+# Rewriter ตอบบรรทัดเดียว: หยุดที่ขึ้นบรรทัดใหม่ (Multi-query: หยุดที่บรรทัดว่าง)
+REWRITE_STOP = ["\n"]
+REWRITE_MULTI_STOP = ["\n\n"]
+
+
+def rewrite_budget(max_queries: int = 1) -> int:
+    return config.REWRITE_MAX_TOKENS * max(1, max_queries)
+
+
+def generation_budget(intent: str, context_tokens: int, broad: bool = False) -> int:
+    """max_tokens ของคำตอบ: ฐาน + สัดส่วนของ Context (ขอทั้งกระบวนการได้งบเต็ม)"""
+    if broad:
+        return config.GEN_MAX_TOKENS
+    if intent == "FUND":
+        # สถานะ/ช่วงเวลาของทุน ตอบสั้นเสมอ
+        return config.GEN_MIN_TOKENS
+    budget = config.GEN_MIN_TOKENS + int(context_tokens * config.GEN_CONTEXT_RATIO)
+    return max(config.GEN_MIN_TOKENS, min(config.GEN_MAX_TOKENS, budget))
+
+
+class StreamMonitor:
+    """
+    feed(chunk) -> (ข้อความที่ส่งต่อได้, เหตุผลที่ต้องหยุด หรือ None)
+    Chunk ที่มีตัวอักษรจีนถูกทิ้ง (เหมือน Filter เดิม)
+    """
+
+    def __init__(self, repeat_window: Optional[int] = None, repeat_count: Optional[int] = None,
+                 cjk_chunks: Optional[int] = None):
+        self.repeat_window = repeat_window or config.GEN_REPEAT_WINDOW
+        self.repeat_count = repeat_count or config.GEN_REPEAT_COUNT
+        self.cjk_chunks = cjk_chunks or config.GEN_CJK_STOP_CHUNKS
+        self.text = ""
+        self.cjk_run = 0
+        self.dropped = 0
+        self.reason: Optional[str] = None
+
+    def feed(self, chunk: str) -> Tuple[str, Optional[str]]:
+        if CJK_RE.search(chunk):
+            self.dropped += 1
+            self.cjk_run += 1
+            if self.cjk_run >= self.cjk_chunks:
+                return "", self._stop("cjk")
+            return "", None
+        self.cjk_run = 0
+        self.text += chunk
+
+        stripped = self.text.strip()
+        if stripped in CANNED_REFUSALS:
+            return chunk, self._stop("refusal")
+        if self._repeating():
+            return "", self._stop("repetition")
+        return chunk, None
+
+    def _repeating(self) -> bool:
+        # ท้ายข้อความ (repeat_window ตัวอักษร) เคยปรากฏมาแล้วอย่างน้อย repeat_count-1 ครั้ง
+        w = self.repeat_window
+        if len(self.text) < w * self.repeat_count:
+            return False
+        tail = self.text[-w:]
+        if not tail.strip():
+            return False
+        return self.text.count(tail) >= self.repeat_count
+
+    def _stop(self, reason: str) -> str:
+        self.reason = reason
+        with _LOCK:
+            STOPS[reason] = STOPS.get(reason, 0) + 1
+        print(f"   [Generation] early stop: {reason} ({len(self.text)} chars, {self.dropped} CJK chunks dropped)")
+        return reason
+
+    def cleaned(self) -> str:
+        """ข้อความสุดท้าย (ตัดส่วนที่วนซ้ำทิ้งถ้าหยุดเพราะ repetition)"""
+        if self.reason != "repetition":
+            return self.text
+        tail = self.text[-self.repeat_window:]
+        return self.text[:self.text.find(tail) + len(tail)]
+
+
+def close_stream(stream) -> bool:
+    """
+    ปิด Stream ของ Backend (OpenAI Stream / LLMRouter.stream) ให้ Server หยุดสร้าง Token ทันที
+    คืน False และเตือนถ้า Stream ปิดไม่ได้ (หยุดแค่การอ่าน แต่ Server ยังสร้างจนครบ max_tokens)
+    """
+    close = getattr(stream, "close", None)
+    if close is None:
+        print(f"[WARN] Stream {type(stream).__name__} has no close(); backend keeps generating until max_tokens")
+        return False
+    try:
+        close()
+    except Exception as e:
+        print(f"[WARN] Stream close failed: {e}")
+        return False
+    return True
+
+
+# สถิติการหยุดก่อนกำหนด (ทั้ง Process)
+STOPS: Dict[str, int] = {}
+_LOCK = threading.Lock()
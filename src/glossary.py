@@ -0,0 +1,111 @@
+import re
+from typing import List, Dict, Any, Optional
+from .keyword_automaton import KeywordAutomaton
+
+# รูปประโยคถามความหมาย
+DEFINE_PATTERNS = [
+    "คืออะไร", "คือ อะไร", "หมายถึงอะไร", "หมายถึง", "แปลว่าอะไร", "แปลว่า", "ย่อมาจากอะไร", "ย่อมาจาก",
+    "ความหมายของ", "ความหมาย", "what is", "meaning of", "meaning",
+]
+# คำที่ตัดทิ้งได้เมื่อตรวจว่าเป็นคำถามนิยามล้วนๆ
+_FILLER_WORDS = ["คำว่า", "ครับ", "ค่ะ", "คะ", "คับ", "นะ", "หน่อย", "ขอ", "อยากรู้", "บอก", "ของ", "คือ", "ว่า"]
+_FILLER_RE = re.compile(r"[\s?!.,:\"'()\-]+")
+_MEANING_MARK = "ความหมาย:"
+
+
+def _is_ascii_word(word: str) -> bool:
+    return bool(re.fullmatch(r"[a-z0-9][a-z0-9 ._\-]*", word))
+
+
+class Glossary:
+    """
+    Matcher คำศัพท์ (Aho-Corasick) สร้างตอนโหลด Knowledge Base (สร้างใหม่ทุกครั้งที่ Sync)
+    รวมคำใน glossary_terms + ตัวย่อทุนวิจัย หาได้ทุกคำในคำถามด้วยการอ่านครั้งเดียว
+    - คำถามนิยามล้วนๆ ("RPA คืออะไร") ตอบจาก Glossary ได้ทันที ไม่ต้อง Rewrite/Embedding
+    - คำถามอื่นที่มีคำศัพท์ แนบความหมายสั้นๆ ต่อท้าย Query ก่อน Embed
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.automaton = KeywordAutomaton(
+            ((e["word"], e) for e in entries if len(e["word"]) >= 2), lowercase=True
+        )
+        self._define = KeywordAutomaton(((p, None) for p in DEFINE_PATTERNS), lowercase=True)
+        print(f"[INFO] Glossary automaton built: {self.automaton.size} terms.")
+
+    @classmethod
+    def from_knowledge(cls, all_data, fund_index=None) -> "Glossary":
+        entries, seen = [], set()
+        for item in all_data or []:
+            if not str(item.get("id", "")).startswith("glossary:"):
+                continue
+            meta = item.get("metadata", {}) or {}
+            keywords = meta.get("keywords") or ()
+            word = str(keywords[0] if keywords else "").strip()
+            content = str(item.get("content", "") or "")
+            meaning = content.split(_MEANING_MARK, 1)[1].strip() if _MEANING_MARK in content else ""
+            if word and meaning and word.lower() not in seen:
+                seen.add(word.lower())
+                entries.append({"word": word, "meaning": meaning, "kind": str(meta.get("source") or "คำศัพท์"),
+                                "source": str(meta.get("source") or "") or None})
+
+        # ตัวย่อทุนวิจัย -> ชื่อเต็ม
+        for rec in (fund_index.records if fund_index is not None else []):
+            abbr = rec.get("abbr") or ""
+            if abbr and rec.get("name") and abbr.lower() not in seen:
+                seen.add(abbr.lower())
+                meaning = rec["name"] + (f" (แหล่งทุน: {rec['agency']})" if rec.get("agency") else "")
+                entries.append({"word": abbr, "meaning": meaning, "kind": "ตัวย่อทุนวิจัย", "source": rec["name"]})
+        return cls(entries)
+
+    def match(self, text: str) -> List[Dict[str, Any]]:
+        """คำศัพท์ทั้งหมดในข้อความ (เลือกคำที่ยาวที่สุดเมื่อซ้อนกัน, คำภาษาอังกฤษต้องไม่อยู่กลางคำอื่น)"""
+        low = (text or "").lower()
+        hits = []
+        for start, end, word, entry in self.automaton.find_all(low):
+            if _is_ascii_word(word):
+                before = low[start - 1] if start > 0 else " "
+                after = low[end] if end < len(low) else " "
+                if before.isascii() and before.isalnum() or after.isascii() and after.isalnum():
+                    continue
+            hits.append((start, end, entry))
+
+        hits.sort(key=lambda h: (-(h[1] - h[0]), h[0]))
+        taken, result = [], []
+        for start, end, entry in hits:
+            if any(start < e and s < end for s, e in taken):
+                continue
+            taken.append((start, end))
+            result.append((start, entry))
+        return [entry for _, entry in sorted(result, key=lambda r: r[0])]
+
+    def is_definition_query(self, text: str) -> bool:
+        """คำถามที่มีแค่คำศัพท์ + รูปประโยคถามความหมาย (ไม่มีเนื้อหาอื่น)"""
+        low = (text or "").lower()
+        if not self._define.contains_any(low):
+            return False
+        terms = self.match(low)
+        if not terms:
+            return False
+        rest = low
+        for word in sorted([t["word"].lower() for t in terms] + DEFINE_PATTERNS + _FILLER_WORDS, key=len, reverse=True):
+            rest = rest.replace(word, " ")
+        return not _FILLER_RE.sub("", rest)
+
+    def answer(self, text: str) -> Optional[str]:
+        if not self.is_definition_query(text):
+            return None
+        lines = [f"**{t['word']}** ({t['kind']})\n\nความหมาย: {t['meaning']}" for t in self.match(text)]
+        return "\n\n".join(lines) + "\n\nหากต้องการขั้นตอนการใช้งานที่เกี่ยวข้อง สอบถามเพิ่มเติมได้เลยค่ะ"
+
+    def sources(self, text: str) -> Optional[str]:
+        names = sorted({t["source"] for t in self.match(text) if t.get("source")})
+        return ", ".join(names) or None
+
+    def expand(self, query: str, max_chars: int = 80) -> str:
+        """แนบความหมายของคำศัพท์ที่พบต่อท้าย Query (ใช้ก่อน Embed)"""
+        terms = self.match(query)
+        if not terms:
+            return query
+        notes = "; ".join(f"{t['word']} = {t['meaning'][:max_chars]}" for t in terms)
+        return f"{query} ({notes})"
@@ -0,0 +1,81 @@
+from collections import deque
+from typing import List, Dict, Tuple, Iterable, Optional, Any
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick: หา Keyword ทั้งหมดในข้อความด้วยการอ่านครั้งเดียว (linear)
+    ไม่พึ่ง Word Boundary จึงใช้กับภาษาไทยที่ไม่มีช่องว่างระหว่างคำได้
+    แต่ละ Keyword มี payload แนบได้ (เช่น ประเภทของคำ)
+    """
+
+    def __init__(self, keywords: Optional[Iterable[Tuple[str, Any]]] = None, lowercase: bool = True):
+        self.lowercase = lowercase
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[List[Tuple[str, Any]]] = [[]]
+        self._out: List[List[Tuple[str, Any]]] = [[]]
+        self._built = False
+        self.size = 0
+        for word, payload in keywords or []:
+            self.add(word, payload)
+        self.build()
+
+    def add(self, word: str, payload: Any = None) -> None:
+        word = (word or "").strip()
+        if self.lowercase:
+            word = word.lower()
+        if not word:
+            return
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            node = nxt
+        self._own[node].append((word, payload))
+        self.size += 1
+        self._built = False
+
+    def build(self) -> None:
+        # BFS สร้าง Failure Link (สร้างใหม่ได้เสมอหลัง add เพิ่ม)
+        self._out = [list(o) for o in self._own]
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str, Any]]:
+        """คืนค่า [(start, end, keyword, payload), ...] ตามลำดับตำแหน่งที่จบ"""
+        if not self._built:
+            self.build()
+        if self.lowercase:
+            text = (text or "").lower()
+        hits = []
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text or ""):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for word, payload in out[node]:
+                    hits.append((i - len(word) + 1, i + 1, word, payload))
+        return hits
+
+    def contains_any(self, text: str) -> bool:
+        return bool(self.find_all(text))
@@ -0,0 +1,33 @@
+import weakref
+from typing import List, Dict, Any, Optional
+import numpy as np
+import config
+from . import records, reduction
+from .fund_index import FundIndex
+from .metadata_index import MetadataIndex
+from .step_index import StepIndex
+from .glossary import Glossary
+from .domain_gate import build_centroids
+
+
+# Knowledge Base ทุกรุ่นที่ยังอยู่ใน Memory (รุ่นเก่าค้างใน st.cache_resource ระหว่าง Sync) ใช้ใน memory_report
+LIVE = weakref.WeakSet()
+
+
+class KnowledgeBase:
+    """รวมข้อมูลที่โหลดแล้วและ Index ที่สร้างตอนโหลด (ใช้ร่วมกันทุก Session แบบอ่านอย่างเดียว)"""
+
+    def __init__(self, data: List[Dict[str, Any]], vectors: Optional[np.ndarray], version: Optional[str] = None):
+        # Record แบบอ่านอย่างเดียว แชร์ข้าม Session ได้โดยไม่ต้อง Lock
+        self.data = records.compact(data)
+        data = self.data
+        self.vectors = vectors
+        self.version = version
+        self.fund_index = FundIndex.from_knowledge(data)
+        self.glossary = Glossary.from_knowledge(data, self.fund_index)
+        self.meta_index = MetadataIndex(data)
+        self.step_index = StepIndex(data)
+        self.domain_centroids = build_centroids(vectors, k=config.DOMAIN_CENTROIDS)
+        # Vector ลดมิติสำหรับสแกน (None = ค้นด้วย Vector เต็มตามเดิม)
+        self.reduced = reduction.build(vectors)
+        LIVE.add(self)
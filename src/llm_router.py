@@ -0,0 +1,297 @@
+"""
+LLM Router: ถือ Backend ทั้ง UNI และ CLOUD พร้อมกัน แล้วเลือกตาม Latency/Error/Slot ว่าง
+
+- คำขอแบบไม่ Stream (เช่น rewrite_query) -> Backend ที่เร็วที่สุดตอนนี้
+- คำขอแบบ Stream (Generation) -> Backend หลักตาม ACTIVE_MODE ถ้ายังมี Slot และสุขภาพดี
+  ถ้า Token แรกช้ากว่า LLM_HEDGE_AFTER วินาที จะยิง Backend สำรองคู่ขนาน (Hedge) แล้วใช้ตัวที่ตอบก่อน
+- แต่ละ Backend มี Semaphore จำกัดจำนวนคำขอพร้อมกัน เมื่อเต็มจะไหลไป Backend อื่น
+
+ใช้แทน OpenAI client ได้เลย: router.chat.completions.create(...) (ค่า model จะถูกแทนด้วย Model ของ Backend)
+"""
+import time
+import queue
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, Iterator
+from openai import OpenAI
+import config
+from . import rate_control
+
+
+class Backend:
+    def __init__(self, name: str, client, model: str, max_concurrency: int, window: int = 50):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)   # วินาที (Non-stream: ทั้งคำขอ, Stream: ถึง Token แรก)
+        self._errors = deque(maxlen=window)      # True = Error
+        self._consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.inflight = 0
+        # AIMD + Circuit Breaker ที่ใช้ร่วมกันทั้ง Process (ปรับ Concurrency ตามสุขภาพของ Endpoint)
+        self.outbound = rate_control.get_controller(f"llm:{name}")
+
+    # สถิติ
+
+    def record(self, latency: Optional[float], error: bool, exc: Optional[Exception] = None) -> None:
+        if error:
+            headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+            self.outbound.observe(
+                rate_control.classify_exception(exc) if exc else rate_control.OVERLOAD,
+                rate_control.parse_retry_after(headers.get("retry-after")),
+            )
+        else:
+            self.outbound.observe(rate_control.OK)
+        with self._lock:
+            self._errors.append(error)
+            if error:
+                self._consecutive_errors += 1
+                if self._consecutive_errors >= config.LLM_ERROR_STREAK:
+                    self.cooldown_until = time.time() + config.LLM_COOLDOWN_SEC
+                    print(f"[WARN] LLM backend {self.name} cooling down for {config.LLM_COOLDOWN_SEC}s")
+            else:
+                self._consecutive_errors = 0
+                if latency is not None:
+                    self._latencies.append(latency)
+
+    def latency(self) -> float:
+        with self._lock:
+            if not self._latencies:
+                return 0.0  # ยังไม่มีข้อมูล ให้โอกาสลองก่อน
+            ordered = sorted(self._latencies)
+            return ordered[len(ordered) // 2]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return (sum(self._errors) / len(self._errors)) if self._errors else 0.0
+
+    def healthy(self) -> bool:
+        return time.time() >= self.cooldown_until and self.outbound.allow()
+
+    def try_acquire(self, timeout: Optional[float] = None) -> bool:
+        if not timeout:
+            # ไม่รอ: ต้องต่ำกว่าทั้ง Limit คงที่และ Limit แบบ AIMD ของ Endpoint (เช็คและจองใน Lock เดียวกัน)
+            with self._lock:
+                if self.inflight >= self.outbound.limiter.current_limit():
+                    return False
+                ok = self.slots.acquire(blocking=False)
+                if ok:
+                    self.inflight += 1
+                return ok
+        ok = self.slots.acquire(timeout=timeout)
+        if ok:
+            with self._lock:
+                self.inflight += 1
+        return ok
+
+    def release(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+        self.slots.release()
+
+
+class LLMRouter:
+    def __init__(self, backends: List[Backend], primary: str):
+        self.backends = backends
+        self.primary = primary
+        self.chat = _Chat(self)
+
+    def _ordered(self, purpose: str) -> List[Backend]:
+        healthy = [b for b in self.backends if b.healthy()] or list(self.backends)
+        if purpose == "fast":
+            return sorted(healthy, key=lambda b: (b.error_rate() > 0.5, b.latency()))
+        # Generation: Backend หลักก่อน ตามด้วยตัวอื่นเรียงตาม Latency
+        return sorted(healthy, key=lambda b: (b.name != self.primary, b.error_rate() > 0.5, b.latency()))
+
+    def _acquire_any(self, candidates: List[Backend]) -> Optional[Backend]:
+        # Slot ว่างทันที -> ใช้เลย, ถ้าเต็มหมดรอ Backend แรกตามลำดับ
+        for b in candidates:
+            if b.try_acquire():
+                return b
+        if candidates and candidates[0].try_acquire(timeout=config.LLM_TIMEOUT):
+            return candidates[0]
+        return None
+
+    # Non-stream
+
+    def complete(self, purpose: str = "fast", **kwargs):
+        last_err = None
+        tried = set()
+        for _ in range(len(self.backends)):
+            candidates = [b for b in self._ordered(purpose) if b.name not in tried]
+            b = self._acquire_any(candidates)
+            if b is None:
+                break
+            tried.add(b.name)
+            start = time.time()
+            try:
+                kwargs["model"] = b.model
+                resp = b.client.chat.completions.create(timeout=config.LLM_TIMEOUT, **kwargs)
+                b.record(time.time() - start, False)
+                return resp
+            except Exception as e:
+                b.record(None, True, e)
+                last_err = e
+                print(f"[WARN] LLM {b.name} failed ({e}). Trying next backend...")
+            finally:
+                b.release()
+        raise last_err or RuntimeError("No LLM backend available")
+
+    # Stream + Hedge
+
+    def _stream_worker(self, b: Backend, kwargs: Dict[str, Any], events: queue.Queue, cancel: threading.Event):
+        start = time.time()
+        first = True
+        try:
+            stream = b.client.chat.completions.create(
+                **dict(kwargs, model=b.model, stream=True, timeout=config.LLM_TIMEOUT)
+            )
+            # ปิด Upstream ทันทีที่ถูกยกเลิก (ไม่ต้องรอ Chunk ถัดไป) -> Server หยุดสร้าง Token และคืน Slot
+            threading.Thread(target=self._close_on_cancel, args=(stream, cancel), daemon=True).start()
+            for chunk in stream:
+                if cancel.is_set():
+                    return
+                if first:
+                    b.record(time.time() - start, False)
+                    first = False
+                events.put((b, "chunk", chunk))
+            events.put((b, "done", None))
+        except Exception as e:
+            if not cancel.is_set():
+                b.record(None, True, e)
+            events.put((b, "error", e))
+        finally:
+            cancel.set()  # ปลุก Thread ที่รอปิด Stream
+            b.release()
+
+    @staticmethod
+    def _close_on_cancel(stream, cancel: threading.Event) -> None:
+        cancel.wait()
+        try:
+            stream.close()
+        except Exception:
+            pass
+
+    def stream(self, purpose: str = "generate", **kwargs) -> Iterator[Any]:
+        candidates = self._ordered(purpose)
+        events: queue.Queue = queue.Queue()
+        cancels: Dict[str, threading.Event] = {}
+        pending = list(candidates)
+
+        def launch(wait: bool) -> bool:
+            while pending:
+                b = pending.pop(0)
+                ok = b.try_acquire(timeout=config.LLM_TIMEOUT) if wait else b.try_acquire()
+                if ok:
+                    cancels[b.name] = threading.Event()
+                    threading.Thread(
+                        target=self._stream_worker, args=(b, kwargs, events, cancels[b.name]), daemon=True
+                    ).start()
+                    return True
+            return False
+
+        if not launch(wait=False):
+            # ทุก Backend เต็ม -> รอ Backend หลัก
+            pending.extend(candidates)
+            if not launch(wait=True):
+                raise RuntimeError("No LLM backend available")
+
+        try:
+            yield from self._relay(events, cancels, pending, launch)
+        finally:
+            # ผู้ใช้ปิด Stream (.close() / หยุดอ่าน / Error) -> ยกเลิกทุก Backend รวมถึงตัวที่ชนะ
+            for ev in cancels.values():
+                ev.set()
+
+    def _relay(self, events: queue.Queue, cancels: Dict[str, threading.Event], pending: List[Backend],
+               launch) -> Iterator[Any]:
+        winner = None
+        running = 1
+        deadline = time.time() + config.LLM_HEDGE_AFTER
+        while winner is None:
+            timeout = max(0.05, deadline - time.time()) if pending else config.LLM_TIMEOUT
+            try:
+                b, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                if pending and launch(wait=False):
+                    running += 1
+                    print(f"   [Router] First token slow (> {config.LLM_HEDGE_AFTER}s). Hedging to another backend.")
+                deadline = time.time() + config.LLM_HEDGE_AFTER
+                continue
+
+            if kind == "chunk":
+                winner = b
+                for name, ev in cancels.items():
+                    if name != b.name:
+                        ev.set()
+                yield payload
+            elif kind == "error":
+                running -= 1
+                last_err = payload
+                print(f"[WARN] LLM {b.name} stream failed ({payload}). Failing over...")
+                if running == 0:
+                    if not launch(wait=False):
+                        raise last_err
+                    running = 1
+            elif kind == "done":
+                # ตอบจบโดยไม่มี Token เลย
+                winner = b
+                return
+
+        while True:
+            b, kind, payload = events.get(timeout=config.LLM_TIMEOUT)
+            if b is not winner:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise payload
+
+
+class _Completions:
+    def __init__(self, router: LLMRouter):
+        self._router = router
+
+    def create(self, route: Optional[str] = None, **kwargs):
+        # รองรับรูปแบบเดียวกับ OpenAI client (stream=True คืน Iterator ของ chunk)
+        if kwargs.pop("stream", False):
+            return self._router.stream(purpose=route or "generate", **kwargs)
+        return self._router.complete(purpose=route or "fast", **kwargs)
+
+
+class _Chat:
+    def __init__(self, router: LLMRouter):
+        self.completions = _Completions(router)
+
+
+def build_client(wrap=None):
+    """
+    สร้าง Client สำหรับ Generation/Rewrite (LLMRouter เสมอ)
+    - มีทั้ง UNI และ CLOUD และเปิด LLM_ROUTER -> Router 2 Backend (Hedge/Failover)
+    - ไม่เช่นนั้น -> Router 1 Backend ตาม ACTIVE_MODE (ยังได้ AIMD Limit, Retry-After และ Circuit Breaker)
+    wrap: ฟังก์ชันห่อ Client (เช่น langsmith.wrappers.wrap_openai)
+    """
+    wrap = wrap or (lambda c: c)
+    backends = []
+    if config.UNI_URL and config.UNI_MODEL:
+        backends.append(Backend("UNI", wrap(OpenAI(api_key=config.UNI_KEY, base_url=config.UNI_URL)),
+                                config.UNI_MODEL, config.UNI_MAX_CONCURRENCY))
+    if config.CLOUD_URL and config.CLOUD_MODEL:
+        backends.append(Backend("CLOUD", wrap(OpenAI(api_key=config.CLOUD_KEY, base_url=config.CLOUD_URL)),
+                                config.CLOUD_MODEL, config.CLOUD_MAX_CONCURRENCY))
+
+    primary = "UNI" if config.ACTIVE_MODE == "UNI" else "CLOUD"
+    if not config.LLM_ROUTER or len(backends) < 2:
+        limit = config.UNI_MAX_CONCURRENCY if primary == "UNI" else config.CLOUD_MAX_CONCURRENCY
+        backend = Backend(primary, wrap(OpenAI(api_key=config.CURRENT_KEY, base_url=config.CURRENT_URL)),
+                          config.CURRENT_MODEL, limit)
+        print(f"[INFO] LLM client: single backend {primary} with outbound rate control")
+        return LLMRouter([backend], primary)
+
+    print(f"[INFO] LLM Router enabled: {[b.name for b in backends]} (primary={primary})")
+    return LLMRouter(backends, primary)
@@ -0,0 +1,407 @@
+"""
+Load Test: จำลองผู้ใช้หลาย Session พร้อมกันผ่าน Pipeline จริงของ app.py
+(analyze_intent -> rewrite -> retrieval -> rerank -> streamed generation -> save_chat_log)
+
+ค่าเริ่มต้นใช้ Endpoint จำลองในเครื่อง (ไม่แตะ Server จริง):
+- LLM: OpenAI-compatible /v1/chat/completions (Stream ทีละ Token ตาม --ttft-ms / --token-ms)
+- Embedding: Vector จาก Hash ของ Trigram (ข้อความคล้ายกัน -> Vector คล้ายกัน) ตาม --embed-ms
+- DB: Connection จำลองให้ save_chat_log (หน่วง --db-ms)
+Knowledge Base ใช้ Chunk จาก Snapshot ถ้ามี (Embed ใหม่ด้วย Embedding จำลอง) ไม่เช่นนั้นสร้างคู่มือจำลอง
+
+ตัวอย่าง:
+    python -m src.loadtest --levels 1,4,8,16 --duration 60 --think 8
+    python -m src.loadtest --queries questions.txt --levels 8 --json result.json
+    python -m src.loadtest --from-logs --real      # Endpoint จริงตาม .env (DB จริงด้วยถ้าใส่ --real-db)
+    python -m src.loadtest --router                # ผ่าน LLMRouter (2 Backend จำลอง) เหมือน app.py
+
+ทุกระดับรายงานจำนวน Stream ที่ StreamMonitor หยุดก่อนกำหนด เทียบกับจำนวน Stream ที่ Server จำลองเห็นว่าถูกตัด
+(ถ้าน้อยกว่า = การปิด Stream ไม่ได้หยุด Backend จริง)
+"""
+import io
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import numpy as np
+import config
+from . import data_loader, embedding, rag_engine, pipeline, coalesce, snapshot, generation
+from .knowledge_base import KnowledgeBase
+
+DEFAULT_QUERIES = [
+    "ขอคู่มือการขอเบิกเงินทดรองจ่าย",
+    "เข้าสู่ระบบไม่ได้",
+    "อัปโหลดใบเสร็จยังไง",
+    "ส่งรายงานความก้าวหน้าที่เมนูไหน",
+    "แก้ไขข้อมูลโครงการหลังส่งแล้วได้ไหม",
+    "ทุนที่ยังเปิดรับมีอะไรบ้าง",
+    "รหัสใบเสร็จRPA คืออะไร",
+    "ขั้นตอนการปิดโครงการ",
+]
+BLOCK_MSG = "ขออภัยค่ะ น้องทุนตอบเฉพาะเรื่องงานวิจัยและระบบเบิกจ่ายค่ะ"
+_ANSWER_WORDS = ["กด", "เมนู", "**บันทึก**", "แล้ว", "เลือก", "ขั้นตอน", "ระบบ", "เอกสาร", "ยืนยัน", "ค่ะ"]
+
+
+# Stand-in Endpoints
+
+def standin_vector(text: str, dim: int) -> np.ndarray:
+    """Hashing Trick ของ Character Trigram (Deterministic, ข้อความคล้ายกันได้ Cosine สูง)"""
+    vec = np.zeros(dim, dtype="float32")
+    t = f"  {text or ''} "
+    for i in range(len(t) - 2):
+        h = int.from_bytes(hashlib.blake2b(t[i:i + 3].encode("utf-8"), digest_size=4).digest(), "little")
+        vec[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    n = np.linalg.norm(vec)
+    return vec / n if n else vec
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    opts: Dict[str, Any] = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, body: Dict[str, Any]) -> None:
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            self._chat(req)
+        else:
+            self._embed(req)
+
+    def _embed(self, req):
+        texts = req.get("input")
+        texts = texts if isinstance(texts, list) else [texts]
+        time.sleep(self.opts["embed_ms"] / 1000.0 * (1 + 0.1 * (len(texts) - 1)))
+        self._json({"data": [
+            {"index": i, "embedding": standin_vector(t, self.opts["dim"]).tolist()} for i, t in enumerate(texts)
+        ]})
+
+    def _chat(self, req):
+        msgs = req.get("messages") or []
+        last = str(msgs[-1].get("content", "")) if msgs else ""
+        base = {"id": "standin", "created": int(time.time()), "model": req.get("model") or "standin"}
+        if not req.get("stream"):
+            # Rewriter: คืนคำถามเดิมเป็น Query (1 บรรทัด)
+            time.sleep(self.opts["rewrite_ms"] / 1000.0)
+            text = last.split("User Input:", 1)[-1].strip().splitlines()[0] if last else ""
+            self._json({**base, "object": "chat.completion", "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+            ], "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}})
+            return
+
+        self._count("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        rng = random.Random(last)
+        n_tokens = min(int(req.get("max_tokens") or 512), self.opts["answer_tokens"])
+        try:
+            time.sleep(self.opts["ttft_ms"] / 1000.0)
+            for _ in range(n_tokens):
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"content": rng.choice(_ANSWER_WORDS) + " "}, "finish_reason": None}
+                ]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self._count("tokens")
+                time.sleep(self.opts["token_ms"] / 1000.0)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self._count("aborted")  # Client หยุด Stream ก่อน (StreamMonitor)
+        self.close_connection = True
+
+    def _count(self, key: str) -> None:
+        with _SERVER_LOCK:
+            SERVER_STATS[key] = SERVER_STATS.get(key, 0) + 1
+
+
+# สถิติของ Server จำลอง (streams / tokens / aborted)
+SERVER_STATS: Dict[str, int] = {}
+_SERVER_LOCK = threading.Lock()
+
+
+def start_standin_server(opts: Dict[str, Any]) -> ThreadingHTTPServer:
+    handler = type("Handler", (_StandInHandler,), {"opts": opts})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="standin-server", daemon=True).start()
+    return server
+
+
+class _StandInCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        time.sleep(self.conn.delay)
+
+    def fetchone(self):
+        with _DB_LOCK:
+            _DB_IDS[0] += 1
+            return (_DB_IDS[0],)
+
+
+class _StandInConnection:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def cursor(self, *args, **kwargs):
+        return _StandInCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+_DB_IDS = [0]
+_DB_LOCK = threading.Lock()
+
+
+def _synthetic_corpus(n_docs: int = 40, steps: int = 8) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    data = []
+    for d in range(n_docs):
+        source = f"คู่มือระบบ RPA เล่ม {d + 1}"
+        topic = rng.choice(["การเบิกเงิน", "การอัปโหลดใบเสร็จ", "การส่งรายงาน", "การเข้าสู่ระบบ", "การปิดโครงการ"])
+        for s in range(1, steps + 1):
+            body = " ".join(rng.choice(_ANSWER_WORDS) for _ in range(60))
+            data.append({
+                "id": f"manual:{d}-{s}", "type": "guide",
+                "content": f"เอกสาร: {source}\nหมวดหมู่: {topic}\nหัวข้อ: {topic} ขั้นตอนที่ {s}\nเนื้อหา:\n{body}",
+                "metadata": {"source": source, "topic": topic, "section": "", "category": topic,
+                             "category_group": "คู่มือ", "step_number": s, "fund_abbr": None},
+            })
+    return data
+
+
+# Sessions
+
+def _turn(q: str, history: List[Dict[str, str]], kb, client, sid: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    ttft, response, log_source, error, path = None, "", None, None, "pipeline"
+
+    intent = rag_engine.analyze_intent(q, kb.fund_index, kb.domain_centroids, kb.glossary)
+    fast = kb.fund_index.answer(q) if intent == "FUND" else (kb.glossary.answer(q) if intent == "DEFINE" else None)
+    if intent == "BLOCK":
+        response, path = BLOCK_MSG, "block"
+    elif fast:
+        response, path = fast, intent.lower()
+    else:
+        key = coalesce.make_key(q, kb.version, rag_engine.history_context(q, history))
+        for kind, payload in coalesce.FLIGHTS.subscribe(
+            key, lambda e: pipeline.run_turn(q, history[-3:], kb, client, sid, e, intent=intent)
+        ):
+            if kind == "token" and ttft is None:
+                ttft = time.perf_counter() - t0
+            elif kind == "final":
+                response, log_source, error = payload["response"], payload["log_source"], payload["error"]
+            elif kind == "error":
+                response, error = pipeline.GEN_ERROR_MSG, str(payload)
+        if response == pipeline.BUSY_MSG:
+            path = "busy"
+
+    data_loader.save_chat_log(session_id=sid, user_input=q, ai_response=response, source=log_source)
+    return {"latency": time.perf_counter() - t0, "ttft": ttft, "error": error, "path": path, "response": response}
+
+
+def _session(idx: int, queries: List[str], think: float, start_at: float, deadline: float,
+             kb, client, results: List[Dict[str, Any]], lock: threading.Lock) -> None:
+    rng = random.Random(idx)
+    sid = f"load-{idx:03d}"
+    history: List[Dict[str, str]] = []
+    # เริ่มไม่พร้อมกัน (กระจายภายในช่วง Think Time แรก)
+    time.sleep(max(0.0, start_at - time.time()) + rng.uniform(0, think))
+    while time.time() < deadline:
+        q = rng.choice(queries)
+        try:
+            turn = _turn(q, history, kb, client, sid)
+        except Exception as e:
+            turn = {"latency": 0.0, "ttft": None, "error": str(e), "path": "exception", "response": ""}
+        with lock:
+            results.append(turn)
+        history = (history + [{"role": "user", "content": q}, {"role": "assistant", "content": turn["response"]}])[-6:]
+        pause = rng.expovariate(1.0 / think) if think > 0 else 0.0
+        time.sleep(max(0.0, min(pause, deadline - time.time())))
+
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    return round(float(np.percentile(values, p)), 3) if values else None
+
+
+def run_level(n_sessions: int, duration: float, think: float, queries: List[str], kb, client,
+              quiet: bool = True) -> Dict[str, Any]:
+    # ล้าง Cache ระหว่างระดับ เพื่อไม่ให้ระดับหลังได้เปรียบจาก Cache ของระดับก่อน
+    embedding._EMBED_CACHE.clear()
+    rag_engine._REWRITE_CACHE.clear()
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    stops_before = sum(generation.STOPS.values())
+    server_before = dict(SERVER_STATS)
+    start = time.time()
+    deadline = start + duration
+    threads = [
+        threading.Thread(target=_session, name=f"load-{i}", daemon=True,
+                         args=(i, queries, think, start, deadline, kb, client, results, lock))
+        for i in range(n_sessions)
+    ]
+    sink = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext():
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.time() - start
+    time.sleep(0.5)  # ให้ Server จำลองเห็น Connection ที่ถูกปิดท้ายสุด
+    server = {k: v - server_before.get(k, 0) for k, v in SERVER_STATS.items()}
+
+    ok = [r for r in results if not r["error"] and r["path"] not in ("busy", "exception")]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    lats = [r["latency"] for r in ok]
+    paths: Dict[str, int] = {}
+    for r in results:
+        paths[r["path"]] = paths.get(r["path"], 0) + 1
+    return {
+        "sessions": n_sessions, "turns": len(results), "seconds": round(elapsed, 1),
+        "throughput": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "errors": sum(1 for r in results if r["error"]), "paths": paths,
+        "ttft_p50": _pct(ttfts, 50), "ttft_p95": _pct(ttfts, 95), "ttft_p99": _pct(ttfts, 99),
+        "latency_p50": _pct(lats, 50), "latency_p95": _pct(lats, 95), "latency_p99": _pct(lats, 99),
+        "early_stops": sum(generation.STOPS.values()) - stops_before,
+        "server_streams": server.get("streams", 0), "server_aborted": server.get("aborted", 0),
+        "server_tokens": server.get("tokens", 0),
+    }
+
+
+# CLI
+
+def _load_queries(args) -> List[str]:
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    if args.from_logs:
+        top = data_loader.fetch_top_questions(args.log_limit, 0.0)
+        if top:
+            return top
+        print("[WARN] No questions from chat_logs. Using built-in questions.")
+    return list(DEFAULT_QUERIES)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.loadtest", description="Concurrent-session load generator")
+    parser.add_argument("--levels", default="1,4,8,16", help="Concurrent sessions per level (comma separated)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per level")
+    parser.add_argument("--think", type=float, default=8.0, help="Mean think time between turns (seconds)")
+    parser.add_argument("--queries", default=None, help="Text file, one question per line")
+    parser.add_argument("--from-logs", action="store_true", help="Draw questions from chat_logs")
+    parser.add_argument("--log-limit", type=int, default=200)
+    parser.add_argument("--snapshot", default=config.SNAPSHOT_PATH)
+    parser.add_argument("--real", action="store_true", help="Use the configured LLM/embedding endpoints")
+    parser.add_argument("--real-db", action="store_true", help="Write chat logs to the configured DB")
+    parser.add_argument("--router", action="store_true",
+                        help="Route generation through LLMRouter with two stand-in backends (as app.py does)")
+    parser.add_argument("--dim", type=int, default=1024, help="Stand-in embedding width")
+    parser.add_argument("--embed-ms", type=float, default=30.0)
+    parser.add_argument("--rewrite-ms", type=float, default=300.0)
+    parser.add_argument("--ttft-ms", type=float, default=400.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--answer-tokens", type=int, default=250)
+    parser.add_argument("--db-ms", type=float, default=15.0)
+    parser.add_argument("--keep-gates", action="store_true",
+                        help="Keep domain gate and score thresholds with stand-in embeddings")
+    parser.add_argument("--verbose", action="store_true", help="Keep pipeline logs")
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    queries = _load_queries(args)
+    loaded = snapshot.load_snapshot(args.snapshot)
+    data = loaded[0] if loaded else _synthetic_corpus()
+
+    if args.real:
+        from . import llm_router
+        client = llm_router.build_client()
+        vectors = loaded[1] if loaded else embedding.build_vector_store(data)
+    else:
+        server = start_standin_server({
+            "dim": args.dim, "embed_ms": args.embed_ms, "rewrite_ms": args.rewrite_ms,
+            "ttft_ms": args.ttft_ms, "token_ms": args.token_ms, "answer_tokens": args.answer_tokens,
+        })
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"[INFO] Stand-in LLM/embedding server at {base_url}")
+        from openai import OpenAI
+        config.UNI_EMBED_URL = f"{base_url}/embed"
+        config.CURRENT_MODEL = config.CURRENT_MODEL or "standin"
+        if args.router:
+            from . import llm_router
+            client = llm_router.LLMRouter([
+                llm_router.Backend(name, OpenAI(api_key="loadtest", base_url=f"{base_url}/v1"),
+                                   config.CURRENT_MODEL, limit)
+                for name, limit in (("UNI", config.UNI_MAX_CONCURRENCY), ("CLOUD", config.CLOUD_MAX_CONCURRENCY))
+            ], "UNI")
+        else:
+            client = OpenAI(api_key="loadtest", base_url=f"{base_url}/v1")
+        vectors = np.stack([standin_vector(item["content"], args.dim) for item in data]).astype("float32")
+        if not args.keep_gates:
+            # คะแนนจาก Embedding จำลองไม่มีความหมายเชิงเนื้อหา: ปิด Domain Gate และ Threshold
+            # ให้ทุกคำถามวิ่งครบ Pipeline (รวม Generation)
+            config.DOMAIN_CHECK = False
+            config.get_threshold = lambda item_type: 0.0
+
+    if not args.real_db:
+        delay = args.db_ms / 1000.0
+        data_loader.get_db_connection = lambda: _StandInConnection(delay)
+
+    kb = KnowledgeBase(data, vectors, version="loadtest")
+    print(f"[INFO] Load test: {len(kb.data)} chunks, {len(queries)} questions, think={args.think}s, "
+          f"{args.duration}s per level")
+
+    report = []
+    for level in [int(x) for x in args.levels.split(",") if x.strip()]:
+        row = run_level(level, args.duration, args.think, queries, kb, client, quiet=not args.verbose)
+        report.append(row)
+        print(f"   sessions={row['sessions']:>3}  turns={row['turns']:>4}  {row['throughput']:.2f} turns/s  "
+              f"ttft p50/p95/p99={row['ttft_p50']}/{row['ttft_p95']}/{row['ttft_p99']}s  "
+              f"latency p50/p95/p99={row['latency_p50']}/{row['latency_p95']}/{row['latency_p99']}s  "
+              f"errors={row['errors']}  paths={row['paths']}")
+        if not args.real:
+            print(f"      early stops={row['early_stops']}  server streams={row['server_streams']} "
+                  f"aborted={row['server_aborted']} tokens={row['server_tokens']}")
+            if row["server_aborted"] < row["early_stops"]:
+                print("[WARN] Fewer aborted backend streams than early stops: closing the stream "
+                      "did not end every backend request")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+รายงานการใช้ RAM ของ Knowledge Base ที่โหลดอยู่ (ต่อ Replica)
+
+แยกตาม: Record ของแต่ละแหล่ง (คู่มือ / ทุน / คำศัพท์ / Troubleshooting), Vector, Index, Cache
+และ Knowledge Base รุ่นเก่าที่ยังค้างอยู่ใน st.cache_resource ระหว่าง Sync
+Object ที่ใช้ร่วมกัน (เช่น String ที่ intern แล้ว) นับครั้งเดียว ให้กับส่วนที่พบก่อน
+
+ดูรายงานจาก Snapshot:
+    python -m src.memory_report [--path knowledge_snapshot.npz] [--json]
+ใน app.py: เปิด ?debug=memory ใน URL
+"""
+import sys
+import json
+import argparse
+from collections import deque
+from collections.abc import Mapping
+from types import FunctionType, ModuleType
+from typing import Any, Dict, Iterable, Optional, Set
+import numpy as np
+import config
+from . import embedding, rag_engine, answer_cache, knowledge_base
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# แหล่งข้อมูลจาก Prefix ของ id (ดู data_loader)
+SOURCES = {"manual": "manuals", "fund": "funds", "glossary": "glossary", "ts": "troubleshooting"}
+_SKIP_TYPES = (type, ModuleType, FunctionType)
+_MB = 2 ** 20
+
+
+def deep_size(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """ขนาดรวม (bytes) ของ Object และทุกอย่างที่อ้างถึง (ไม่นับซ้ำ Object ที่อยู่ใน seen แล้ว)"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = deque([obj])
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SKIP_TYPES):
+            continue
+        seen.add(id(o))
+
+        if isinstance(o, np.ndarray):
+            # Array ที่เป็น View: getsizeof นับแค่ Header, ข้อมูลนับที่ base
+            total += sys.getsizeof(o)
+            base = o.base
+            if base is not None and id(base) not in seen:
+                stack.append(base)
+            continue
+        total += sys.getsizeof(o)
+        if isinstance(o, (str, bytes, int, float, bool)) or o is None:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        else:
+            if hasattr(o, "__dict__"):
+                stack.append(o.__dict__)
+            for cls in type(o).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(o, name):
+                        stack.append(getattr(o, name))
+    return total
+
+
+def process_rss_mb() -> Optional[float]:
+    """RSS ปัจจุบันของ Process (Linux อ่านจาก /proc, ที่อื่นใช้ค่าสูงสุดจาก getrusage)"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (_MB if sys.platform == "darwin" else 1024)
+    return None
+
+
+def _source_of(item: Mapping) -> str:
+    prefix = str(item.get("id", "")).split(":", 1)[0]
+    return SOURCES.get(prefix, "other")
+
+
+def _records_by_source(data: Iterable[Mapping], seen: Set[int]) -> Dict[str, Dict[str, float]]:
+    out: Dict[str, Dict[str, float]] = {}
+    for item in data:
+        row = out.setdefault(_source_of(item), {"count": 0, "mb": 0.0})
+        row["count"] += 1
+        row["mb"] += deep_size(item, seen) / _MB
+    for row in out.values():
+        row["mb"] = round(row["mb"], 2)
+    return out
+
+
+def kb_report(kb) -> Dict[str, Any]:
+    seen: Set[int] = set()
+    report: Dict[str, Any] = {"version": kb.version}
+
+    report["records"] = _records_by_source(kb.data, seen)
+    report["records_list_mb"] = round(deep_size(kb.data, seen) / _MB, 2)
+
+    vectors = {"matrix": kb.vectors}
+    if getattr(kb, "reduced", None) is not None:
+        vectors["reduced"] = kb.reduced
+    report["vectors"] = {name: round(deep_size(v, seen) / _MB, 2) for name, v in vectors.items()}
+
+    indexes = {
+        "fund_index": kb.fund_index, "meta_index": kb.meta_index, "step_index": kb.step_index,
+        "glossary": getattr(kb, "glossary", None), "domain_centroids": kb.domain_centroids,
+    }
+    report["indexes"] = {name: round(deep_size(ix, seen) / _MB, 2) for name, ix in indexes.items() if ix is not None}
+
+    caches = {
+        "embedding": (embedding._EMBED_CACHE, config.EMBED_CACHE_SIZE),
+        "rewrite": (rag_engine._REWRITE_CACHE, config.REWRITE_CACHE_SIZE),
+        "answer": (answer_cache.CACHE._items, config.ANSWER_CACHE_SIZE),
+    }
+    report["caches"] = {
+        name: {"entries": len(c), "max": cap, "mb": round(deep_size(c, seen) / _MB, 2)}
+        for name, (c, cap) in caches.items()
+    }
+
+    # Knowledge Base รุ่นอื่นที่ยังมีชีวิตอยู่ (นับเฉพาะส่วนที่ไม่ใช้ร่วมกับรุ่นปัจจุบัน)
+    others = [k for k in list(knowledge_base.LIVE) if k is not kb]
+    report["old_generations"] = {
+        str(k.version): round(deep_size(k, seen) / _MB, 2) for k in others
+    }
+
+    kb_total = (
+        sum(r["mb"] for r in report["records"].values()) + report["records_list_mb"]
+        + sum(report["vectors"].values()) + sum(report["indexes"].values())
+    )
+    report["kb_mb"] = round(kb_total, 2)
+    report["caches_mb"] = round(sum(c["mb"] for c in report["caches"].values()), 2)
+    report["old_generations_mb"] = round(sum(report["old_generations"].values()), 2)
+    report["rss_mb"] = round(process_rss_mb() or 0.0, 1)
+    return report
+
+
+def check_ceiling(kb, report: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Rebuild จะถือ Knowledge Base สองรุ่นพร้อมกันชั่วคราว (รุ่นเดิมยังให้บริการอยู่)
+    คืน False และเตือนถ้า RSS + ขนาดรุ่นใหม่ (ประมาณเท่ารุ่นปัจจุบัน) เกิน MEMORY_CEILING_MB
+    """
+    if config.MEMORY_CEILING_MB <= 0:
+        return True
+    report = report or kb_report(kb)
+    projected = report["rss_mb"] + report["kb_mb"]
+    if projected > config.MEMORY_CEILING_MB:
+        print(f"[WARN] Rebuild would need ~{projected:.0f} MB (RSS {report['rss_mb']:.0f} + KB {report['kb_mb']:.0f}), "
+              f"over MEMORY_CEILING_MB={config.MEMORY_CEILING_MB}")
+        return False
+    return True
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"Knowledge base {report['version']}: {report['kb_mb']} MB "
+             f"(caches {report['caches_mb']} MB, old generations {report['old_generations_mb']} MB, "
+             f"process RSS {report['rss_mb']} MB)"]
+    for name, row in report["records"].items():
+        lines.append(f"   records/{name}: {row['count']} items, {row['mb']} MB")
+    lines.append(f"   records/list: {report['records_list_mb']} MB")
+    for group in ("vectors", "indexes"):
+        for name, mb in report[group].items():
+            lines.append(f"   {group}/{name}: {mb} MB")
+    for name, c in report["caches"].items():
+        lines.append(f"   caches/{name}: {c['entries']}/{c['max']} entries, {c['mb']} MB")
+    for version, mb in report["old_generations"].items():
+        lines.append(f"   old_generation/{version}: {mb} MB")
+    return "\n".join(lines)
+
+
+def log_report(kb) -> Dict[str, Any]:
+    report = kb_report(kb)
+    print("[INFO] Memory report\n" + format_report(report))
+    check_ceiling(kb, report)
+    return report
+
+
+# CLI
+
+def main(argv=None) -> int:
+    from . import snapshot
+    parser = argparse.ArgumentParser(prog="python -m src.memory_report", description="Knowledge base memory report")
+    parser.add_argument("--path", default=config.SNAPSHOT_PATH)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    loaded = snapshot.load_snapshot(args.path)
+    if not loaded:
+        print(f"[ERROR] No readable snapshot at {args.path}")
+        return 1
+    manifest = snapshot.read_manifest(args.path) or {}
+    data, vectors = loaded
+    kb = knowledge_base.KnowledgeBase(data, vectors, version=manifest.get("version"))
+    del data, loaded
+    report = kb_report(kb)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    check_ceiling(kb, report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
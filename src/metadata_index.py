@@ -0,0 +1,61 @@
+import numpy as np
+from typing import List, Dict, Any, Optional, Union, Iterable
+
+# Field ที่ทำ Index ไว้ล่วงหน้า (type อยู่ระดับ item ที่เหลืออยู่ใน metadata)
+INDEXED_FIELDS = ("type", "category", "category_group", "fund_abbr", "fiscal_year", "status")
+
+FilterValue = Union[str, Iterable[str]]
+
+
+def _norm(val) -> str:
+    return str(val if val is not None else "").strip().lower()
+
+
+class MetadataIndex:
+    """
+    Index ของ Metadata: field -> value -> ตำแหน่งแถว (int32 เรียงจากน้อยไปมาก)
+    ใช้เลือก Subset ของ Vector ก่อนคำนวณ Similarity
+    """
+
+    def __init__(self, data_list: List[Dict[str, Any]]):
+        self.size = len(data_list or [])
+        buckets: Dict[str, Dict[str, List[int]]] = {f: {} for f in INDEXED_FIELDS}
+
+        for i, item in enumerate(data_list or []):
+            meta = item.get("metadata", {}) or {}
+            # Chunk ที่รวมแล้ว (dedup) ต้องถูกเลือกได้ด้วยค่าของทุกชิ้นที่ถูกรวม
+            for m in [meta] + list(meta.get("variants") or []):
+                for field in INDEXED_FIELDS:
+                    raw = item.get("type") if field == "type" else m.get(field)
+                    val = _norm(raw)
+                    if val and (not buckets[field].get(val) or buckets[field][val][-1] != i):
+                        buckets[field].setdefault(val, []).append(i)
+
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {
+            field: {v: np.asarray(idx, dtype=np.int32) for v, idx in vals.items()}
+            for field, vals in buckets.items()
+        }
+
+    def select(self, filters: Optional[Dict[str, FilterValue]]) -> Optional[np.ndarray]:
+        """
+        filters = {"type": "troubleshoot", "fund_abbr": ["ff", "sf"], "status": "active"}
+        - ค่าใน field เดียวกัน = OR, ระหว่าง field = AND
+        คืนค่า None ถ้าไม่มี Filter (หมายถึงค้นทั้งหมด)
+        """
+        if not filters:
+            return None
+
+        result = None
+        for field, wanted in filters.items():
+            if field not in self.postings:
+                print(f"   [Warning] Filter field '{field}' is not indexed. Ignored.")
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            parts = [self.postings[field].get(_norm(w)) for w in wanted]
+            parts = [p for p in parts if p is not None]
+            idx = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32)
+            result = idx if result is None else np.intersect1d(result, idx, assume_unique=True)
+            if result.size == 0:
+                break
+        return result
@@ -0,0 +1,168 @@
+"""
+Pipeline ของหนึ่งคำถาม (rewrite -> retrieve -> rerank -> context -> generate)
+ส่งความคืบหน้าออกเป็น Event ผ่าน emit(kind, payload) เพื่อให้ Single-Flight กระจายให้หลาย Session ได้
+
+Event ที่ส่งออก:
+- ("stage", "rewrite" | "retrieve" | "rerank" | "generate")
+- ("queue", {"stage": ..., "pos": ...})   รอคิว Admission
+- ("context", {"query", "has_context", "log_source"})
+- ("token", text)                          Token ที่กรองแล้ว
+- ("final", {"response", "log_source", "error"})
+"""
+from typing import Any, Callable, List, Tuple
+from langsmith import traceable
+import config
+from . import rag_engine, context_builder, prompt_builder, admission, generation
+
+BUSY_MSG = "ขณะนี้มีผู้ใช้งานจำนวนมาก รบกวนลองใหม่อีกครั้งในอีกสักครู่ค่ะ"
+NO_CONTEXT_MSG = "ไม่พบข้อมูลในระบบที่เกี่ยวข้องค่ะ รบกวนระบุรายละเอียดเพิ่ม เช่น ชื่อเมนู หรือขั้นตอนที่ทำค้างอยู่ค่ะ"
+GEN_ERROR_MSG = "เกิดข้อผิดพลาดในการสร้างคำตอบค่ะ"
+
+
+@traceable(run_type="chain", name="Decision Logic")
+def decide_log_sources(collected_data):
+    final_sources = []
+
+    debug_info = {
+        "s1": 0, "s2": 0, "s3": 0,
+        "gap_12": 0, "gap_23": 0,
+        "decision": "No Data"
+    }
+
+    if collected_data:
+        if len(collected_data) == 1:
+            final_sources.append(collected_data[0][0])
+            debug_info["s1"] = collected_data[0][1]
+            debug_info["decision"] = "Single Item Found"
+
+        else:
+            s1 = collected_data[0][1]
+            s2 = collected_data[1][1]
+            gap_12 = s1 - s2
+            debug_info["s1"] = s1
+            debug_info["s2"] = s2
+            debug_info["gap_12"] = gap_12
+
+            if s1 >= 87.0 or gap_12 >= 8.0:
+                final_sources.append(collected_data[0][0])
+                debug_info["decision"] = "Dominant Win (Keep 1)"
+            else:
+
+                if len(collected_data) >= 3:
+                    s3 = collected_data[2][1]
+                    gap_23 = s2 - s3
+
+                    debug_info["s3"] = s3
+                    debug_info["gap_23"] = gap_23
+                    if gap_23 >= 5.0:
+                        final_sources = [d[0] for d in collected_data[:2]]
+                        debug_info["decision"] = "Top 2 Separate (Keep 2)"
+                    else:
+                        final_sources = [d[0] for d in collected_data[:3]]
+                        debug_info["decision"] = "Ambiguous (Keep 3)"
+
+                else:
+                    final_sources = [d[0] for d in collected_data[:2]]
+                    debug_info["decision"] = "Only 2 Items (Keep 2)"
+
+    log_string = ", ".join(final_sources) if final_sources else None
+    return log_string, debug_info
+
+
+def collect_sources(used_items: List[Tuple[dict, float]]) -> List[Tuple[str, float]]:
+    collected_data = [] # เก็บเป็น tuple
+    for item, score in used_items:
+        # ดึงชื่อ Source
+        src_name = item.get("metadata", {}).get("source")
+        if src_name and not any(d[0] == src_name for d in collected_data):
+            collected_data.append((src_name, score))
+    return collected_data
+
+
+def run_turn(user_input: str, history, kb, client, session_id: str,
+             emit: Callable[[str, Any], None], intent: str = "QUERY", generate: bool = True) -> None:
+    """generate=False: หยุดหลังสร้าง Context (ใช้ Warm-up เติม Cache โดยไม่เรียก LLM สร้างคำตอบ)"""
+    def on_wait(stage):
+        return lambda pos: emit("queue", {"stage": stage, "pos": pos})
+
+    slots = admission.CONTROLLER
+    try:
+        emit("stage", "rewrite")
+        # คำถามกว้างให้ Rewriter แตกเป็นหลาย Sub-query ในการเรียกครั้งเดียว
+        broad = rag_engine.is_broad_query(user_input)
+        n_queries = config.MULTI_QUERY_MAX if (config.MULTI_QUERY and broad) else 1
+        with slots.slot("rewrite", session_id, on_wait=on_wait("rewrite")):
+            queries = rag_engine.rewrite_queries(user_input, history, client, config.CURRENT_MODEL, max_queries=n_queries)
+        query = queries[0]
+        emit("stage", "retrieve")
+        filters, strict = rag_engine.infer_filters(query, kb.fund_index)
+        # แนบความหมายของคำศัพท์/ตัวย่อที่พบ ก่อน Embed (Filter/Rerank ยังใช้คำถามเดิม)
+        search_queries = [kb.glossary.expand(q) for q in queries]
+        with slots.slot("retrieve", session_id, on_wait=on_wait("retrieve")):
+            if len(queries) > 1:
+                cands = rag_engine.multi_retrieval_stage(
+                    search_queries, kb.data, kb.vectors, top_k=config.RETRIEVE_TOPK,
+                    filters=filters, meta_index=kb.meta_index, reduced=kb.reduced, strict=strict
+                )
+            else:
+                cands = rag_engine.retrieval_stage(
+                    search_queries[0], kb.data, kb.vectors, top_k=config.RETRIEVE_TOPK, adaptive=config.RETRIEVE_ADAPTIVE,
+                    filters=filters, meta_index=kb.meta_index, reduced=kb.reduced, strict=strict
+                )
+    except admission.AdmissionRejected as e:
+        print(f"[WARN] Admission rejected: {e}")
+        emit("context", {"query": user_input, "has_context": False, "log_source": None})
+        emit("final", {"response": BUSY_MSG, "log_source": None, "error": None})
+        return
+
+    emit("stage", "rerank")
+    results = rag_engine.reranking_stage(query, cands, top_k=config.RERANK_TOPK, intent=intent)
+    if broad:
+        # ขอทั้งกระบวนการ: ดึงทุกขั้นตอนของคู่มือที่เจอจาก Step Index ตามลำดับ
+        results = kb.step_index.expand(results, max_steps=config.PROCEDURE_MAX_STEPS)
+    context_str, used_items = context_builder.build_context(
+        results, config.get_threshold, token_budget=config.CONTEXT_TOKEN_BUDGET
+    )
+    log_source, debug_info = decide_log_sources(collect_sources(used_items))
+    has_context = (len(used_items) >= 1) and (len(context_str) > 0)
+    emit("context", {"query": query, "has_context": has_context, "log_source": log_source})
+
+    if not has_context:
+        emit("final", {"response": NO_CONTEXT_MSG, "log_source": log_source, "error": None})
+        return
+
+    if not generate:
+        emit("final", {"response": None, "log_source": log_source, "error": None})
+        return
+
+    msgs = prompt_builder.build_messages(query, context_str)
+    max_tokens = generation.generation_budget(intent, context_builder.estimate_tokens(context_str), broad)
+    monitor = generation.StreamMonitor()
+    try:
+        with slots.slot("generate", session_id, on_wait=on_wait("generate")):
+            emit("stage", "generate")
+            stream = client.chat.completions.create(
+                model=config.CURRENT_MODEL,
+                messages=msgs, stream=True, temperature=0.3, max_tokens=max_tokens,
+                extra_body={"repetition_penalty": 1.12, "top_p": 0.9}
+            )
+            for chunk in stream:
+                c = chunk.choices[0].delta.content
+                if c:
+                    out, stop = monitor.feed(c)
+                    if out:
+                        emit("token", out)
+                    if stop:
+                        # ปิด Connection ให้ Server หยุดสร้าง Token ที่เหลือ
+                        generation.close_stream(stream)
+                        break
+    except admission.AdmissionRejected as e:
+        print(f"[WARN] Admission rejected: {e}")
+        emit("final", {"response": BUSY_MSG, "log_source": log_source, "error": None})
+        return
+    except Exception as e:
+        print(f"[ERROR] Generation failed: {e}")
+        emit("final", {"response": GEN_ERROR_MSG, "log_source": log_source, "error": str(e)})
+        return
+
+    emit("final", {"response": monitor.cleaned(), "log_source": log_source, "error": None})
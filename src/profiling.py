@@ -0,0 +1,119 @@
+"""
+Profiling แบบเปิดเมื่อต้องการ (ไม่ต้อง Deploy ใหม่ ไม่ต้องต่อ Network)
+
+เปิดได้ 3 ทาง:
+- PROFILE_ENABLED=true        : ทุก Turn / ทุกรอบ Sync
+- PROFILE_SAMPLE_RATE=0.01    : สุ่ม 1% ของ Turn
+- ?profile=1 ใน URL           : เฉพาะ Session นั้น (Debug Flag)
+
+Sampler อ่าน Stack ของทุก Thread ทุก PROFILE_INTERVAL_MS (ครอบคลุม Thread ของ Single-Flight,
+Embedding HTTP, การเขียน DB ที่ทำงานให้ Turn นั้น) แล้วเขียนไฟล์ Folded Stack
+(1 บรรทัดต่อ Stack: "thread;frame;frame count") ที่ PROFILE_DIR/<เวลา>_<ชื่อ>_<request id>.folded
+เปิดดูได้ด้วย flamegraph.pl, speedscope หรือ inferno
+Thread ของ Session อื่นที่ทำงานพร้อมกันจะอยู่ใต้ Root ของชื่อ Thread ตัวเอง
+"""
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+import config
+
+
+def should_profile(session_flag: bool = False) -> bool:
+    if session_flag or config.PROFILE_ENABLED:
+        return True
+    return config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Sampling Profiler ของทั้ง Process (หยุดเองเมื่อเกิน PROFILE_MAX_SECONDS)"""
+
+    def __init__(self, name: str, request_id: str, interval_ms: Optional[float] = None,
+                 max_seconds: Optional[float] = None):
+        self.name = name
+        self.request_id = request_id
+        self.interval = (interval_ms or config.PROFILE_INTERVAL_MS) / 1000.0
+        self.max_seconds = max_seconds or config.PROFILE_MAX_SECONDS
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.started = 0.0
+        self.path: Optional[str] = None
+
+    def start(self) -> "Sampler":
+        self.started = time.time()
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        deadline = self.started + self.max_seconds
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            if time.time() > deadline:
+                print(f"[WARN] Profile '{self.name}' ({self.request_id}) hit {self.max_seconds}s limit.")
+                break
+
+    def stop(self) -> Optional[str]:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        return self._write()
+
+    def _write(self) -> Optional[str]:
+        if self.path or not self.stacks:
+            return self.path
+        try:
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+            path = os.path.join(config.PROFILE_DIR, f"{stamp}_{self.name}_{self.request_id}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.path = path
+        except Exception as e:
+            print(f"[WARN] Profile write failed: {e}")
+            return None
+        print(f"[INFO] Profile '{self.name}' ({self.request_id}): {self.samples} samples in "
+              f"{time.time() - self.started:.2f}s -> {self.path}")
+        return self.path
+
+
+def start(name: str, request_id: str, session_flag: bool = False) -> Optional[Sampler]:
+    """เริ่ม Profile ถ้าถูกเลือก (คืน None ถ้าไม่ได้เปิด) เรียก stop() เมื่อจบงาน"""
+    if not should_profile(session_flag):
+        return None
+    return Sampler(name, request_id).start()
+
+
+def stop(sampler: Optional[Sampler]) -> Optional[str]:
+    return sampler.stop() if sampler is not None else None
+
+
+@contextmanager
+def profile(name: str, request_id: str, session_flag: bool = False):
+    sampler = start(name, request_id, session_flag)
+    try:
+        yield sampler
+    finally:
+        stop(sampler)
@@ -0,0 +1,19 @@
+from typing import List, Dict
+import config
+
+
+def build_messages(query: str, context_str: str) -> List[Dict[str, str]]:
+    """
+    จัดลำดับ Message ให้ Prefix คงที่:
+    [system: STATIC_SYS_PROMPT] -> [user: วันที่ + Context + คำถาม]
+    ส่วนที่เปลี่ยนทุก Request อยู่หลัง System Prompt เสมอ Backend จึง Reuse KV-cache ได้
+    """
+    user_content = (
+        f"{config.build_temporal_block()}\n\n"
+        f"Context from Database:\n{context_str}\n\n"
+        f"User Question: {query}"
+    )
+    return [
+        {"role": "system", "content": config.STATIC_SYS_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
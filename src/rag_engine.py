@@ -1,8 +1,15 @@
 import re
+import threading
 import numpy as np
+from collections import OrderedDict
+from collections.abc import Mapping
 from typing import List, Dict, Tuple, Any, Optional
-from . import embedding
+from . import embedding, domain_gate, generation
+from .keyword_automaton import KeywordAutomaton
+from .metadata_index import MetadataIndex
+from .retrieval_scheduler import SCHEDULER
 from langsmith import traceable
+import config
 
 
 # Utilities 
@@ -11,7 +18,7 @@ def _safe_lower(s: str) -> str:
     return (s or "").lower().strip()
 
 def _get_item_id(item: Dict[str, Any], fallback_idx: int) -> str:
-    if isinstance(item, dict):
+    if isinstance(item, Mapping):
         if "id" in item and item["id"]:
             return str(item["id"])
     return f"idx:{fallback_idx}"
@@ -24,41 +31,135 @@ def _get_content(item: Dict[str, Any]) -> str:
 
 
 # Intent & Rewrite 
-BLOCK_PATTERNS = [
-    r"\b(การเมือง|เลือกตั้ง|พรรค|นายก|ฝ่ายค้าน|รัฐบาล)\b",
-    r"\b(ทำอาหาร|สูตร|คุกกี้|ทำกับข้าว)\b",
-    r"\b(หนัง|ซีรีส์|อนิเมะ|เกม|หวย|เลขเด็ด)\b",
-    r"\b(ด่า|เหี้ย|สัส|ควย|ไอ้)\b",
+BLOCK_KEYWORDS = {
+    "politics": ["การเมือง", "เลือกตั้ง", "พรรค", "นายก", "ฝ่ายค้าน", "รัฐบาล"],
+    "cooking": ["ทำอาหาร", "สูตร", "คุกกี้", "ทำกับข้าว"],
+    "entertainment": ["หนัง", "ซีรีส์", "อนิเมะ", "เกม"],
+    "gambling": ["หวย", "เลขเด็ด"],
+    "profanity": ["ด่า", "เหี้ย", "สัส", "ควย", "ไอ้"],
+}
+# กลุ่มที่ Block เสมอ แม้คำถามจะมีคำในโดเมน (กลุ่มอื่นอาจเป็นหัวข้อวิจัยได้ เช่น ทุนวิจัยด้านการเมือง)
+ALWAYS_BLOCK = {"gambling", "profanity"}
+# คำในโดเมนที่มีคำต้องห้ามซ้อนอยู่ (เช่น หนังสือ มี หนัง, หลักสูตร มี สูตร) ไม่ให้ถูก Block
+ALLOW_KEYWORDS = [
+    "หนังสือ", "หลักสูตร", "สูตรคำนวณ", "สูตรการคำนวณ", "นายกสภา", "นายกสมาคม", "ด่าน",
+    "รัฐบาลดิจิทัล", "จากรัฐบาล", "ทุนรัฐบาล", "หน่วยงานรัฐบาล", "ของรัฐบาล",
+    "เกมการศึกษา", "เกมเพื่อการศึกษา", "หนังสัตว์",
+]
+# คำที่บอกชัดว่าอยู่ในโดเมน: ไม่ต้องเรียก Embedding เพื่อตรวจ Domain และไม่ Block คำต้องห้ามกลุ่มที่กำกวม
+# (คำทั่วไปอย่าง ระบบ / รายงาน / เอกสาร / เมนู ไม่อยู่ในนี้ คำถามที่มีแค่คำพวกนี้ยังต้องผ่าน Domain Check)
+DOMAIN_KEYWORDS = [
+    "วิจัย", "ขอทุน", "แหล่งทุน", "ทุนวิจัย", "เบิก", "ใบเสร็จ", "ทดรองจ่าย", "ปิดโครงการ",
+    "rpa", "ผู้ประสานงานโครงการ", "รายงานความก้าวหน้า",
 ]
 
-def analyze_intent(user_query: str) -> str:
+def _build_intent_automaton() -> KeywordAutomaton:
+    words = [(w, "allow") for w in ALLOW_KEYWORDS] + [(w, "domain") for w in DOMAIN_KEYWORDS]
+    for group, kws in BLOCK_KEYWORDS.items():
+        words.extend((w, group) for w in kws)
+    return KeywordAutomaton(words)
+
+# สร้างครั้งเดียวตอน Import (ใช้ร่วมกันทุก Session)
+INTENT_AUTOMATON = _build_intent_automaton()
+
+def _keyword_pass(q: str) -> Tuple[bool, bool]:
+    """(ถูก Block, เจอคำในโดเมน) จากการอ่านคำถามครั้งเดียว (ภาษาไทยไม่เว้นวรรค จึงนับแบบ Substring)"""
+    hits = INTENT_AUTOMATON.find_all(q)
+    allow_spans = [(s, e) for s, e, _, label in hits if label == "allow"]
+    in_domain = any(label == "domain" for _, _, _, label in hits)
+    for s, e, _, label in hits:
+        if label in ("allow", "domain"):
+            continue
+        # คำต้องห้ามที่อยู่ในคำที่อนุญาต ไม่นับ
+        if any(a_s <= s and e <= a_e for a_s, a_e in allow_spans):
+            continue
+        if label in ALWAYS_BLOCK or not in_domain:
+            return True, in_domain
+    return False, in_domain
+
+def _is_blocked(q: str) -> bool:
+    return _keyword_pass(q)[0]
+
+def analyze_intent(user_query: str, fund_index=None, domain_centroids=None, glossary=None) -> str:
     q = _safe_lower(user_query)
-    for pat in BLOCK_PATTERNS:
-        if re.search(pat, q):
-            return "BLOCK"
+    blocked, in_domain = _keyword_pass(q)
+    if blocked:
+        return "BLOCK"
+    # คำถามสถานะทุนที่ชัดเจน ตอบจาก Fund Index ได้เลย (ไม่ต้อง Rewrite/Embedding)
+    if fund_index is not None and fund_index.is_fund_query(q):
+        return "FUND"
+    # ถามความหมายคำศัพท์ล้วนๆ ตอบจาก Glossary ได้เลย (ไม่ต้อง Rewrite/Embedding)
+    if glossary is not None and glossary.is_definition_query(q):
+        return "DEFINE"
+    # Domain Check เฉพาะคำถามที่ Keyword ตัดสินไม่ได้ (ไม่มีคำในโดเมน / ชื่อทุน / คำศัพท์ใน Glossary)
+    # คำถามส่วนใหญ่จึงไม่ต้องเสีย Embedding Round Trip เพิ่ม
+    in_domain = in_domain or bool(fund_index is not None and fund_index.find_in_query(q)) \
+        or bool(glossary is not None and glossary.match(q))
+    if domain_centroids is not None and config.DOMAIN_CHECK and not in_domain:
+        qvec = embedding.get_embedding_remote(user_query)
+        if qvec.size > 0:
+            score = domain_gate.domain_score(qvec, domain_centroids)
+            if score < config.DOMAIN_MIN_SIM:
+                print(f"   [Intent] Off-domain query (score={score:.3f}): '{user_query}'")
+                return "BLOCK"
     return "QUERY"
 
-def rewrite_query(user_query: str, chat_history, client=None, model_name: str = "") -> str:
+# เฉพาะคำที่บอกชัดว่าเป็นอาการผิดพลาด ("ปัญหา"/"แก้ไขปัญหา" อยู่ในคำถามเชิงขั้นตอนทั่วไปด้วย จึงไม่ใช้)
+TROUBLESHOOT_HINTS = ["error", "เออเร่อ", "เออเรอ", "ขึ้นข้อความ", "ระบบค้าง", "หน้าจอค้าง", "ระบบล่ม"]
+ACTIVE_FUND_HINTS = ["ทุนที่เปิด", "ทุนที่ยังเปิด", "ทุนอะไรเปิด", "ทุนไหนเปิด", "ทุนที่ยังมี"]
+
+def infer_filters(query: str, fund_index=None) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    เดา Metadata Filter จากคำถาม คืน (filters, strict) (filters=None คือไม่มี)
+    - strict=True : คำถามระบุขอบเขตชัด (ทุนที่ยังเปิด / ข้อความ Error) -> ค้นเฉพาะแถวที่ตรง Filter
+    - strict=False: แค่เดา (มีชื่อทุน แต่อาจถามขั้นตอนทั่วไป) -> ค้นทั้งหมด แถวที่ตรงได้คะแนนเพิ่ม
+    """
+    q = _safe_lower(query)
+    if any(k in q for k in ACTIVE_FUND_HINTS):
+        return {"type": "fact", "status": "active"}, True
+    if any(k in q for k in TROUBLESHOOT_HINTS):
+        return {"type": "troubleshoot"}, True
+    if fund_index is not None:
+        abbrs = sorted({r["abbr"] for r in fund_index.find_in_query(q) if r["abbr"]})
+        if abbrs:
+            return {"fund_abbr": abbrs}, False
+    return None, False
+
+def history_context(user_query: str, chat_history) -> str:
+    """ข้อความล่าสุดของบอทที่ Rewriter จะใช้ประกอบ (คำถามยาวไม่ใช้ History)"""
     uq = (user_query or "").strip()
-    if not uq: return uq
-    if not client or not model_name: return uq
-
     is_long_query = len(uq) > 50 or len(uq.split()) > 10
-    last_context = ""
     if chat_history and not is_long_query:
         for msg in reversed(chat_history):
             role = msg.get("role")
             content = msg.get("content", "")
             if role == "assistant":
                 if "ขออภัยค่ะ" not in content and "ไม่พบข้อมูล" not in content:
-                    last_context = content[:100] 
-                    break
-    else:
-        if is_long_query:
-            print(f"   [Rewriter] Long query detected ({len(uq)} chars). Ignore History.")
-
-    
-    system_prompt = f"""
+                    return content[:100]
+    return ""
+
+# LRU Cache ของผล Rewrite (คำถามยอดนิยมถูกเติมไว้ล่วงหน้าโดย Warm-up หลัง Sync)
+_REWRITE_CACHE = OrderedDict()
+_REWRITE_CACHE_LOCK = threading.Lock()
+
+def _rewrite_cache_get(key):
+    with _REWRITE_CACHE_LOCK:
+        val = _REWRITE_CACHE.get(key)
+        if val is not None:
+            _REWRITE_CACHE.move_to_end(key)
+        return val
+
+def _rewrite_cache_put(key, val: Tuple[str, ...]) -> None:
+    if config.REWRITE_CACHE_SIZE <= 0:
+        return
+    with _REWRITE_CACHE_LOCK:
+        _REWRITE_CACHE[key] = val
+        _REWRITE_CACHE.move_to_end(key)
+        while len(_REWRITE_CACHE) > config.REWRITE_CACHE_SIZE:
+            _REWRITE_CACHE.popitem(last=False)
+
+def _rewrite_prompt(last_context: str) -> str:
+    return f"""
 You are an expert Query Rewriter for a Retrieval-Augmented Generation (RAG) chatbot.
 
 Your ONLY task is to rewrite the user input into a clear, precise Thai search query for a vector database.
@@ -128,6 +229,49 @@ Input: "ขอคู่มือการขอเบิกเงินทดร
 Output: อธิบายขั้นตอนการเบิกเงินทดรองจ่ายทั้งหมด
 """
 
+# คำถามกว้าง (ขอคู่มือ/ทุกขั้นตอน) ให้ Rewriter แตกเป็นหลาย Sub-query แล้วค้นพร้อมกัน
+BROAD_HINTS = ["คู่มือ", "ทุกขั้นตอน", "ขั้นตอนทั้งหมด", "ตั้งแต่", "จนถึง", "ทั้งหมด", "ครบทุก", "step by step"]
+
+MULTI_QUERY_RULES = """
+--------------------------------
+MULTI-QUERY MODE (OVERRIDES "ONE single-line" RULE)
+
+If the input asks for a whole procedure or covers several sub-topics,
+output between 1 and {n} lines. Each line is ONE standalone Thai search query
+for a different part (e.g. first steps, middle steps, final steps / submission).
+The FIRST line must be the main rewritten query.
+If the input is narrow, output exactly one line.
+"""
+
+def is_broad_query(user_query: str) -> bool:
+    q = _safe_lower(user_query)
+    return any(h in q for h in BROAD_HINTS)
+
+def rewrite_query(user_query: str, chat_history, client=None, model_name: str = "") -> str:
+    return rewrite_queries(user_query, chat_history, client, model_name, max_queries=1)[0]
+
+def rewrite_queries(user_query: str, chat_history, client=None, model_name: str = "", max_queries: int = 1) -> List[str]:
+    """Rewrite คำถาม คืน List ของ Search Query (ตัวแรกคือ Query หลัก, max_queries>1 = โหมด Multi-query)"""
+    uq = (user_query or "").strip()
+    if not uq: return [uq]
+    if not client or not model_name: return [uq]
+
+    is_long_query = len(uq) > 50 or len(uq.split()) > 10
+    last_context = history_context(uq, chat_history)
+    if is_long_query:
+        print(f"   [Rewriter] Long query detected ({len(uq)} chars). Ignore History.")
+
+    cache_key = (model_name, uq, last_context, max_queries)
+    cached = _rewrite_cache_get(cache_key)
+    if cached is not None:
+        print(f"   [Rewriter] (cached) '{uq}' -> {cached}")
+        return list(cached)
+
+
+    system_prompt = _rewrite_prompt(last_context)
+    if max_queries > 1:
+        system_prompt += MULTI_QUERY_RULES.format(n=max_queries)
+
     try:
         resp = client.chat.completions.create(
             model=model_name,
@@ -136,21 +280,118 @@ Output: อธิบายขั้นตอนการเบิกเงิน
                 {"role": "user", "content": f"User Input: {uq}"} 
             ],
             temperature=0.2, 
-            max_tokens=1500,
+            max_tokens=generation.rewrite_budget(max_queries),
+            stop=generation.REWRITE_MULTI_STOP if max_queries > 1 else generation.REWRITE_STOP,
         )
         new_query = resp.choices[0].message.content.strip().replace('"', "")
+        if max_queries > 1:
+            queries = []
+            for line in new_query.splitlines():
+                line = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+                if line and line not in queries:
+                    queries.append(line)
+            queries = queries[:max_queries] or [uq]
+        else:
+            queries = [new_query] if new_query else [uq]
         
-        print(f"   [Rewriter] '{uq}' -> '{new_query}'") 
-        return new_query
+        print(f"   [Rewriter] '{uq}' -> {queries}") 
+        if new_query:
+            _rewrite_cache_put(cache_key, tuple(queries))
+        return queries
 
     except Exception as e:
         print(f"Rewrite Error: {e}")
-        return uq
+        return [uq]
 
 # Retrieval Stage 
+
+def _rank_score(c: Dict[str, Any]) -> float:
+    return float(c.get("vector_score", 0.0)) + (config.FILTER_BOOST if c.get("filter_match") else 0.0)
+
+def _adaptive_pool(sorted_sims: np.ndarray, top_k: int) -> Tuple[int, int]:
+    """
+    เลือกขนาด Pool และจำนวนผลลัพธ์จากการกระจายของคะแนน
+    - อันดับ 1 ชนะขาด (gap สูง / คะแนนตกเร็ว) -> Pool เล็ก
+    - คะแนนต่ำกว่า Threshold หรือมีคู่แข่งใกล้กันเยอะ -> ขยาย Pool
+    คืนค่า (pool_k, k)
+    """
+    n = len(sorted_sims)
+    max_pool = min(n, max(top_k * 2, config.ADAPTIVE_MAX_POOL))
+    if n < 2:
+        return max_pool, min(top_k, n)
+
+    s1 = float(sorted_sims[0])
+    gap = s1 - float(sorted_sims[1])
+    floor = min(config.TYPE_THRESH.values())
+
+    # คะแนนสูงสุดยังไม่ถึง Threshold -> กำกวม ใช้ Pool เต็ม
+    if s1 < floor:
+        return max_pool, min(top_k, n)
+
+    # จำนวนคู่แข่งที่คะแนนอยู่ใกล้ s1 (ดูว่าคะแนนตกเร็วแค่ไหน)
+    n_close = int(np.searchsorted(-sorted_sims[:max_pool], -(s1 - config.ADAPTIVE_BAND), side="right"))
+
+    if gap >= config.ADAPTIVE_GAP or n_close <= 2:
+        k = min(top_k, max(n_close * 2, config.ADAPTIVE_MIN_POOL // 2))
+        pool_k = min(max_pool, max(k * 2, config.ADAPTIVE_MIN_POOL))
+        return pool_k, k
+
+    # กำกวมปานกลาง: ขยาย Pool ตามจำนวนคู่แข่ง
+    pool_k = min(max_pool, max(n_close * 3, config.ADAPTIVE_MIN_POOL, top_k))
+    return pool_k, min(top_k, n)
+
+def _score_rows(target_vectors: np.ndarray, qvec: np.ndarray, rows: Optional[np.ndarray],
+                reduced=None) -> Tuple[np.ndarray, np.ndarray]:
+    # คำนวณ Similarity เฉพาะแถวที่ผ่าน Filter (rows=None คือทั้งหมด)
+    # qvec (d,) -> sims (n,), qvec (m, d) -> sims (m, n)
+    if reduced is not None and reduced.vectors is target_vectors:
+        # สแกนใน Vector ลดมิติ แล้ว Re-score เฉพาะ Shortlist ด้วย Vector เต็ม
+        return reduced.score(qvec, rows)
+    if rows is None:
+        # ค้นทั้งหมด: รวมกับคำขอของ Session อื่นที่มาพร้อมกันเป็น Matrix-Matrix Product
+        return np.arange(len(target_vectors)), SCHEDULER.score(target_vectors, qvec)
+    return rows, np.dot(qvec, target_vectors[rows].T)
+
+def _prefilter_rows(target_data, filters: Optional[Dict[str, Any]], meta_index) -> Optional[np.ndarray]:
+    if not filters:
+        return None
+    if meta_index is None:
+        meta_index = MetadataIndex(target_data)
+    rows = meta_index.select(filters)
+    if rows is not None and rows.size == 0:
+        print(f"   [Retrieval] filter {filters} matched nothing. Fallback to full search.")
+        return None
+    return rows
+
+def _filtered_search(target_vectors: np.ndarray, qvec: np.ndarray, rows: Optional[np.ndarray],
+                     reduced=None, strict: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    คืน (row_ids, sims, rank_sims) โดย sims เป็นคะแนนจริง และ rank_sims ใช้จัดอันดับ
+    - strict: คำนวณเฉพาะ target_vectors[rows] (ถูกกว่าค้นทั้งหมด) ถ้าไม่มีอะไรผ่าน Threshold -> ค้นทั้งหมดแทน
+    - ไม่ strict: ค้นทั้งหมด แล้วเพิ่ม FILTER_BOOST ให้แถวที่ตรง Filter (Filter เดาผิดก็ไม่ทำให้ผลหาย)
+    """
+    if rows is None:
+        row_ids, sims = _score_rows(target_vectors, qvec, None, reduced)
+        return row_ids, sims, sims
+    if strict:
+        row_ids, sims = _score_rows(target_vectors, qvec, rows, reduced)
+        if float(sims.max()) >= min(config.TYPE_THRESH.values()):
+            print(f"   [Retrieval] filter -> {rows.size}/{len(target_vectors)} rows")
+            return row_ids, sims, sims
+        print(f"   [Retrieval] filter too weak (best={sims.max():.3f}). Fallback to full search.")
+        row_ids, sims = _score_rows(target_vectors, qvec, None, reduced)
+        return row_ids, sims, sims
+
+    row_ids, sims = _score_rows(target_vectors, qvec, None, reduced)
+    mask = np.zeros(len(target_vectors), dtype=bool)
+    mask[rows] = True
+    print(f"   [Retrieval] filter boost {rows.size}/{len(target_vectors)} rows")
+    return row_ids, sims, sims + config.FILTER_BOOST * mask[row_ids]
+
 def retrieval_stage(
     query: str, target_data: List[Dict[str, Any]], target_vectors: np.ndarray,
-    top_k: int = 20, mmr: bool = True, mmr_lambda: float = 0.90  
+    top_k: int = 20, mmr: bool = True, mmr_lambda: float = 0.90, adaptive: bool = False,
+    filters: Optional[Dict[str, Any]] = None, meta_index=None, reduced=None, strict: bool = False
 ) -> List[Dict[str, Any]]:
     
     if not target_data or target_vectors is None or len(target_data) == 0:
@@ -158,27 +399,43 @@ def retrieval_stage(
 
     # ส่ง vector ไปหา
     qvec = embedding.get_embedding_remote(query)
-    if np.all(qvec == 0): return []
-    
+    if qvec.size == 0 or np.all(qvec == 0): return []
+
+    # Metadata Filter (strict: ค้นเฉพาะแถวที่ตรง, ไม่ strict: เพิ่มคะแนนให้แถวที่ตรง)
+    rows = _prefilter_rows(target_data, filters, meta_index)
+
     # วัดความเหมือน
-    sims = np.dot(target_vectors, qvec)
+    row_ids, sims, rank_sims = _filtered_search(target_vectors, qvec, rows, reduced, strict)
+    matched = set(row_ids[rank_sims > sims].tolist()) if rows is not None else ()
     
-    # ดึงทั้งหมด
-    pool_k = min(len(target_data), max(top_k * 2, 70))
-    top_idx = np.argsort(sims)[::-1][:pool_k]
+    # ดึงเฉพาะอันดับต้นๆ (argpartition แทนการ sort ทั้งหมด)
+    n = len(sims)
+    max_pool = min(n, max(top_k * 2, config.ADAPTIVE_MAX_POOL))
+    if max_pool < n:
+        part = np.argpartition(-rank_sims, max_pool - 1)[:max_pool]
+    else:
+        part = np.arange(n)
+    order = part[np.argsort(-rank_sims[part])]
+
+    if adaptive:
+        pool_k, top_k = _adaptive_pool(rank_sims[order], top_k)
+        print(f"   [Retrieval] adaptive pool={pool_k} k={top_k} (s1={rank_sims[order[0]]:.3f})")
+        order = order[:pool_k]
     
     # เก็บข้อมูลคู่กับคะแนน
     cand = []
-    for idx in top_idx:
+    for pos in order:
+        idx = int(row_ids[pos])
         if idx >= len(target_data):
             print(f"   [Warning] Index {idx} is out of range. DB has {len(target_data)} items.")
             continue 
             
         cand.append({
-            "idx": int(idx),
+            "idx": idx,
             "id": _get_item_id(target_data[idx], idx),
             "data": target_data[idx],
-            "vector_score": float(sims[idx]),
+            "vector_score": float(sims[pos]),
+            "filter_match": idx in matched,
         })
         
     dedup = {}
@@ -188,7 +445,7 @@ def retrieval_stage(
         if cid not in dedup or c["vector_score"] > dedup[cid]["vector_score"]:
             dedup[cid] = c
     cand = list(dedup.values())
-    cand.sort(key=lambda x: x["vector_score"], reverse=True)
+    cand.sort(key=_rank_score, reverse=True)
 
     if not mmr or len(cand) <= top_k:
         return cand[:top_k]
@@ -205,7 +462,7 @@ def retrieval_stage(
             if i in selected_idx: continue
             
             # คะแนนความเหมือนกับคำถาม (Relevance)
-            sim_q = cand[i]["vector_score"]
+            sim_q = _rank_score(cand[i])
             
             # คะแนนความเหมือนกับสิ่งที่เลือกไปแล้ว (Redundancy)
             sel_vecs = pool_vecs[selected_idx]
@@ -227,6 +484,64 @@ def retrieval_stage(
             
     return selected
 
+def multi_retrieval_stage(
+    queries: List[str], target_data: List[Dict[str, Any]], target_vectors: np.ndarray,
+    top_k: int = 20, filters: Optional[Dict[str, Any]] = None, meta_index=None, rrf_k: int = 60,
+    reduced=None, strict: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    ค้นหลาย Sub-query พร้อมกัน: Embed ในคำขอเดียว, คำนวณ Similarity ใน Matrix Product เดียว
+    แล้วรวมอันดับด้วย Reciprocal Rank Fusion (vector_score = คะแนนสูงสุดจากทุก Sub-query)
+    """
+    queries = [q for q in queries if q and q.strip()]
+    if len(queries) <= 1:
+        return retrieval_stage(queries[0] if queries else "", target_data, target_vectors,
+                               top_k=top_k, filters=filters, meta_index=meta_index, reduced=reduced,
+                               strict=strict)
+    if not target_data or target_vectors is None or len(target_data) == 0:
+        return []
+
+    qmat = embedding.get_embeddings_batch(queries)
+    if qmat.size == 0 or qmat.shape[1] != target_vectors.shape[1]:
+        return []
+    qmat = qmat[np.linalg.norm(qmat, axis=1) > 0]
+    if len(qmat) == 0:
+        return []
+
+    rows = _prefilter_rows(target_data, filters, meta_index)
+    row_ids, sims, rank_sims = _filtered_search(target_vectors, qmat, rows, reduced, strict)
+
+    # RRF: แต่ละ Sub-query ให้คะแนน 1/(rrf_k + rank) กับอันดับต้นๆ ของตัวเอง
+    n = sims.shape[1]
+    pool = min(n, max(top_k * 2, config.ADAPTIVE_MIN_POOL))
+    fused: Dict[int, float] = {}
+    for qs in rank_sims:
+        part = np.argpartition(-qs, pool - 1)[:pool] if pool < n else np.arange(n)
+        for rank, pos in enumerate(part[np.argsort(-qs[part])], start=1):
+            fused[int(pos)] = fused.get(int(pos), 0.0) + 1.0 / (rrf_k + rank)
+    best = sims.max(axis=0)
+
+    cand, seen = [], set()
+    for pos in sorted(fused, key=fused.get, reverse=True):
+        idx = int(row_ids[pos])
+        cid = _get_item_id(target_data[idx], idx)
+        if cid in seen:
+            continue
+        seen.add(cid)
+        cand.append({
+            "idx": idx,
+            "id": cid,
+            "data": target_data[idx],
+            "vector_score": float(best[pos]),
+            "rrf_score": fused[pos],
+            "filter_match": bool(rank_sims[0, pos] > sims[0, pos]),
+        })
+        if len(cand) >= top_k:
+            break
+
+    print(f"   [Retrieval] multi-query x{len(qmat)} fused -> {len(cand)} candidates")
+    return cand
+
 # Reranking Stage 
 
 TYPE_WEIGHTS = {
@@ -249,8 +564,8 @@ def reranking_stage(
         dtype = (item.get("type") or "info").lower() 
         meta = item.get("metadata", {}) or {}
         
-        # Base Score จาก Vector
-        score = float(c.get("vector_score", 0.0)) * 100.0
+        # Base Score จาก Vector (+ คะแนนเพิ่มของแถวที่ตรง Metadata Filter)
+        score = _rank_score(c) * 100.0
         
         #  Type Boost
         score *= TYPE_WEIGHTS.get(dtype, 1.0)  
@@ -289,9 +604,9 @@ def reranking_stage(
             if any(k in status_val for k in active_keywords):
                 score += 30.0
             
-        item["metadata"]["final_rerank_score"] = score
         reranked.append((item, score))
 
     # เรียงลำดับตามคะแนนใหม่จากมากไปน้อย
     reranked.sort(key=lambda x: x[1], reverse=True)
-    return reranked[:top_k]
\ No newline at end of file
+    return reranked[:top_k]
+
@@ -0,0 +1,226 @@
+"""
+Outbound Rate Control สำหรับ Embedding Server และ Chat Endpoint (ใช้ร่วมกันทั้ง Process)
+
+- AIMD: ตอบปกติ -> เพิ่ม Concurrency ทีละน้อย, เจอ 429/5xx/Timeout -> ลดลงครึ่งหนึ่ง
+- Retry-After: ถ้า Server บอกให้รอ ทุกคำขอจะหยุดรอพร้อมกัน (ไม่ใช่ต่างคนต่าง Backoff)
+- Circuit Breaker: ล้มติดกันหลายครั้ง -> ตัดวงจร ให้ผู้เรียกได้ Error ทันทีแทนการรอ Timeout
+- Priority: คำขอ live (ผู้ใช้ถาม) ได้ก่อน bulk (Rebuild Vector) และ bulk ใช้ได้ไม่เกินสัดส่วนที่กำหนด
+"""
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+import config
+
+OK = "ok"
+OVERLOAD = "overload"   # 429 / 5xx / Timeout -> ลด Concurrency
+FAILURE = "failure"     # Error ฝั่งผู้เรียก (4xx อื่นๆ) ไม่ลด Concurrency และไม่นับเข้า Circuit Breaker
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"      # closed / open / half_open
+        self._probe_out = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+                self._probe_out = False
+            if self.state == "half_open" and not self._probe_out:
+                # ปล่อยคำขอทดสอบทีละ 1
+                self._probe_out = True
+                return True
+            return False
+
+    def cancel_probe(self) -> None:
+        with self._lock:
+            self._probe_out = False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self.failures = 0
+                self.state = "closed"
+                self._probe_out = False
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    print(f"[WARN] Circuit opened after {self.failures} failures (retry in {self.reset_after}s)")
+                self.state = "open"
+                self.opened_at = time.time()
+                self._probe_out = False
+
+
+class AIMDLimiter:
+    def __init__(self, initial: float, minimum: float, maximum: float, bulk_share: float):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.bulk_share = bulk_share
+        self.inflight = 0
+        self.live_waiting = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self.cond = threading.Condition()
+
+    def _can_enter(self, priority: str) -> bool:
+        if time.time() < self.blocked_until:
+            return False
+        cap = int(self.limit)
+        if priority == "bulk":
+            # bulk ต้องหลีกทางให้ live และใช้ได้แค่บางส่วนของ Limit
+            if self.live_waiting > 0:
+                return False
+            cap = max(1, int(self.limit * self.bulk_share))
+        return self.inflight < max(1, cap)
+
+    def acquire(self, priority: str = "live", timeout: Optional[float] = None) -> bool:
+        deadline = time.time() + timeout if timeout else None
+        with self.cond:
+            if priority == "live":
+                self.live_waiting += 1
+            try:
+                while not self._can_enter(priority):
+                    wait = 0.5
+                    if self.blocked_until > time.time():
+                        wait = min(wait, self.blocked_until - time.time())
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            return False
+                        wait = min(wait, remaining)
+                    self.cond.wait(timeout=max(0.01, wait))
+                self.inflight += 1
+                return True
+            finally:
+                if priority == "live":
+                    self.live_waiting -= 1
+
+    def release(self, outcome: str, retry_after: Optional[float] = None) -> None:
+        with self.cond:
+            self.inflight -= 1
+            self._observe(outcome, retry_after)
+
+    def observe(self, outcome: str, retry_after: Optional[float] = None) -> None:
+        # ปรับ Limit จากผลลัพธ์ โดยผู้เรียกนับ inflight เอง (เช่น LLM Router)
+        with self.cond:
+            self._observe(outcome, retry_after)
+
+    def _observe(self, outcome: str, retry_after: Optional[float]) -> None:
+        now = time.time()
+        if outcome == OK:
+            # Additive Increase: +1 ต่อ "หนึ่งรอบ" ของ Limit
+            self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+        elif outcome == OVERLOAD:
+            # Multiplicative Decrease: ลดได้ครั้งเดียวต่อช่วงเวลา กันการลดซ้ำจากคำขอชุดเดียวกัน
+            if now - self._last_decrease >= config.RATE_DECREASE_INTERVAL:
+                self.limit = max(self.minimum, self.limit * 0.5)
+                self._last_decrease = now
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.cond.notify_all()
+
+    def current_limit(self) -> int:
+        return max(1, int(self.limit))
+
+
+class OutboundController:
+    def __init__(self, name: str):
+        self.name = name
+        self.limiter = AIMDLimiter(
+            initial=config.RATE_INITIAL_CONCURRENCY,
+            minimum=config.RATE_MIN_CONCURRENCY,
+            maximum=config.RATE_MAX_CONCURRENCY,
+            bulk_share=config.RATE_BULK_SHARE,
+        )
+        self.breaker = CircuitBreaker(config.CIRCUIT_FAILURES, config.CIRCUIT_RESET_SEC)
+
+    @contextmanager
+    def call(self, priority: str = "live", timeout: Optional[float] = None):
+        """
+        with ctl.call("live") as report:
+            resp = http.post(...)
+            report(classify(resp.status_code), retry_after)
+        ไม่เรียก report -> ถือว่าสำเร็จ, เกิด Exception -> ถือว่า overload
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.name} circuit is open")
+        if not self.limiter.acquire(priority, timeout=timeout):
+            self.breaker.cancel_probe()
+            raise TimeoutError(f"{self.name} rate limiter wait timeout")
+
+        result = {"outcome": OK, "retry_after": None}
+
+        def report(outcome: str, retry_after: Optional[float] = None) -> None:
+            result["outcome"] = outcome
+            result["retry_after"] = retry_after
+
+        try:
+            yield report
+        except Exception:
+            result["outcome"] = OVERLOAD
+            raise
+        finally:
+            self.limiter.release(result["outcome"], result["retry_after"])
+            self.breaker.record(result["outcome"] != OVERLOAD)
+
+    def observe(self, outcome: str, retry_after: Optional[float] = None) -> None:
+        # สำหรับผู้เรียกที่คุม Concurrency เอง (LLM Router) แต่ต้องการ AIMD + Circuit Breaker
+        self.limiter.observe(outcome, retry_after)
+        self.breaker.record(outcome != OVERLOAD)
+
+    def allow(self) -> bool:
+        # ใช้เช็คแบบไม่จองคิว (เช่น Router ดูว่า Backend ยังใช้ได้ไหม)
+        return self.breaker.state != "open" or time.time() - self.breaker.opened_at >= self.breaker.reset_after
+
+
+def classify_status(status_code: int) -> str:
+    if status_code == 429 or 500 <= status_code <= 599:
+        return OVERLOAD
+    if 200 <= status_code < 300:
+        return OK
+    return FAILURE
+
+
+def classify_exception(exc: Exception) -> str:
+    """แปลง Exception ของ OpenAI SDK / httpx เป็น outcome"""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return classify_status(status)
+    name = type(exc).__name__
+    if "Timeout" in name or "Connection" in name or "Connect" in name:
+        return OVERLOAD
+    return FAILURE
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return min(float(value), config.RATE_MAX_RETRY_AFTER) if value else None
+    except ValueError:
+        return None  # รูปแบบ HTTP-date ไม่รองรับ ใช้ Backoff ปกติ
+
+
+_CONTROLLERS: Dict[str, OutboundController] = {}
+_CONTROLLERS_LOCK = threading.Lock()
+
+
+def get_controller(name: str) -> OutboundController:
+    with _CONTROLLERS_LOCK:
+        ctl = _CONTROLLERS.get(name)
+        if ctl is None:
+            ctl = OutboundController(name)
+            _CONTROLLERS[name] = ctl
+        return ctl
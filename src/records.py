@@ -0,0 +1,127 @@
+"""
+Knowledge Record แบบกะทัดรัดและแก้ไขไม่ได้ (ใช้แทน dict ซ้อน dict ของ all_data)
+
+- __slots__ ไม่มี __dict__ ต่อ Record, Metadata เก็บเป็น Tuple ของค่า + Schema (ชื่อ Key) ที่ใช้ร่วมกัน
+- String ที่ซ้ำกันมาก (type / source / category / topic ...) ถูก intern ให้ชี้ Object เดียวกัน
+- อ่านได้เหมือน dict เดิม (item["content"], item.get("metadata", {}).get("source")) แต่เขียนไม่ได้
+  ทุก Session จึงแชร์ Record ชุดเดียวกันได้โดยไม่ต้องใช้ Lock
+"""
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Tuple
+
+# String ยาวกว่านี้ (เช่น เนื้อหา) ไม่ intern
+_INTERN_MAX_LEN = 200
+
+_SCHEMAS: Dict[Tuple[str, ...], "_Schema"] = {}
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= _INTERN_MAX_LEN else value
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return Metadata(value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class _Schema:
+    __slots__ = ("keys", "pos")
+
+    def __init__(self, keys: Tuple[str, ...]):
+        self.keys = keys
+        self.pos = {k: i for i, k in enumerate(keys)}
+
+
+class _ReadOnly:
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+
+class Metadata(_ReadOnly, Mapping):
+    __slots__ = ("_schema", "_vals")
+
+    def __init__(self, meta: Dict[str, Any]):
+        keys = tuple(sys.intern(str(k)) for k in meta.keys())
+        schema = _SCHEMAS.get(keys)
+        if schema is None:
+            schema = _SCHEMAS.setdefault(keys, _Schema(keys))
+        object.__setattr__(self, "_schema", schema)
+        object.__setattr__(self, "_vals", tuple(_freeze(v) for v in meta.values()))
+
+    def __getitem__(self, key: str) -> Any:
+        return self._vals[self._schema.pos[key]]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        i = self._schema.pos.get(key)
+        return default if i is None else self._vals[i]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._schema.keys)
+
+    def __len__(self) -> int:
+        return len(self._vals)
+
+    def __repr__(self) -> str:
+        return f"Metadata({dict(self.items())!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _thaw(self)
+
+
+class KnowledgeRecord(_ReadOnly, Mapping):
+    __slots__ = ("id", "content", "type", "metadata")
+    _KEYS = ("id", "content", "type", "metadata")
+
+    def __init__(self, id: str, content: str, type: str, metadata: Dict[str, Any]):
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "content", content)
+        object.__setattr__(self, "type", _freeze(type))
+        object.__setattr__(self, "metadata", metadata if isinstance(metadata, Metadata) else Metadata(metadata or {}))
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "KnowledgeRecord":
+        return cls(item.get("id"), item.get("content", ""), item.get("type", "info"), item.get("metadata") or {})
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._KEYS else default
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+    # Record ต่างชิ้นถือว่าต่างกัน (เทียบด้วย Identity ไม่ต้องเทียบเนื้อหาทั้งก้อน)
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"KnowledgeRecord(id={self.id!r}, type={self.type!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "content": self.content, "type": self.type, "metadata": self.metadata.to_dict()}
+
+
+def compact(data: List[Any]) -> List[KnowledgeRecord]:
+    """แปลง List ของ dict เป็น KnowledgeRecord (Record ที่แปลงแล้วใช้ซ้ำได้เลย)"""
+    return [item if isinstance(item, KnowledgeRecord) else KnowledgeRecord.from_dict(item) for item in data]
@@ -0,0 +1,263 @@
+"""
+ลดมิติ Vector ของ Knowledge Base (ทางเลือก: REDUCE_METHOD=pca | prefix)
+
+- pca    : Fit Projection (PCA) จาก Vector ของ Corpus เก็บไว้ที่ REDUCE_PATH คู่กับ Vector Cache
+           (Fit ใหม่อัตโนมัติเมื่อ Corpus เปลี่ยน)
+- prefix : ตัดเอา REDUCE_DIM มิติแรก (Matryoshka) ใช้ได้ดีเฉพาะ Model ที่ Train แบบ Matryoshka มาเท่านั้น
+ค้นใน Vector ที่ลดมิติแล้ว (Matrix เล็กกว่า สแกนเร็วกว่า) ได้ Shortlist REDUCE_SHORTLIST แถว
+แล้วคำนวณคะแนนจริงด้วย Vector เต็มเฉพาะ Shortlist (คะแนนที่ส่งต่อยังเป็น Cosine เต็มมิติเหมือนเดิม)
+
+วัด Recall ที่เสียไปของแต่ละจำนวนมิติ (ใช้ Vector จาก Snapshot):
+    python -m src.reduction recall [--dims 128,256,384,512] [--method pca] [--k 20] [--queries 200]
+"""
+import os
+import sys
+import hashlib
+import time
+import argparse
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import config
+from .retrieval_scheduler import SCHEDULER
+
+# จำนวนแถวสูงสุดที่ใช้ Fit PCA (Corpus ใหญ่กว่านี้สุ่มตัวอย่าง)
+_FIT_MAX_ROWS = 20000
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (x / norms).astype("float32", copy=False)
+
+
+def fingerprint(vectors: np.ndarray) -> str:
+    # ใช้ตรวจว่า Projection ที่เก็บไว้ Fit จาก Corpus ชุดนี้หรือไม่ (ไม่ต้อง Hash ทั้ง Matrix)
+    step = max(1, len(vectors) // 256)
+    sample = np.ascontiguousarray(vectors[::step], dtype="float32")
+    return f"{vectors.shape[0]}x{vectors.shape[1]}:{hashlib.sha1(sample.tobytes()).hexdigest()[:12]}"
+
+
+class Projection:
+    """แปลง Vector เต็ม (d,) หรือ (m, d) -> Vector ลดมิติที่ Normalize แล้ว"""
+
+    def __init__(self, method: str, dim: int, mean: Optional[np.ndarray] = None,
+                 components: Optional[np.ndarray] = None):
+        self.method = method
+        self.dim = dim
+        self.mean = mean
+        self.components = components   # (d, dim) สำหรับ pca
+
+    @classmethod
+    def fit_pca(cls, vectors: np.ndarray, dim: int) -> "Projection":
+        start = time.time()
+        x = vectors
+        if len(x) > _FIT_MAX_ROWS:
+            rng = np.random.default_rng(0)
+            x = x[rng.choice(len(x), _FIT_MAX_ROWS, replace=False)]
+        x = x.astype("float64")
+        mean = x.mean(axis=0)
+        xc = x - mean
+        # Eigen ของ Covariance (d x d) เร็วกว่า SVD ของทั้ง Corpus เมื่อ n > d
+        eigvals, eigvecs = np.linalg.eigh(xc.T @ xc)
+        order = np.argsort(eigvals)[::-1][:dim]
+        explained = float(eigvals[order].sum() / max(eigvals.sum(), 1e-12))
+        print(f"[INFO] PCA fit: {vectors.shape[1]} -> {dim} dims "
+              f"(variance kept {explained:.1%}) in {time.time() - start:.2f}s")
+        return cls("pca", dim, mean.astype("float32"), eigvecs[:, order].astype("float32"))
+
+    @classmethod
+    def prefix(cls, dim: int) -> "Projection":
+        return cls("prefix", dim)
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        if self.method == "pca":
+            return _unit_rows((x - self.mean) @ self.components)
+        return _unit_rows(x[..., :self.dim])
+
+    def save(self, path: str, fp: str) -> None:
+        temp_file = f"{path}.tmp.npz"
+        np.savez(
+            temp_file, method=np.array(self.method), dim=np.array(self.dim), fingerprint=np.array(fp),
+            embed_model=np.array(config.UNI_EMBED_MODEL),
+            mean=self.mean if self.mean is not None else np.zeros(0, dtype="float32"),
+            components=self.components if self.components is not None else np.zeros((0, 0), dtype="float32"),
+        )
+        os.replace(temp_file, path)
+        print(f"[INFO] Projection saved: {path}")
+
+    @classmethod
+    def load(cls, path: str, method: str, dim: int, fp: str) -> Optional["Projection"]:
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                if (str(npz["method"]) != method or int(npz["dim"]) != dim or str(npz["fingerprint"]) != fp
+                        or str(npz["embed_model"]) != config.UNI_EMBED_MODEL):
+                    return None
+                return cls(method, dim, npz["mean"].astype("float32"), npz["components"].astype("float32"))
+        except Exception as e:
+            print(f"[WARN] Projection read failed ({path}): {e}")
+            return None
+
+
+class ReducedIndex:
+    """Vector ลดมิติของ Corpus + ค้นแบบ Shortlist แล้ว Re-score ด้วย Vector เต็ม"""
+
+    def __init__(self, vectors: np.ndarray, projection: Projection, shortlist: int):
+        self.vectors = vectors
+        self.projection = projection
+        self.shortlist = shortlist
+        self.reduced = projection.transform(vectors)
+
+    def score(self, qvec: np.ndarray, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        คืน (row_ids, sims) เหมือน rag_engine._score_rows แต่ row_ids เป็นเฉพาะ Shortlist
+        qvec (d,) -> sims (s,), qvec (m, d) -> sims (m, s) ; sims คือ Cosine ของ Vector เต็ม
+        """
+        n = len(self.vectors) if rows is None else len(rows)
+        if n <= self.shortlist:
+            ids = np.arange(n) if rows is None else rows
+            return ids, np.dot(qvec, self.vectors[ids].T)
+
+        rq = self.projection.transform(qvec)
+        if rows is None:
+            approx = SCHEDULER.score(self.reduced, rq)
+        else:
+            approx = np.dot(rq, self.reduced[rows].T)
+
+        # Shortlist ต่อ Sub-query แล้วรวมกัน (Multi-query)
+        approx2 = approx.reshape(1, -1) if approx.ndim == 1 else approx
+        top = np.argpartition(-approx2, self.shortlist - 1, axis=1)[:, :self.shortlist]
+        pos = np.unique(top)
+        ids = pos if rows is None else rows[pos]
+        return ids, np.dot(qvec, self.vectors[ids].T)
+
+    def nbytes(self) -> int:
+        return int(self.reduced.nbytes)
+
+
+def build(vectors: Optional[np.ndarray], method: Optional[str] = None, dim: Optional[int] = None,
+          shortlist: Optional[int] = None, path: Optional[str] = None) -> Optional[ReducedIndex]:
+    """สร้าง ReducedIndex ตาม Config (None ถ้าปิดอยู่ หรือ Vector ไม่พอให้ลดมิติ)"""
+    method = (method or config.REDUCE_METHOD).lower()
+    dim = dim or config.REDUCE_DIM
+    shortlist = shortlist or config.REDUCE_SHORTLIST
+    path = config.REDUCE_PATH if path is None else path
+    if method not in ("pca", "prefix") or vectors is None or vectors.ndim != 2:
+        return None
+    if dim >= vectors.shape[1] or len(vectors) <= max(shortlist, dim):
+        print(f"[INFO] Reduction skipped ({len(vectors)} x {vectors.shape[1]}, dim={dim}).")
+        return None
+
+    if method == "prefix":
+        projection = Projection.prefix(dim)
+    else:
+        fp = fingerprint(vectors)
+        projection = Projection.load(path, method, dim, fp)
+        if projection is None:
+            projection = Projection.fit_pca(vectors, dim)
+            if path:
+                try:
+                    projection.save(path, fp)
+                except Exception as e:
+                    print(f"[WARN] Projection save failed: {e}")
+        else:
+            print(f"[INFO] Loaded projection from {path}")
+
+    index = ReducedIndex(vectors, projection, shortlist)
+    print(f"[INFO] Reduced index: {vectors.shape[1]} -> {dim} dims ({method}), "
+          f"scan matrix {index.nbytes() / 2**20:.1f} MB vs {vectors.nbytes / 2**20:.1f} MB, shortlist={shortlist}")
+    return index
+
+
+# CLI
+
+def recall_report(vectors: np.ndarray, dims: List[int], method: str, k: int, n_queries: int,
+                  shortlist: int, queries: Optional[np.ndarray] = None) -> List[Dict[str, float]]:
+    """Recall@k ของการค้นแบบลดมิติ + Re-score เทียบกับการค้นด้วย Vector เต็ม"""
+    if queries is None:
+        # ใช้ Chunk ของ Corpus เองเป็นคำถาม (ตัดแถวตัวเองออกจากคำตอบ)
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)
+        queries = vectors[picks]
+    else:
+        picks = None
+
+    exact = queries @ vectors.T
+    if picks is not None:
+        exact[np.arange(len(picks)), picks] = -np.inf
+    truth = np.argsort(-exact, axis=1)[:, :k]
+
+    start = time.time()
+    for q in queries:
+        np.dot(vectors, q)
+    full_ms = (time.time() - start) * 1000 / len(queries)
+
+    report = []
+    for dim in dims:
+        if method == "prefix":
+            projection = Projection.prefix(dim)
+        else:
+            projection = Projection.fit_pca(vectors, dim)
+        index = ReducedIndex(vectors, projection, shortlist)
+        hit = 0
+        for i, q in enumerate(queries):
+            ids, sims = index.score(q)
+            if picks is not None:
+                sims = np.where(ids == picks[i], -np.inf, sims)
+            got = ids[np.argsort(-sims)[:k]]
+            hit += len(set(got.tolist()) & set(truth[i].tolist()))
+        # เวลาสแกนล้วน (ไม่รวมหน้าต่างรอรวม Batch ของ Scheduler)
+        start = time.time()
+        for q in queries:
+            np.dot(index.reduced, projection.transform(q))
+        scan_ms = (time.time() - start) * 1000 / len(queries)
+        report.append({
+            "dim": dim,
+            f"recall@{k}": round(hit / (k * len(queries)), 4),
+            "scan_ms": round(scan_ms, 3),
+            "full_scan_ms": round(full_ms, 3),
+            "scan_mb": round(index.nbytes() / 2**20, 2),
+        })
+    return report
+
+
+def _cmd_recall(args) -> int:
+    from . import snapshot, embedding
+    loaded = snapshot.load_snapshot(args.path)
+    if not loaded:
+        print(f"[ERROR] No readable snapshot at {args.path}")
+        return 1
+    _, vectors = loaded
+    queries = None
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.queries]
+        queries = embedding.get_embeddings_batch(texts)
+    dims = [int(d) for d in args.dims.split(",") if d.strip()]
+    print(f"[INFO] Full width: {vectors.shape[1]} dims, {vectors.nbytes / 2**20:.1f} MB, {len(vectors)} rows")
+    for row in recall_report(vectors, dims, args.method, args.k, args.queries, args.shortlist, queries):
+        print("   " + "  ".join(f"{key}={val}" for key, val in row.items()))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.reduction", description="Vector reduction tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_recall = sub.add_parser("recall", help="Report recall loss per target dimension")
+    p_recall.add_argument("--path", default=config.SNAPSHOT_PATH)
+    p_recall.add_argument("--dims", default="128,256,384,512")
+    p_recall.add_argument("--method", default="pca", choices=["pca", "prefix"])
+    p_recall.add_argument("--k", type=int, default=config.RETRIEVE_TOPK)
+    p_recall.add_argument("--queries", type=int, default=200, help="Number of queries to sample")
+    p_recall.add_argument("--shortlist", type=int, default=config.REDUCE_SHORTLIST)
+    p_recall.add_argument("--questions", default=None, help="Text file of real questions (one per line) to embed")
+    p_recall.set_defaults(func=_cmd_recall)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
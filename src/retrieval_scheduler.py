@@ -0,0 +1,104 @@
+"""
+Retrieval Scheduler: รวม Query Vector ที่เข้ามาในช่วงเวลาสั้นๆ (หลาย Session พร้อมกัน)
+แล้วคำนวณ Similarity ด้วย Matrix-Matrix Product ครั้งเดียว แทน Matrix-Vector ต่อคน
+
+- ถ้าไม่มีคำขออื่นกำลังคำนวณอยู่ คำนวณทันทีไม่ต้องรอ (ผู้ใช้คนเดียวไม่เสียเวลา Window)
+- ถ้ามีคำขออื่นอยู่ คนแรกที่มาถึงเป็น Leader: รอ RETRIEVAL_BATCH_WINDOW_MS หรือจนครบ RETRIEVAL_MAX_BATCH แล้วคำนวณให้ทั้งชุด
+- คนที่ตามมาในช่วงนั้นรอผลของตัวเอง (แถวของตัวเองใน Matrix ผลลัพธ์)
+- จำกัดจำนวน Thread ของ BLAS ด้วย BLAS_THREADS (ต้องมี threadpoolctl) ไม่ให้ Thread ของ Streamlit แย่ง Core กัน
+"""
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+import config
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # ไม่มี threadpoolctl -> ใช้ OMP_NUM_THREADS / OPENBLAS_NUM_THREADS แทน
+    threadpool_limits = None
+
+
+class _Batch:
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+        self.queries: List[np.ndarray] = []
+        self.rows = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[Exception] = None
+
+
+class RetrievalScheduler:
+    def __init__(self, window_ms: float, max_batch: int, blas_threads: int = 0):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._open: Dict[int, _Batch] = {}   # id(matrix) -> Batch ที่ยังรับคำขอเพิ่มได้
+        self._lock = threading.Lock()
+        self._active = 0   # จำนวนคำขอที่อยู่ใน score() ตอนนี้
+        if blas_threads > 0 and threadpool_limits is not None:
+            threadpool_limits(limits=blas_threads, user_api="blas")
+            print(f"[INFO] BLAS threads limited to {blas_threads}")
+
+    def score(self, matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """
+        q เป็น Vector (d,) -> คืน (n,) หรือ Matrix (m, d) -> คืน (m, n)
+        ผลเหมือน np.dot(matrix, q) แต่คำนวณรวมกับคำขออื่นที่มาพร้อมกัน
+        """
+        single = q.ndim == 1
+        q2 = q.reshape(1, -1) if single else q
+        if self.window <= 0 or q2.shape[1] != matrix.shape[1]:
+            out = q2 @ matrix.T
+            return out[0] if single else out
+
+        with self._lock:
+            alone = self._active == 0
+            self._active += 1
+        try:
+            if alone:
+                # ไม่มีใครให้รวม Batch ด้วย -> คำนวณเลย คำขอที่ตามมาระหว่างนี้จะรวม Batch กันเอง
+                out = q2 @ matrix.T
+                return out[0] if single else out
+            return self._batched(matrix, q2, single)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _batched(self, matrix: np.ndarray, q2: np.ndarray, single: bool) -> np.ndarray:
+        key = id(matrix)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None or batch.matrix is not matrix
+            if leader:
+                batch = _Batch(matrix)
+                self._open[key] = batch
+            start = batch.rows
+            batch.queries.append(q2)
+            batch.rows += len(q2)
+            if batch.rows >= self.max_batch:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            try:
+                queries = np.concatenate(batch.queries).astype(matrix.dtype, copy=False)
+                batch.result = queries @ matrix.T
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        out = batch.result[start:start + len(q2)]
+        return out[0] if single else out
+
+
+# ใช้ร่วมกันทั้ง Process (ทุก Streamlit Session)
+SCHEDULER = RetrievalScheduler(config.RETRIEVAL_BATCH_WINDOW_MS, config.RETRIEVAL_MAX_BATCH, config.BLAS_THREADS)
@@ -0,0 +1,173 @@
+"""
+Knowledge Snapshot: รวม Chunk + Metadata + Vector ไว้ในไฟล์เดียว (.npz)
+เพื่อให้ Container ใหม่พร้อมใช้งานทันทีโดยไม่ต้องดึง DB หรือเรียก Embedding Server
+
+สร้าง Snapshot (รันนอก Container ที่เข้าถึง DB/Embedding ได้):
+    python -m src.snapshot build [--out knowledge_snapshot.npz] [--force-refresh]
+ดูข้อมูล Snapshot:
+    python -m src.snapshot info [--path knowledge_snapshot.npz]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import config
+from . import data_loader, embedding, dedup
+
+SNAPSHOT_FORMAT = 1
+
+
+def _json_default(val):
+    if isinstance(val, (datetime.date, datetime.datetime)):
+        return val.isoformat()
+    if hasattr(val, "to_dict"):  # KnowledgeRecord / Metadata
+        return val.to_dict()
+    return str(val)
+
+
+def save_snapshot(path: str, data: List[Dict[str, Any]], vectors: np.ndarray, version: Optional[str]) -> None:
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": str(version) if version is not None else None,
+        "embed_model": config.UNI_EMBED_MODEL,
+        "dedup": dedup.settings(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "count": len(data),
+        "dim": int(vectors.shape[1]) if vectors is not None and vectors.ndim == 2 else 0,
+    }
+    payload = json.dumps({"manifest": manifest, "data": data}, ensure_ascii=False, default=_json_default)
+
+    # เขียนไฟล์ชั่วคราวแล้ว replace เพื่อไม่ให้ Replica อื่นอ่านไฟล์ครึ่งๆ กลางๆ
+    temp_file = f"{path}.tmp.npz"
+    np.savez(
+        temp_file,
+        vectors=np.asarray(vectors, dtype="float32"),
+        payload=np.frombuffer(payload.encode("utf-8"), dtype=np.uint8),
+    )
+    os.replace(temp_file, path)
+    print(f"[INFO] Snapshot saved: {path} ({manifest['count']} items, version={manifest['version']})")
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    loaded = _read(path)
+    return loaded[2] if loaded else None
+
+
+def _read(path: str) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray, Dict[str, Any]]]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            vectors = npz["vectors"].astype("float32", copy=False)
+            payload = json.loads(npz["payload"].tobytes().decode("utf-8"))
+        return payload["data"], vectors, payload["manifest"]
+    except Exception as e:
+        print(f"[WARN] Snapshot read failed ({path}): {e}")
+        return None
+
+
+def load_snapshot(path: str, expected_version: Optional[str] = None) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray]]:
+    """
+    โหลด Snapshot ถ้าใช้ได้ (Format/Model/ค่า Dedup ตรง และ Version ตรงเมื่อระบุ)
+    คืนค่า None ถ้าต้องกลับไปโหลดจาก DB
+    """
+    start = time.time()
+    loaded = _read(path)
+    if not loaded:
+        return None
+    data, vectors, manifest = loaded
+
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        print(f"[INFO] Snapshot format {manifest.get('format')} != {SNAPSHOT_FORMAT}. Ignored.")
+        return None
+    if manifest.get("embed_model") != config.UNI_EMBED_MODEL:
+        print(f"[INFO] Snapshot model '{manifest.get('embed_model')}' != '{config.UNI_EMBED_MODEL}'. Ignored.")
+        return None
+    if manifest.get("dedup") != dedup.settings():
+        # Corpus ใน Snapshot ถูก Dedup ด้วยค่าอื่น (DEDUP_ENABLED / DEDUP_SIM) -> สร้างใหม่
+        print(f"[INFO] Snapshot dedup settings {manifest.get('dedup')} != {dedup.settings()}. Ignored.")
+        return None
+    if expected_version is not None and manifest.get("version") != str(expected_version):
+        print(f"[INFO] Snapshot version {manifest.get('version')} != DB {expected_version}. Ignored.")
+        return None
+    if len(data) != len(vectors):
+        print(f"[WARN] Snapshot corrupted: {len(data)} items vs {len(vectors)} vectors. Ignored.")
+        return None
+
+    print(f"[INFO] Loaded snapshot {path} ({len(data)} items, version={manifest.get('version')}) in {time.time() - start:.3f}s")
+    return data, vectors
+
+
+def load_or_build(day_key=None, force_refresh: bool = False) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+    """
+    ใช้ Snapshot ก่อนถ้า Version ตรงกับ DB (หรือ DB ไม่ตอบ -> ใช้ Snapshot ที่มีอยู่)
+    ไม่เช่นนั้นโหลดจาก DB และ Embed ตามปกติ
+    """
+    if not force_refresh:
+        db_unknown = day_key is None or str(day_key) == "None"
+        snap = load_snapshot(config.SNAPSHOT_PATH, None if db_unknown else str(day_key))
+        if snap:
+            return snap
+
+    all_data = dedup.exact_dedup(data_loader.load_knowledge(day_key))
+    all_vecs = embedding.build_vector_store(all_data, config.CACHE_JSON, force_refresh=force_refresh)
+    all_data, all_vecs = dedup.near_dedup(all_data, all_vecs)
+
+    # เก็บ Snapshot ของ Version นี้ไว้ให้ Replica/การ Restart ครั้งถัดไป
+    if day_key is not None and all_vecs is not None and len(all_vecs) == len(all_data):
+        try:
+            save_snapshot(config.SNAPSHOT_PATH, all_data, all_vecs, str(day_key))
+        except Exception as e:
+            print(f"[WARN] Snapshot save failed: {e}")
+    return all_data, all_vecs
+
+
+# CLI
+
+def _cmd_build(args) -> int:
+    version = data_loader.get_sync_metadata()
+    if version is None:
+        print("[ERROR] Cannot read system_metadata.last_updated. Aborting.")
+        return 1
+    data = dedup.exact_dedup(data_loader.load_knowledge(str(version)))
+    vectors = embedding.build_vector_store(data, config.CACHE_JSON, force_refresh=args.force_refresh)
+    if vectors is None or len(vectors) != len(data):
+        print("[ERROR] Vector build failed. Snapshot not written.")
+        return 1
+    data, vectors = dedup.near_dedup(data, vectors)
+    save_snapshot(args.out, data, vectors, str(version))
+    return 0
+
+
+def _cmd_info(args) -> int:
+    manifest = read_manifest(args.path)
+    if not manifest:
+        print(f"[ERROR] No readable snapshot at {args.path}")
+        return 1
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.snapshot", description="Knowledge snapshot tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="Build snapshot from DB + embedding server")
+    p_build.add_argument("--out", default=config.SNAPSHOT_PATH)
+    p_build.add_argument("--force-refresh", action="store_true", help="Ignore vector cache and re-embed everything")
+    p_build.set_defaults(func=_cmd_build)
+
+    p_info = sub.add_parser("info", help="Print snapshot manifest")
+    p_info.add_argument("--path", default=config.SNAPSHOT_PATH)
+    p_info.set_defaults(func=_cmd_info)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+from typing import List, Dict, Tuple, Any, Optional
+
+ProcKey = Tuple[str, str]   # (เอกสาร, หัวข้อ)
+
+
+def _step_no(meta: Dict[str, Any]) -> Optional[int]:
+    try:
+        val = meta.get("step_number")
+        return int(val) if val is not None and str(val).strip() != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+class StepIndex:
+    """
+    Index เอกสาร -> ขั้นตอนเรียงลำดับ (สร้างครั้งเดียวตอนโหลด)
+    เมื่อ Retrieval เจอขั้นตอนใดขั้นตอนหนึ่งของคู่มือ ดึงขั้นตอนทั้งหมดของหัวข้อนั้นได้ทันทีโดยไม่ต้องค้น Vector เพิ่ม
+    """
+
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.procedures: Dict[ProcKey, List[int]] = {}
+        self._proc_of_id: Dict[str, ProcKey] = {}
+
+        staged: Dict[ProcKey, List[Tuple[int, int]]] = {}
+        for idx, item in enumerate(data):
+            meta = item.get("metadata") or {}
+            step = _step_no(meta)
+            source = meta.get("source")
+            if step is None or not source:
+                continue
+            key = (source, meta.get("topic") or "")
+            staged.setdefault(key, []).append((step, idx))
+
+        for key, steps in staged.items():
+            steps.sort()
+            self.procedures[key] = [idx for _, idx in steps]
+            for _, idx in steps:
+                item_id = data[idx].get("id")
+                if item_id:
+                    self._proc_of_id[str(item_id)] = key
+
+        print(f"[INFO] Step index built: {len(self.procedures)} procedures, {len(self._proc_of_id)} steps.")
+
+    def procedure_of(self, item: Dict[str, Any]) -> Optional[ProcKey]:
+        return self._proc_of_id.get(str(item.get("id")))
+
+    def steps(self, key: ProcKey) -> List[Dict[str, Any]]:
+        return [self.data[i] for i in self.procedures.get(key, [])]
+
+    def expand(self, results: List[Tuple[Dict[str, Any], float]], max_steps: int = 40
+               ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        แทนที่ขั้นตอนของคู่มืออันดับสูงสุดใน results ด้วยขั้นตอนทั้งหมดของหัวข้อนั้นตามลำดับ
+        (ใช้คะแนนของขั้นตอนที่เจอ เพื่อให้ผ่าน Threshold และอยู่ก้อนเดียวกันใน Context)
+        """
+        for item, score in results:
+            key = self.procedure_of(item)
+            if key is None:
+                continue
+            steps = self.steps(key)
+            if len(steps) <= 1 or len(steps) > max_steps:
+                return results
+            step_ids = {s.get("id") for s in steps}
+            rest = [(it, sc) for it, sc in results if it.get("id") not in step_ids]
+            print(f"   [StepIndex] '{key[1] or key[0]}' -> {len(steps)} steps")
+            return [(s, score) for s in steps] + rest
+        return results
@@ -0,0 +1,58 @@
+"""
+Version ของ Knowledge Base ที่ใช้อยู่ (เก็บใน Memory ของ Process)
+
+- Streamlit Rerun อ่านค่าจาก Memory ไม่ต้องเปิด Connection ไป DB ทุกครั้ง
+- อ่านจาก DB เฉพาะตอนเริ่ม Process และตอน Sync Job (poll) เท่านั้น
+- DB ล่ม -> คง Version เดิมไว้ (ไม่เปลี่ยน Cache Key ของ setup_system จนต้องโหลดใหม่)
+- เริ่ม Process ตอน DB ล่ม -> ใช้ Version ของ Snapshot ที่มีอยู่
+"""
+import threading
+from typing import Optional
+import config
+from . import data_loader, snapshot
+
+
+class VersionWatcher:
+    def __init__(self):
+        self._version: Optional[str] = None
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[str]:
+        """Version ที่ใช้ Serve อยู่ (เรียกได้ทุก Rerun ไม่แตะ DB ยกเว้นครั้งแรกของ Process)"""
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._version = self.poll() or self._snapshot_version()
+                    self._resolved = True
+                    print(f"[INFO] Knowledge version: {self._version}")
+        return self._version
+
+    def poll(self) -> Optional[str]:
+        """อ่าน Version ล่าสุดจาก DB (None ถ้า DB ไม่ตอบ) ไม่เปลี่ยนค่าที่ใช้อยู่"""
+        try:
+            latest = data_loader.get_sync_metadata()
+        except Exception as e:
+            print(f"[WARN] Version poll failed: {e}")
+            return None
+        return str(latest) if latest is not None else None
+
+    def set(self, version: str) -> None:
+        # เรียกหลังโหลด Knowledge Base ของ Version ใหม่เสร็จแล้วเท่านั้น
+        with self._lock:
+            if version != self._version:
+                print(f"[INFO] Knowledge version switched: {self._version} -> {version}")
+            self._version = version
+            self._resolved = True
+
+    @staticmethod
+    def _snapshot_version() -> Optional[str]:
+        manifest = snapshot.read_manifest(config.SNAPSHOT_PATH) or {}
+        version = manifest.get("version")
+        if version:
+            print(f"[WARN] DB unavailable. Using snapshot version {version}.")
+        return version
+
+
+# ใช้ร่วมกันทั้ง Process (ทุก Streamlit Session)
+WATCHER = VersionWatcher()
@@ -0,0 +1,88 @@
+"""
+Warm-up หลัง Sync: เตรียมคำถามยอดนิยมไว้ใน Cache ก่อนผู้ใช้คนแรกจะถาม
+
+- คำถามมาจากปุ่มคำถามแนะนำใน app.py + คำถามที่ถูกถามบ่อยและได้ Feedback ดีใน chat_logs
+- ทุกคำถาม (ไม่เกิน WARMUP_MAX_QUESTIONS) -> Rewrite + Query Embedding (เข้า Cache ของ rag_engine/embedding)
+- คำถามต้นๆ (ไม่เกิน WARMUP_MAX_ANSWERS) -> สร้างคำตอบเต็มเก็บใน answer_cache
+- ทำทีละคำถามผ่าน Admission Control (Session "warmup") จึงไม่แย่ง Slot ผู้ใช้จริงเกินหนึ่งคิว
+  และหยุดเมื่อเกิน WARMUP_TIME_BUDGET
+"""
+import time
+from typing import Any, Dict, List, Optional
+import config
+from . import data_loader, rag_engine, pipeline, coalesce, answer_cache
+
+
+def collect_questions(suggestions: List[str], limit: Optional[int] = None) -> List[str]:
+    limit = limit or config.WARMUP_MAX_QUESTIONS
+    questions, seen = [], set()
+    top = data_loader.fetch_top_questions(limit, config.WARMUP_MIN_RATING)
+    for q in list(suggestions) + top:
+        q = (q or "").replace("\n", " ").strip()
+        norm = coalesce.normalize_query(q)
+        if norm and norm not in seen:
+            seen.add(norm)
+            questions.append(q)
+    return questions[:limit]
+
+
+def run_warmup(kb, client, questions: List[str],
+               max_answers: Optional[int] = None, time_budget: Optional[float] = None) -> Dict[str, Any]:
+    max_answers = config.WARMUP_MAX_ANSWERS if max_answers is None else max_answers
+    time_budget = config.WARMUP_TIME_BUDGET if time_budget is None else time_budget
+    start = time.time()
+    stats = {"questions": 0, "answers": 0, "skipped": 0, "failed": 0}
+
+    answer_cache.CACHE.retain_version(kb.version)
+    history = []  # คำถามแรกของ Session (ไม่มีบริบทจากข้อความก่อนหน้า)
+
+    for q in questions:
+        if time.time() - start > time_budget:
+            print(f"[WARN] Warm-up time budget ({time_budget}s) reached. Stopped at {stats['questions']} questions.")
+            break
+
+        intent = rag_engine.analyze_intent(q, kb.fund_index, kb.domain_centroids, kb.glossary)
+        if intent in ("BLOCK", "DEFINE") or (intent == "FUND" and kb.fund_index.answer(q)):
+            # ถูกบล็อก หรือ ตอบได้จาก Fund Index / Glossary ทันทีอยู่แล้ว
+            stats["skipped"] += 1
+            continue
+
+        key = coalesce.make_key(q, kb.version, "")
+        if answer_cache.CACHE.get(key) is not None:
+            stats["skipped"] += 1
+            continue
+
+        want_answer = stats["answers"] < max_answers
+        final, context = {}, {}
+
+        def emit(kind, payload=None):
+            if kind == "context":
+                context.update(payload)
+            elif kind == "final":
+                final.update(payload)
+
+        try:
+            if want_answer:
+                # ผ่าน Single-Flight: ผู้ใช้ที่ถามคำถามเดียวกันระหว่าง Warm-up จะได้ Token ชุดเดียวกัน
+                for kind, payload in coalesce.FLIGHTS.subscribe(
+                    key, lambda e: pipeline.run_turn(q, history, kb, client, "warmup", e, intent=intent)
+                ):
+                    if kind == "error":
+                        raise payload
+                    emit(kind, payload)
+            else:
+                pipeline.run_turn(q, history, kb, client, "warmup", emit, intent=intent, generate=False)
+        except Exception as e:
+            print(f"[WARN] Warm-up failed for '{q}': {e}")
+            stats["failed"] += 1
+            continue
+
+        stats["questions"] += 1
+        if want_answer and context.get("has_context") and final.get("response") and not final.get("error") \
+                and final["response"] != pipeline.BUSY_MSG:
+            answer_cache.CACHE.put(key, {"response": final["response"], "log_source": final.get("log_source")})
+            stats["answers"] += 1
+
+    stats["seconds"] = round(time.time() - start, 1)
+    print(f"[INFO] Warm-up done: {stats}")
+    return stats
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from src import rag_engine
+
+
+@pytest.mark.parametrize("query", [
+    "ขอทุนจากรัฐบาลต้องทำยังไง",
+    "ทุนวิจัยด้านเกมการศึกษา",
+    "โครงการวิจัยเรื่องหนังสัตว์",
+    "ขอหนังสือรับรองการเป็นนักวิจัย",
+    "สูตรคำนวณค่าตอบแทน",
+    "ผ่านด่านอนุมัติขั้นแรกแล้ว",
+    "ทุนวิจัยด้านการเมืองการปกครอง",
+    "หลักสูตรอบรมการเบิกจ่าย",
+])
+def test_in_domain_not_blocked(query):
+    assert not rag_engine._is_blocked(query)
+
+
+@pytest.mark.parametrize("query", [
+    "หนังเรื่องไหนสนุก",
+    "สูตรทำคุกกี้",
+    "ใครจะชนะเลือกตั้ง",
+    "เลขเด็ดงวดนี้",
+    "หวยออกอะไร",
+    "เล่นเกม",
+    "ดูหนัง",
+    "หนัง เรื่องไหนสนุก",
+    "ใครจะชนะ เลือกตั้ง",
+    "ระบบการเมืองไทย",
+    "ทุนวิจัยหวยออกอะไร",
+])
+def test_off_domain_blocked(query):
+    assert rag_engine._is_blocked(query)
+
+
+def test_generic_words_still_domain_checked(monkeypatch):
+    calls = []
+
+    def fake_embed(text, *args, **kwargs):
+        calls.append(text)
+        return np.zeros(4, dtype="float32")
+
+    monkeypatch.setattr(rag_engine.embedding, "get_embedding_remote", fake_embed)
+    monkeypatch.setattr(rag_engine.config, "DOMAIN_CHECK", True)
+    centroids = np.eye(4, dtype="float32")
+    assert rag_engine.analyze_intent("ระบบนี้ดีไหม", None, centroids, None) == "BLOCK"
+    assert rag_engine.analyze_intent("ขั้นตอนเบิกเงินทดรองจ่าย", None, centroids, None) == "QUERY"
+    assert calls == ["ระบบนี้ดีไหม"]